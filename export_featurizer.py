@@ -0,0 +1,44 @@
+import os
+
+import click
+
+from winnow.feature_extraction.model import default_model_path
+from winnow.feature_extraction.model_tf import CNN_tf, frozen_model_path
+from winnow.utils import resolve_config
+
+
+@click.command()
+@click.option(
+    '--config', '-cp',
+    help='path to the project config file',
+    default=os.environ.get('WINNOW_CONFIG'))
+
+@click.option(
+    '--output', '-o',
+    help='path of the exported model - by default it is saved next to the '
+         'pretrained model checkpoint',
+    default=None)
+
+@click.option(
+    '--quantize', '-q',
+    help='Export TFLite model with int8-quantized weights instead of the '
+         'frozen graph',
+    default=False, is_flag=True)
+
+
+def main(config, output, quantize):
+    config = resolve_config(config_path=config)
+
+    model_path = default_model_path(config.proc.pretrained_model_local_path)
+    output = output or frozen_model_path(model_path, quantized=quantize)
+
+    print('Loading pretrained model from :{}'.format(model_path))
+
+    model = CNN_tf('vgg', model_path)
+    model.export(output, quantize=quantize)
+
+    print('Optimized inference model saved on :{}'.format(output))
+
+
+if __name__ == '__main__':
+    main()
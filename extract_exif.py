@@ -1,13 +1,19 @@
 from os.path import join
 
 import click
+from tqdm import tqdm
 
 from db import Database
 from db.utils import *
-from winnow.storage.db_result_storage import DBResultStorage
+from winnow.storage.db_result_storage import DBResultStorage, chunks
 from winnow.storage.repr_utils import path_resolver
-from winnow.utils import scan_videos, extract_from_list_of_videos, convert_to_df, parse_and_filter_metadata_df, \
-    resolve_config
+from winnow.utils import scan_videos, iter_metadata, convert_to_df, \
+    parse_and_filter_metadata_df, resolve_config, default_hash_cache
+from winnow.utils.metadata_extraction import CI, DEFAULT_MEDIAINFO_WORKERS, \
+    DEFAULT_MEDIAINFO_TIMEOUT
+
+# Number of files which metadata is saved at once
+EXIF_CHUNK_SIZE = 1000
 
 
 @click.command()
@@ -16,8 +22,24 @@ from winnow.utils import scan_videos, extract_from_list_of_videos, convert_to_df
     help='path to the project config file',
     default=None)
 
+@click.option(
+    '--workers', '-w',
+    help='Number of concurrently running mediainfo processes',
+    default=DEFAULT_MEDIAINFO_WORKERS, type=int)
+
+@click.option(
+    '--timeout', '-t',
+    help='Maximal time in seconds spent on a single file',
+    default=DEFAULT_MEDIAINFO_TIMEOUT, type=float)
+
+@click.option(
+    '--override', '-ovr',
+    help='Extract metadata of the files which already have exif saved on '
+         'the DB',
+    default=False, is_flag=True)
+
 
-def main(config):
+def main(config, workers, timeout, override):
 
     print('Loading config file')
     config = resolve_config(config_path=config)
@@ -26,42 +48,70 @@ def main(config):
     if config.database.use:
         database = Database(uri=config.database.uri)
         database.create_tables()
+        result_store = DBResultStorage(database)
 
         with database.session_scope() as session:
             video_records = session.query(Files).yield_per(10**4)
-            path_hash_pairs = [(join(config.sources.root, record.file_path), record.sha256) for record in video_records]
-            videos, hashes = zip(*path_hash_pairs)
+            path_hash_pairs = [
+                (join(config.sources.root, record.file_path), record.sha256)
+                for record in video_records]
+            videos, hashes = (), ()
+            if path_hash_pairs:
+                videos, hashes = zip(*path_hash_pairs)
     else:
 
         videos = scan_videos(config.sources.root, '**', extensions=config.sources.extensions)
-        hashes = [get_hash(video) for video in videos]
+        hashes = default_hash_cache(config).hash_many(
+            videos, threads=config.proc.hash_threads)
 
     assert len(videos) > 0, 'No videos found'
 
     print(f'{len(videos)} videos found')
 
-    metadata = extract_from_list_of_videos(videos)
-
-    df = convert_to_df(metadata)
-
-    df_parsed = parse_and_filter_metadata_df(df)
-
-    assert len(metadata) == len(df_parsed)
-
-    if config.save_files:
-
-        EXIF_REPORT_PATH = join(config.repr.directory, 'exif_metadata.csv')
-
-        df_parsed.to_csv(EXIF_REPORT_PATH)
-
+    file_hashes = dict(zip(videos, hashes))
+    if config.database.use and not override:
+        # Skip files which exif is already saved for the same content
+        existing = result_store.existing_exifs(
+            (storepath(video), sha256)
+            for video, sha256 in file_hashes.items())
+        file_hashes = {video: sha256 for video, sha256 in file_hashes.items()
+                       if (storepath(video), sha256) not in existing}
+        print(f'{len(videos) - len(file_hashes)} videos already have exif '
+              f'metadata')
+
+    EXIF_REPORT_PATH = join(config.repr.directory, 'exif_metadata.csv')
+    saved = 0
+
+    # Save metadata in chunks as soon as it is extracted
+    results = iter_metadata(file_hashes.keys(), workers=workers,
+                            timeout=timeout)
+    with tqdm(total=len(file_hashes), unit='video') as progress:
+        for chunk in chunks(results, size=EXIF_CHUNK_SIZE):
+            paths, metadata = zip(*chunk)
+
+            df_parsed = parse_and_filter_metadata_df(
+                convert_to_df(list(metadata)))
+
+            assert len(metadata) == len(df_parsed)
+
+            if config.save_files:
+                df_parsed.index += saved
+                df_parsed.reindex(columns=CI).to_csv(
+                    EXIF_REPORT_PATH, mode='a' if saved else 'w',
+                    header=not saved)
+
+            if config.database.use:
+                exif_entries = zip(map(storepath, paths),
+                                   map(file_hashes.get, paths),
+                                   df_parsed.to_dict('records'))
+                result_store.add_exifs(exif_entries)
+
+            saved += len(chunk)
+            progress.update(len(chunk))
+
+    if config.save_files and saved:
         print(f"Exif Metadata report exported to:{EXIF_REPORT_PATH}")
 
-    if config.database.use:
-        database = Database(uri=config.database.uri)
-        result_store = DBResultStorage(database)
-        exif_entries = zip(map(storepath, videos), hashes, df_parsed.to_dict('records'))
-        result_store.add_exifs(exif_entries)
-
 
 if __name__ == '__main__':
     main()
@@ -1,17 +1,20 @@
 import logging
 import os
 import sys
+from operator import attrgetter
 
 import click
 
 from db import Database
-from winnow.feature_extraction import IntermediateCnnExtractor, FrameToVideoRepresentation, SimilarityModel, \
-    load_featurizer
+from winnow.feature_extraction import IntermediateCnnExtractor, \
+    FrameToVideoRepresentation, SimilarityModel
 from winnow.feature_extraction.model import default_model_path
+from winnow.matching.frame_index import FrameIndex, update_frame_index
 from winnow.storage.db_result_storage import DBResultStorage
-from winnow.storage.repr_storage import ReprStorage
-from winnow.storage.repr_utils import bulk_read, bulk_write
-from winnow.utils import scan_videos, create_video_list, scan_videos_from_txt, resolve_config, reprkey_resolver
+from winnow.storage.repr_storage import ReprStorage, VECTOR_STORAGE_TYPES
+from winnow.storage.repr_utils import bulk_read_derived
+from winnow.utils import iter_files, create_video_list, \
+    scan_videos_from_txt, resolve_config, reprkey_resolver, default_hash_cache
 
 logging.getLogger().setLevel(logging.ERROR)
 logging.getLogger("winnow").setLevel(logging.INFO)
@@ -40,26 +43,63 @@ logging.getLogger().addHandler(logging.StreamHandler(sys.stdout))
     help='Whether to save the frames sampled from the videos - overrides save_frames on the config file',
     default=False, is_flag=True)
 
+@click.option(
+    '--inference-workers', '-iw',
+    help='Number of feature extraction processes, each with its own model '
+         '- overrides inference_workers on the config file',
+    type=int, default=None)
+
+@click.option(
+    '--batch-size', '-bs',
+    help='Number of frames fed to the network at once - overrides '
+         'inference_batch_size on the config file',
+    type=int, default=None)
+
+@click.option(
+    '--decode-workers', '-dw',
+    help='Number of video decoding processes per inference worker - '
+         'overrides decode_workers on the config file',
+    type=int, default=None)
 
-def main(config, list_of_files, frame_sampling, save_frames):
+
+def main(config, list_of_files, frame_sampling, save_frames,
+         inference_workers, batch_size, decode_workers):
     config = resolve_config(
                         config_path=config,
                         frame_sampling=frame_sampling,
                         save_frames=save_frames)
+    config.proc.inference_workers = (inference_workers or
+                                     config.proc.inference_workers)
+    config.proc.inference_batch_size = (batch_size or
+                                        config.proc.inference_batch_size)
+    config.proc.decode_workers = decode_workers or config.proc.decode_workers
        
-    reps = ReprStorage(os.path.join(config.repr.directory))
-    reprkey = reprkey_resolver(config)
+    vector_storage = VECTOR_STORAGE_TYPES[config.repr.vector_storage]
+    reps = ReprStorage(os.path.join(config.repr.directory),
+                       vector_storage_factory=vector_storage)
+    hash_cache = default_hash_cache(config)
+    reprkey = reprkey_resolver(config, hash_cache)
 
     print('Searching for Dataset Video Files')
 
+    stats = None
     if len(list_of_files) == 0:
-        videos = scan_videos(config.sources.root, '**', extensions=config.sources.extensions)
+        scanned = sorted(iter_files(config.sources.root,
+                                    config.sources.extensions, stat=True),
+                         key=attrgetter('path'))
+        videos = [file.path for file in scanned]
+        stats = [file.stat for file in scanned]
     else:
         videos = scan_videos_from_txt(list_of_files, extensions=config.sources.extensions)
 
     print('Number of files found: {}'.format(len(videos)))
 
-    remaining_videos_path = [path for path in videos if not reps.frame_level.exists(reprkey(path))]
+    # Only new or modified files are hashed
+    hash_cache.hash_many(videos, threads=config.proc.hash_threads, stats=stats)
+    processed = reps.frame_level.exists_many(
+        [reprkey(path) for path in videos])
+    remaining_videos_path = [path for path, exists in zip(videos, processed)
+                             if not exists]
 
     print('There are {} videos left'.format(len(remaining_videos_path)))
 
@@ -70,12 +110,23 @@ def main(config, list_of_files, frame_sampling, save_frames):
     if len(remaining_videos_path) > 0:
         # Instantiates the extractor
         model_path = default_model_path(config.proc.pretrained_model_local_path)
-        extractor = IntermediateCnnExtractor(video_src=VIDEOS_LIST, reprs=reps, reprkey=reprkey,
-                                             frame_sampling=config.proc.frame_sampling,
-                                             save_frames=config.proc.save_frames,
-                                             model=(load_featurizer(model_path)))
+        extractor = IntermediateCnnExtractor(
+            video_src=VIDEOS_LIST, reprs=reps, reprkey=reprkey,
+            frame_sampling=config.proc.frame_sampling,
+            save_frames=config.proc.save_frames,
+            model_path=model_path,
+            padding=config.proc.inference_padding)
         # Starts Extracting Frame Level Features
-        extractor.start(batch_size=16, cores=4)
+        extractor.start(batch_size=config.proc.inference_batch_size,
+                        cores=config.proc.decode_workers,
+                        inference_workers=config.proc.inference_workers)
+
+    # Keep the template matching index up to date with the extracted videos
+    FRAME_INDEX_DIRECTORY = os.path.join(config.repr.directory, 'frame_index')
+    if FrameIndex.exists(FRAME_INDEX_DIRECTORY):
+        print('Adding extracted videos to the frame index')
+        update_frame_index(FRAME_INDEX_DIRECTORY, reps.frame_level,
+                           method=config.templates.frame_index)
 
     print('Converting Frame by Frame representations to Video Representations')
 
@@ -87,13 +138,21 @@ def main(config, list_of_files, frame_sampling, save_frames):
 
     sm = SimilarityModel()
 
-    vid_level_iterator = bulk_read(reps.video_level)
+    if config.save_files:
+        print('Saving Video Signatures on :{}'.format(
+            reps.signature.directory))
 
-    assert len(vid_level_iterator) > 0, 'No Signatures left to be processed'
+    # Signatures saved by the previous runs are reused
+    signature_keys, signature_values = bulk_read_derived(
+        reps.video_level, reps.signature,
+        derive=lambda features: sm.predict_from_features(
+            features.reshape(len(features), -1)),
+        save=config.save_files)
 
-    signatures = sm.predict(vid_level_iterator)  # Get {ReprKey => signature} dict
+    assert len(signature_keys) > 0, 'No Signatures left to be processed'
 
-    print('Saving Video Signatures on :{}'.format(reps.signature.directory))
+    # Get {ReprKey => signature} dict
+    signatures = dict(zip(signature_keys, signature_values))
 
     if config.database.use:
         # Convert dict to list of (path, sha256, signature) tuples
@@ -107,9 +166,6 @@ def main(config, list_of_files, frame_sampling, save_frames):
         result_storage = DBResultStorage(database)
         result_storage.add_signatures(entries)
 
-    if config.save_files:
-        bulk_write(reps.signature, signatures)
-
 
 if __name__ == '__main__':
     main()
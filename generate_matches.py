@@ -4,187 +4,444 @@ import sys
 import time
 import click
 from dataclasses import asdict
-from sklearn.neighbors import NearestNeighbors
 from tqdm import tqdm
 import pandas as pd
 import numpy as np
 from db import Database
 from db.utils import *
 from winnow.feature_extraction import SimilarityModel
-from winnow.storage.db_result_storage import DBResultStorage
-from winnow.storage.repr_storage import ReprStorage
-from winnow.storage.repr_utils import bulk_read
-from winnow.utils import extract_additional_info, extract_scenes, filter_results, uniq, resolve_config,get_brightness_estimation
+from winnow.matching import SignatureIndex, ShardedMatching, collect, \
+    unique_pairs, encode_pairs, discarded_mask, read_match_report, \
+    merge_match_reports
+from winnow.storage.db_result_storage import DBResultStorage, chunks
+from winnow.storage.repr_storage import ReprStorage, VECTOR_STORAGE_TYPES
+from winnow.storage.repr_utils import bulk_read_iter, bulk_read_derived, \
+    BulkReadReport
+from winnow.storage.watermark import Watermark
+from winnow.utils import iter_scenes, collect_scenes, resolve_config, \
+    get_brightness_estimations, drop_saved_scenes
 
 logging.getLogger().setLevel(logging.ERROR)
 logging.getLogger("winnow").setLevel(logging.INFO)
 logging.getLogger().addHandler(logging.StreamHandler(sys.stdout))
 
+# Number of videos which scenes are saved at once
+SCENE_CHUNK_SIZE = 1000
+
 @click.command()
 @click.option(
     '--config', '-cp',
     help='path to the project config file',
     default=None)
 
-def main(config):
+@click.option(
+    '--rebuild-index', '-ri',
+    help='Rebuild the signature index even if the saved one is up to date',
+    default=False, is_flag=True)
+
+@click.option(
+    '--incremental', '-inc',
+    help='Match only signatures that were not matched by the previous runs',
+    default=False, is_flag=True)
+
+@click.option(
+    '--shards', '-sh',
+    help='Split matching into the given number of shards processed by '
+         'separate worker processes',
+    default=1, type=int)
+
+@click.option(
+    '--processes', '-p',
+    help='Number of local worker processes used for sharded matching '
+         '[default: number of CPUs]',
+    default=None, type=int)
+
+@click.option(
+    '--shard-worker', '-sw',
+    help='Join the running sharded matching job as a worker (e.g. from '
+         'another machine) and exit',
+    default=False, is_flag=True)
+
+@click.option(
+    '--redetect-scenes', '-rs',
+    help='Detect scenes of all videos including the ones processed by the '
+         'previous runs',
+    default=False, is_flag=True)
+
+def main(config, rebuild_index, incremental, shards, processes, shard_worker,
+         redetect_scenes):
 
     print('Loading config file')
     config = resolve_config(config_path=config)
-    reps = ReprStorage(config.repr.directory)
+    SHARDS_DIRECTORY = os.path.join(config.repr.directory, 'match_shards')
+
+    if shard_worker:
+        assert ShardedMatching.exists(SHARDS_DIRECTORY), \
+            'No sharded matching job found'
+        processed = ShardedMatching.load(SHARDS_DIRECTORY).work()
+        print('Processed {} shards'.format(processed))
+        return
+
+    vector_storage = VECTOR_STORAGE_TYPES[config.repr.vector_storage]
+    reps = ReprStorage(config.repr.directory,
+                       vector_storage_factory=vector_storage)
 
-    # Get mapping (path,hash) => sig.
+    # Get mapping (path,hash) => sig. Signatures saved by extract_features.py
+    # are reused.
     print('Extracting Video Signatures')
     sm = SimilarityModel()
-    vid_level_iterator = bulk_read(reps.video_level)
+    signature_keys, signatures = bulk_read_derived(
+        reps.video_level, reps.signature,
+        derive=lambda features: sm.predict_from_features(
+            features.reshape(len(features), -1)),
+        save=config.save_files)
 
-    assert len(vid_level_iterator) > 0, 'No video_level features were found'
+    assert len(signature_keys) > 0, 'No video_level features were found'
 
-    signatures_dict = sm.predict(bulk_read(reps.video_level))
+    signatures_dict = dict(zip(
+        signature_keys, signatures.reshape(len(signature_keys), -1)))
 
-    # Unpack paths, hashes and signatures as separate np.arrays
-    repr_keys, video_signatures = zip(*signatures_dict.items())
-    paths = np.array([key.path for key in repr_keys])
-    hashes = np.array([key.hash for key in repr_keys])
-    video_signatures = np.array(video_signatures)
-    
-    
-    print('Finding Matches...')
-    # Handles small tests for which number of videos <  number of neighbors
-    t0 = time.time()
-    neighbors = min(20,video_signatures.shape[0])
-    nn = NearestNeighbors(n_neighbors=neighbors,metric='euclidean',algorithm='kd_tree')
-    nn.fit(video_signatures)
-    distances,indices =  nn.kneighbors(video_signatures)
-    print('{} seconds spent finding matches '.format(time.time()-t0))
-    results,results_distances = filter_results(config.proc.match_distance, distances, indices)
+    INDEX_DIRECTORY = os.path.join(config.repr.directory, 'signature_index')
+    WATERMARK_DIRECTORY = os.path.join(config.repr.directory,
+                                       'match_watermark')
 
-    ss = sorted(zip(results,results_distances),key=lambda x:len(x[0]),reverse=True)
-    results_sorted = [x[0] for x in ss]
-    results_sorted_distance = [x[1] for x in ss]
+    index = load_index(config, INDEX_DIRECTORY, signatures_dict,
+                       rebuild=rebuild_index)
+    repr_keys = index.keys
 
+    # Index rows of the signatures that are still present in the storage
+    live = np.array([key in signatures_dict for key in repr_keys])
 
-    q = []
-    m = []
-    distance = []
+    # Select signatures that must be matched against the index
+    watermark = Watermark(WATERMARK_DIRECTORY)
+    query_keys, query_rows = select_queries(index, signatures_dict, live,
+                                            watermark, incremental)
+    if incremental and len(query_rows) == 0:
+        print('No new signatures to match')
+        return
 
-    print('Generating Report')
-    for i,r in enumerate(results_sorted):
-        for j,matches in enumerate(r):
-            if j == 0:
-                qq = matches
-            q.append(qq)
-            m.append(matches)
-            distance.append(results_sorted_distance[i][j])
-
-    match_df = pd.DataFrame({"query":q,"match":m,"distance":distance})
-    match_df['query_video'] = paths[match_df['query']]
-    match_df['query_sha256'] = hashes[match_df['query']]
-    match_df['match_video'] = paths[match_df['match']]
-    match_df['match_sha256'] = hashes[match_df['match']]
-    match_df['self_match'] = match_df['query_video'] == match_df['match_video']
-    # Remove self matches
-    match_df = match_df.loc[~match_df['self_match'], :]
-    # Creates unique index from query, match 
-    match_df['unique_index'] = match_df.apply(uniq, axis=1)
-    # Removes duplicated entries (eg if A matches B, we don't need B matches A)
-    match_df = match_df.drop_duplicates(subset=['unique_index'])
+    print('Finding Matches...')
+    t0 = time.time()
+    q, m, distance = find_matches(config, index, query_rows, shards,
+                                  processes, SHARDS_DIRECTORY)
+    print('{} seconds spent finding matches '.format(time.time()-t0))
 
-    REPORT_PATH = os.path.join(config.repr.directory, f'matches_at_{config.proc.match_distance}_distance.csv')
+    print('Generating Report')
+    match_df = match_report(index, live, q, m, distance)
+
+    REPORT_PATH = os.path.join(
+        config.repr.directory,
+        f'matches_at_{config.proc.match_distance}_distance.csv')
+    FILTERED_REPORT_PATH = os.path.join(
+        config.repr.directory,
+        f'matches_at_{config.proc.match_distance}_distance_filtered.csv')
+    METADATA_REPORT_PATH = os.path.join(config.repr.directory,
+                                        'metadata_signatures.csv')
+
+    # Index rows of the up-to-date videos
+    index_rows = {(key.path, key.hash): row
+                  for row, key in enumerate(repr_keys) if live[row]}
+
+    # Matches found by this run (the reports contain the previous ones as well)
+    new_matches = np.ones(len(match_df), dtype=bool)
+    if incremental and os.path.exists(REPORT_PATH):
+        print('Merging new matches into {}'.format(REPORT_PATH))
+        match_df = merge_match_reports(read_match_report(REPORT_PATH),
+                                       match_df, index_rows)
+        new_count = new_matches.sum()
+        new_matches = np.arange(len(match_df)) >= len(match_df) - new_count
 
     print('Saving unfiltered report to {}'.format(REPORT_PATH))
 
     match_df.to_csv(REPORT_PATH)
 
     if config.proc.detect_scenes:
+        detect_scenes(config, reps, redetect=redetect_scenes)
 
-        frame_features_dict = bulk_read(reps.frame_level, select=None)
-        assert len(frame_features_dict) > 0, 'No Frame Level features were found.'
-        scenes = extract_scenes(frame_features_dict)
-        scene_metadata = pd.DataFrame(asdict(scenes))
+    metadata_df = None
+    if config.proc.filter_dark_videos:
 
-        if config.database.use:
-            # Connect to database
-            database = Database(uri=config.database.uri)
-            database.create_tables()
+        print('Filtering dark and/or short videos')
+        metadata_df = dark_videos_metadata(config, reps)
 
-            # Save scenes
-            result_storage = DBResultStorage(database)
-            result_storage.add_scenes(zip(scenes.video_filename, scenes.video_sha256, scenes.scene_duration_seconds))
+        # Discard matches having a flagged video on any side
+        flagged = metadata_df.loc[metadata_df['flagged'], ['fn', 'sha256']]
+        discarded_rows = [index_rows[(path, sha256)]
+                          for path, sha256 in flagged.to_numpy()
+                          if (path, sha256) in index_rows]
+        discard_msk = discarded_mask(match_df['query'].to_numpy(),
+                                     match_df['match'].to_numpy(),
+                                     discarded_rows, size=len(repr_keys))
 
-        if config.save_files:
+        match_df = match_df.loc[~discard_msk, :]
+        new_matches = new_matches[~discard_msk]
 
-            SCENE_METADATA_OUTPUT_PATH = os.path.join(config.repr.directory, 'scene_metadata.csv')
-            scene_metadata.to_csv(SCENE_METADATA_OUTPUT_PATH)
-            print('Scene Metadata saved in:'.format(SCENE_METADATA_OUTPUT_PATH))
+    if config.database.use:
+        save_to_database(config, match_df.loc[new_matches], metadata_df)
 
+    if config.save_files:
 
-    if config.proc.filter_dark_videos:
+        if metadata_df is not None:
+            print('Saving metadata to {}'.format(METADATA_REPORT_PATH))
+            metadata_df.to_csv(METADATA_REPORT_PATH)
+        print('Saving Filtered Matches report to {}'.format(
+            FILTERED_REPORT_PATH))
+        match_df.to_csv(FILTERED_REPORT_PATH)
 
-        print('Filtering dark and/or short videos')
+    # Remember matched signatures for the subsequent incremental runs
+    watermark.update(query_keys)
+
+
+def load_index(config, index_directory, signatures_dict, rebuild=False):
+    """Load the saved signature index extending it with new signatures.
+
+    The index is built from scratch if it doesn't exist, if rebuild is
+    requested or if more than a half of the indexed signatures are outdated.
+    """
+    index = None
+    if not rebuild and SignatureIndex.exists(index_directory):
+        index = SignatureIndex.load(index_directory)
+        stale = len(set(index.keys) - set(signatures_dict.keys()))
+        if stale > len(index) // 2:
+            print('Signature index contains {} outdated entries and will be '
+                  'rebuilt'.format(stale))
+            index = None
+        else:
+            indexed = set(index.keys)
+            missing = [key for key in signatures_dict.keys()
+                       if key not in indexed]
+            print('Adding {} new signatures to the index'.format(len(missing)))
+            index.add(missing,
+                      np.array([signatures_dict[key] for key in missing]))
+
+    if index is None:
+        print('Building signature index in {}'.format(index_directory))
+        t0 = time.time()
+        repr_keys, video_signatures = zip(*signatures_dict.items())
+        index_params = {}
+        if config.proc.match_index == 'ivf':
+            index_params['n_probe'] = config.proc.match_index_probes
+        index = SignatureIndex.create(
+            index_directory, repr_keys, np.array(video_signatures),
+            method=config.proc.match_index, **index_params)
+        print('{} seconds spent building the index'.format(time.time()-t0))
+        recall = index.estimate_recall(config.proc.match_distance)
+        print('Estimated index recall at {} distance: {:.3f}'.format(
+            config.proc.match_distance, recall))
+    return index
+
+
+def select_queries(index, signatures_dict, live, watermark, incremental):
+    """Select signatures that must be matched against the index.
+
+    Returns:
+        Tuple (query_keys, query_rows) of the selected signatures.
+    """
+    if not incremental:
+        return set(signatures_dict.keys()), np.nonzero(live)[0]
+    query_keys = set(watermark.new_keys(signatures_dict.keys()))
+    query_rows = np.array([row for row, key in enumerate(index.keys)
+                           if key in query_keys], dtype=np.int64)
+    print('Matching {} new signatures against {} indexed'.format(
+        len(query_rows), live.sum()))
+    return query_keys, query_rows
+
+
+def find_matches(config, index, query_rows, shards, processes,
+                 shards_directory):
+    """Find index rows within the match distance from the query rows.
+
+    Returns:
+        Tuple (query_rows, match_rows, distances) of equal-length arrays.
+    """
+    if shards > 1:
+        job = ShardedMatching.create(shards_directory, index.directory,
+                                     query_rows, shards,
+                                     radius=config.proc.match_distance,
+                                     block_size=config.proc.match_block_size)
+        job.run(processes)
+        job.wait()
+        return job.merge()
+    queries = index.vectors
+    if len(query_rows) < len(index):
+        queries = queries[query_rows]
+    query_indices, match_rows, distance = collect(index.range_search(
+        queries, radius=config.proc.match_distance,
+        block_size=config.proc.match_block_size))
+    return query_rows[query_indices], match_rows, distance
+
+
+def match_report(index, live, q, m, distance):
+    """Make match report of the found pairs of index rows."""
+    # Outdated index entries are never reported
+    found = live[m]
+    q, m, distance = q[found], m[found], distance[found]
+
+    # Order matches by query placing queries with the most matches first
+    _, query_inverse, query_counts = np.unique(
+        q, return_inverse=True, return_counts=True)
+    order = np.lexsort((distance, q, -query_counts[query_inverse]))
+    q, m, distance = q[order], m[order], distance[order]
 
-        # Get original files for which we have both frames and frame-level features
-        repr_keys = list(set(reps.video_level.list()))
-        paths = [key.path for key in repr_keys]
-        hashes = [key.hash for key in repr_keys]
+    # Remove self matches
+    not_self = q != m
+    q, m, distance = q[not_self], m[not_self], distance[not_self]
+    # Removes duplicated entries (eg if A matches B, we don't need B matches A)
+    unique = unique_pairs(q, m)
+    q, m, distance = q[unique], m[unique], distance[unique]
+
+    # Unpack paths and hashes as separate np.arrays
+    paths = np.array([key.path for key in index.keys])
+    hashes = np.array([key.hash for key in index.keys])
+    return pd.DataFrame({"query": q,
+                         "match": m,
+                         "distance": distance,
+                         "query_video": paths[q],
+                         "query_sha256": hashes[q],
+                         "match_video": paths[m],
+                         "match_sha256": hashes[m],
+                         "self_match": False,
+                         "unique_index": encode_pairs(q, m)})
+
+
+def dark_videos_metadata(config, reps):
+    """Estimate brightness of the videos and flag the dark ones."""
+    # Get original files for which we have both frames and frame-level
+    # features
+    metadata_keys = list(set(reps.video_level.list()))
+
+    # Reuse brightness estimations saved by the previous runs
+    gray_max = {}
+    if config.database.use:
+        database = Database(uri=config.database.uri)
+        database.create_tables()
+        gray_max = DBResultStorage(database).existing_gray_max(
+            (key.path, key.hash) for key in metadata_keys)
+    missing_keys = [key for key in metadata_keys
+                    if (key.path, key.hash) not in gray_max]
 
-        print('Extracting additional information from video files')
-        brightness_estimation = np.array([get_brightness_estimation(reps, key) for key in tqdm(repr_keys)])
-        print(brightness_estimation.shape)
-        metadata_df = pd.DataFrame({"fn": paths,
-                                    "sha256": hashes,
-                                    "gray_max":brightness_estimation.reshape(brightness_estimation.shape[0])})
+    print('Estimating brightness of {} new videos'.format(len(missing_keys)))
+    if len(missing_keys) > 0:
+        estimated_keys, brightness_estimation = \
+            get_brightness_estimations(reps, missing_keys)
+        gray_max.update(((key.path, key.hash), value) for key, value
+                        in zip(estimated_keys, brightness_estimation))
 
-        # Flag videos to be discarded
+    metadata_keys = [key for key in metadata_keys
+                     if (key.path, key.hash) in gray_max]
+    metadata_df = pd.DataFrame({"fn": [key.path for key in metadata_keys],
+                                "sha256": [key.hash for key in metadata_keys],
+                                "gray_max": [gray_max[(key.path, key.hash)]
+                                             for key in metadata_keys]})
 
-        metadata_df['video_dark_flag'] = metadata_df.gray_max < config.proc.filter_dark_videos_thr
+    # Flag videos to be discarded
 
-        print('Videos discarded because of darkness:{}'.format(metadata_df['video_dark_flag'].sum()))
+    metadata_df['video_dark_flag'] = \
+        metadata_df.gray_max < config.proc.filter_dark_videos_thr
 
-        metadata_df['flagged'] = metadata_df['video_dark_flag'] 
+    print('Videos discarded because of darkness:{}'.format(
+        metadata_df['video_dark_flag'].sum()))
 
-        # Discard videos
-        discarded_videos = metadata_df.loc[metadata_df['flagged'], :][['fn', 'sha256']]
-        discarded_videos = set(tuple(row) for row in discarded_videos.to_numpy())
+    metadata_df['flagged'] = metadata_df['video_dark_flag']
+    return metadata_df
 
-        # Function to check if the (path,hash) row is in the discarded set
-        def is_discarded(row):
-            return tuple(row) in discarded_videos
 
-        msk_1 = match_df[['query_video', 'query_sha256']].apply(is_discarded, axis=1)
-        msk_2 = match_df[['match_video', 'match_sha256']].apply(is_discarded, axis=1)
-        discard_msk = msk_1 | msk_2
+def save_to_database(config, new_match_df, metadata_df):
+    """Save metadata and the matches found by this run to the database."""
+    # Connect to database and ensure schema
+    database = Database(uri=config.database.uri)
+    database.create_tables()
 
-        FILTERED_REPORT_PATH = os.path.join(config.repr.directory,
-                                            f'matches_at_{config.proc.match_distance}_distance_filtered.csv')
-        METADATA_REPORT_PATH = os.path.join(config.repr.directory, 'metadata_signatures.csv')
+    # Save metadata
+    result_storage = DBResultStorage(database)
 
-        match_df = match_df.loc[~discard_msk, :]        
+    if metadata_df is not None:
 
-    if config.database.use:
-        # Connect to database and ensure schema
-        database = Database(uri=config.database.uri)
-        database.create_tables()
+        metadata_entries = metadata_df[['fn', 'sha256']]
+        metadata_entries['metadata'] = metadata_df.drop(
+            columns=['fn', 'sha256']).to_dict('records')
+        result_storage.add_metadata(metadata_entries.to_numpy())
 
-        # Save metadata
-        result_storage = DBResultStorage(database)
-        
-        if metadata_df is not None:
+    # Save matches (the ones found by the previous runs are already saved)
+    match_columns = ['query_video', 'query_sha256', 'match_video',
+                     'match_sha256', 'distance']
 
-            metadata_entries = metadata_df[['fn', 'sha256']]
-            metadata_entries['metadata'] = metadata_df.drop(columns=['fn', 'sha256']).to_dict('records')
-            result_storage.add_metadata(metadata_entries.to_numpy())
+    result_storage.add_matches(new_match_df[match_columns].to_numpy())
 
-        # Save matches
-        match_columns = ['query_video', 'query_sha256', 'match_video', 'match_sha256', 'distance']
 
-        result_storage.add_matches(match_df[match_columns].to_numpy())
+def detect_scenes(config, reps, redetect=False):
+    """Detect scenes of the videos not processed by the previous runs.
 
-    if config.save_files:
+    Frame-level features are read and processed one video at a time and the
+    detected scenes are saved in chunks, so memory usage doesn't depend on
+    the number of videos.
+    """
+    SCENE_WATERMARK_DIRECTORY = os.path.join(config.repr.directory,
+                                             'scene_watermark')
+    SCENE_METADATA_OUTPUT_PATH = os.path.join(config.repr.directory,
+                                              'scene_metadata.csv')
 
-        print('Saving metadata to {}'.format(METADATA_REPORT_PATH))
-        metadata_df.to_csv(METADATA_REPORT_PATH)
-        print('Saving Filtered Matches report to {}'.format(METADATA_REPORT_PATH))
-        match_df.to_csv(FILTERED_REPORT_PATH)
+    watermark = Watermark(SCENE_WATERMARK_DIRECTORY)
+    if redetect:
+        watermark.reset()
+
+    frame_level_keys = list(reps.frame_level.list())
+    assert len(frame_level_keys) > 0, 'No Frame Level features were found.'
+    new_keys = watermark.new_keys(frame_level_keys)
+    print('Detecting scenes of {} new videos'.format(len(new_keys)))
+    if len(new_keys) == 0:
+        return
+
+    result_storage = None
+    if config.database.use:
+        # Connect to database
+        database = Database(uri=config.database.uri)
+        database.create_tables()
+        result_storage = DBResultStorage(database)
+
+    # Append to the report of the previous runs replacing scenes of the
+    # modified videos
+    saved, saved_rows = 0, 0
+    append = len(watermark) > 0 and os.path.exists(SCENE_METADATA_OUTPUT_PATH)
+    if append and config.save_files:
+        saved_rows = drop_saved_scenes(SCENE_METADATA_OUTPUT_PATH,
+                                       (key.path for key in new_keys))
+    read_report = BulkReadReport()
+    frame_features = bulk_read_iter(reps.frame_level, new_keys,
+                                    report=read_report,
+                                    progress=tqdm(total=len(new_keys)))
+    detected = iter_scenes(frame_features)
+    for chunk in chunks(detected, size=SCENE_CHUNK_SIZE):
+        scenes = collect_scenes(chunk)
+
+        if result_storage is not None:
+            # Save scenes
+            result_storage.add_scenes(zip(scenes.video_filename,
+                                          scenes.video_sha256,
+                                          scenes.scene_duration_seconds),
+                                      override=redetect)
+
+        if config.save_files:
+            scene_metadata = pd.DataFrame(asdict(scenes))
+            scene_metadata.index += saved_rows
+            scene_metadata.to_csv(SCENE_METADATA_OUTPUT_PATH,
+                                  mode='a' if append else 'w',
+                                  header=not append)
+            saved_rows += len(scene_metadata)
+            append = True
+
+        saved += len(chunk)
+        watermark.update(key for key, _, _ in chunk)
+
+    # Short videos have no scenes but must not be read again
+    watermark.update(key for key in new_keys if key not in read_report.errors)
+
+    read_report.log()
+    print('Loaded frame level features of {} videos, {} failed'.format(
+        read_report.loaded, read_report.failed))
+    print('Saved scenes of {} videos'.format(saved))
+    if config.save_files and saved > 0:
+        print('Scene Metadata saved in: {}'.format(SCENE_METADATA_OUTPUT_PATH))
 
 
 if __name__ == '__main__':
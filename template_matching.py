@@ -6,7 +6,7 @@ from winnow.config.path import resolve_config_path
 from winnow.feature_extraction import default_model_path
 from winnow.feature_extraction.extraction_routine import load_featurizer
 from winnow.search_engine.template_matching import SearchEngine
-from winnow.storage.repr_storage import ReprStorage
+from winnow.storage.repr_storage import ReprStorage, VECTOR_STORAGE_TYPES
 from winnow.storage.db_result_storage import DBResultStorage
 
 config = Config.read(resolve_config_path())
@@ -28,8 +28,13 @@ DISTANCE = 0.07
     '--template-dir', '-td',
     help='path to a directory containing templates - overrides source folder from the config file',
     default="")
-    
-def main(override,template_dir):
+
+@click.option(
+    '--rebuild-index', '-ri',
+    help='Rebuild the frame index even if the saved one is up to date',
+    default=False, is_flag=True)
+
+def main(override,template_dir,rebuild_index):
 
       print('Loading model...')
       model_path = default_model_path(config.proc.pretrained_model_local_path)
@@ -50,14 +55,22 @@ def main(override,template_dir):
 
 
 
-      reprs = ReprStorage(config.repr.directory)
+      vector_storage = VECTOR_STORAGE_TYPES[config.repr.vector_storage]
+      reprs = ReprStorage(config.repr.directory,
+                          vector_storage_factory=vector_storage)
       se = SearchEngine(templates_root=templates_source,
-                        reprs=reprs, model=model)
+                        reprs=reprs, model=model,
+                        index_method=config.templates.frame_index,
+                        rebuild_index=rebuild_index)
 
       template_matches = se.create_annotation_report(threshold=DISTANCE,
                                                 fp = TEMPLATE_TEST_OUTPUT,
                                                 frame_sampling = config.proc.frame_sampling)
 
+      if len(template_matches) == 0:
+            print(f'No matches were found at the current distance '
+                  f'configuration ({DISTANCE})')
+
       tm_entries = template_matches[['fn', 'sha256']]
       tm_entries['template_matches'] = template_matches.drop(columns=['fn', 'sha256']).to_dict('records')
 
@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+
+# winnow.feature_extraction package requires OpenCV and TensorFlow
+pytest.importorskip("cv2")
+pytest.importorskip("tensorflow")
+
+from winnow.feature_extraction.batching import (  # noqa: E402
+    BatchPacker, PackedError, PackedFeatures)
+
+
+class FakeExtractor:
+    """Extractor doubling frame values and failing on negative values."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, frames):
+        self.batches.append(len(frames))
+        if np.any(frames < 0):
+            raise ValueError("broken frame")
+        return frames * 2
+
+
+def make_frames(count, start=0):
+    """Make distinguishable frames."""
+    return np.arange(start, start + count, dtype=np.float32).reshape(count, 1)
+
+
+def broken_frames(count):
+    """Make frames failing the extractor."""
+    return -np.ones((count, 1), dtype=np.float32)
+
+
+def owners(outputs):
+    """Get owners of the packed outputs leaving markers as is."""
+    return [getattr(output, "owner", output) for output in outputs]
+
+
+def test_video_spanning_batches():
+    extract = FakeExtractor()
+    packer = BatchPacker(extract, batch_size=4)
+    first, second = make_frames(6), make_frames(3, start=100)
+
+    assert packer.add("first", first) == []
+    assert packer.pending_frames == 2
+    outputs = packer.add("second", second)
+    assert [output.owner for output in outputs] == ["first"]
+    assert np.array_equal(outputs[0].features, first * 2)
+    assert outputs[0].frames is first
+
+    outputs = packer.flush()
+    assert [output.owner for output in outputs] == ["second"]
+    assert np.array_equal(outputs[0].features, second * 2)
+    assert extract.batches == [4, 4, 1]
+    assert packer.pending_frames == 0
+
+
+def test_failed_batch_attributed_to_owners():
+    extract = FakeExtractor()
+    packer = BatchPacker(extract, batch_size=4)
+
+    assert packer.add("first", broken_frames(2)) == []
+    outputs = packer.add("second", broken_frames(2))
+
+    assert all(isinstance(output, PackedError) for output in outputs)
+    assert {output.owner for output in outputs} == {"first", "second"}
+    assert all(isinstance(output.error, ValueError) for output in outputs)
+    assert packer.pending_frames == 0
+    assert packer.flush() == []
+
+
+def test_failed_batch_isolates_broken_owner():
+    extract = FakeExtractor()
+    packer = BatchPacker(extract, batch_size=4)
+    good = make_frames(2)
+
+    packer.add("good", good)
+    outputs = packer.add("broken", broken_frames(2))
+
+    errors = [out for out in outputs if isinstance(out, PackedError)]
+    features = [out for out in outputs if isinstance(out, PackedFeatures)]
+    assert [error.owner for error in errors] == ["broken"]
+    assert [output.owner for output in features] == ["good"]
+    assert np.array_equal(features[0].features, good * 2)
+
+
+def test_discard_partly_packed():
+    extract = FakeExtractor()
+    packer = BatchPacker(extract, batch_size=4)
+    other = make_frames(4, start=100)
+
+    assert packer.add("discarded", make_frames(6)) == []
+    packer.discard(["discarded"])
+    assert packer.pending_frames == 0
+
+    outputs = packer.add("other", other)
+    outputs += packer.mark("end") + packer.flush()
+    assert owners(outputs) == ["other", "end"]
+    assert np.array_equal(outputs[0].features, other * 2)
+    assert extract.batches == [4, 4]
+
+
+def test_markers_order():
+    packer = BatchPacker(FakeExtractor(), batch_size=4)
+
+    assert packer.mark("start") == ["start"]
+    assert packer.add("first", make_frames(2)) == []
+    assert packer.mark("end-first") == []
+    outputs = packer.add("second", make_frames(2))
+    assert owners(outputs) == ["first", "end-first", "second"]
+    assert packer.mark("end-second") == ["end-second"]
+
+    assert packer.add("third", make_frames(1)) == []
+    assert packer.mark("end-third") == []
+    outputs = packer.flush()
+    assert owners(outputs) == ["third", "end-third"]
+
+
+def test_failed_empty_chunk():
+    def extract(frames):
+        if len(frames) == 0:
+            raise ValueError("empty batch")
+        return frames * 2
+
+    packer = BatchPacker(extract, batch_size=4)
+    other = make_frames(4, start=100)
+
+    outputs = packer.add("empty", make_frames(0))
+    assert owners(outputs) == ["empty"]
+    assert isinstance(outputs[0], PackedError)
+    assert isinstance(outputs[0].error, ValueError)
+
+    outputs = packer.add("other", other)
+    assert owners(outputs) == ["other"]
+    assert np.array_equal(outputs[0].features, other * 2)
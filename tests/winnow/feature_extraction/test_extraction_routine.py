@@ -0,0 +1,103 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+# winnow.feature_extraction package requires OpenCV and TensorFlow
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("tensorflow")
+
+from winnow.feature_extraction.extraction_routine import (  # noqa: E402
+    feature_extraction_videos, core_subsets)
+from winnow.feature_extraction.loading_utils import global_vector  # noqa: E402
+from winnow.storage.lmdb_repr_storage import LMDBReprStorage  # noqa: E402
+from winnow.storage.matrix_repr_storage import MatrixReprStorage  # noqa: E402
+from winnow.storage.repr_key import ReprKey  # noqa: E402
+from winnow.storage.repr_storage import ReprStorage  # noqa: E402
+
+
+class FakeModel:
+    """Model producing features from the mean frame color."""
+    desired_size = 224
+
+    def extract(self, frames, batch_sz):
+        return np.asarray(frames, dtype=np.float32).mean(axis=(1, 2))
+
+
+def fake_model(intra_op_threads=None, inter_op_threads=None):
+    """Create fake model in the worker process (must be picklable)."""
+    return FakeModel()
+
+
+@pytest.fixture
+def directory():
+    """Create a temporary directory."""
+    with tempfile.TemporaryDirectory(prefix="extraction-") as directory:
+        yield directory
+
+
+def make_video(path, color, frames=6, fps=2, size=32):
+    """Write a small video of a single solid color."""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps,
+                             (size, size))
+    try:
+        for _ in range(frames):
+            writer.write(np.full((size, size, 3), color, dtype=np.uint8))
+    finally:
+        writer.release()
+
+
+@pytest.fixture
+def videos(directory):
+    """Create synthetic test videos."""
+    paths = []
+    for i in range(6):
+        path = os.path.join(directory, f"video-{i}.mp4")
+        make_video(path, color=40 * i)
+        paths.append(path)
+    return paths
+
+
+def test_core_subsets():
+    assert core_subsets(2, cores=range(5)) == [[0, 1], [2, 3, 4]]
+    assert core_subsets(3, cores=[4, 5]) == [[4], [5], [4]]
+
+
+@pytest.mark.parametrize("vector_storage",
+                         [LMDBReprStorage, MatrixReprStorage])
+def test_inference_workers(directory, videos, vector_storage):
+    video_list = os.path.join(directory, "videos.txt")
+    with open(video_list, "w") as file:
+        file.write("\n".join(videos))
+
+    # Storage is opened by the parent process before the workers start
+    reprs = ReprStorage(os.path.join(directory, "repr"),
+                        vector_storage_factory=vector_storage)
+    keys = {path: ReprKey(path=os.path.basename(path), hash="hash", tag="tag")
+            for path in videos}
+    feature_extraction_videos(None, video_list, reprs, keys.get, cores=2,
+                              batch_sz=4, inference_workers=2,
+                              model_factory=fake_model)
+
+    assert set(reprs.frame_level.list()) == set(keys.values())
+    for key in keys.values():
+        features = reprs.frame_level.read(key)
+        assert features.shape[1] == 3
+        assert np.allclose(reprs.video_level.read(key),
+                           global_vector(features))
+
+
+def test_inference_workers_skip_unresolved_keys(directory, videos):
+    video_list = os.path.join(directory, "videos.txt")
+    with open(video_list, "w") as file:
+        file.write("\n".join(videos))
+
+    reprs = ReprStorage(os.path.join(directory, "repr"))
+    keys = {path: ReprKey(path=os.path.basename(path), hash="hash", tag="tag")
+            for path in videos[1:]}
+    feature_extraction_videos(None, video_list, reprs, keys.__getitem__,
+                              cores=2, batch_sz=4, inference_workers=2,
+                              model_factory=fake_model)
+
+    assert set(reprs.frame_level.list()) == set(keys.values())
@@ -0,0 +1,37 @@
+import tempfile
+
+import numpy as np
+import pytest
+
+# winnow.feature_extraction package requires OpenCV and TensorFlow
+pytest.importorskip("cv2")
+pytest.importorskip("tensorflow")
+
+from winnow.feature_extraction.loading_utils import (  # noqa: E402
+    frame_to_global, global_vector)
+from winnow.storage.matrix_repr_storage import MatrixReprStorage  # noqa: E402
+from winnow.storage.repr_key import ReprKey  # noqa: E402
+from winnow.storage.repr_storage import ReprStorage  # noqa: E402
+
+
+@pytest.fixture
+def reprs():
+    """Create an empty representation storage in a temporary directory."""
+    with tempfile.TemporaryDirectory(prefix="loading-utils-") as directory:
+        yield ReprStorage(directory, vector_storage_factory=MatrixReprStorage)
+
+
+def test_frame_to_global_malformed_entry(reprs):
+    videos = {ReprKey(path=f"video-{i}", hash="hash", tag="tag"):
+              np.random.rand(5, 8) for i in range(5)}
+    malformed = ReprKey(path="malformed", hash="hash", tag="tag")
+    for key, features in videos.items():
+        reprs.frame_level.write(key, features)
+    reprs.frame_level.write(malformed, np.array([]))
+
+    frame_to_global(reprs)
+
+    assert set(reprs.video_level.list()) == set(videos.keys())
+    for key, features in videos.items():
+        assert np.allclose(reprs.video_level.read(key),
+                           global_vector(features))
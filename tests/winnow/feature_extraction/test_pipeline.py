@@ -0,0 +1,138 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+# winnow.feature_extraction package requires OpenCV and TensorFlow
+pytest.importorskip("cv2")
+pytest.importorskip("tensorflow")
+
+from winnow.feature_extraction.pipeline import ExtractionPipeline  # noqa: E402
+from winnow.storage.matrix_repr_storage import MatrixReprStorage  # noqa: E402
+from winnow.storage.repr_key import ReprKey  # noqa: E402
+from winnow.storage.repr_storage import ReprStorage  # noqa: E402
+
+# Number of chunks decoded before the broken video fails
+BROKEN_CHUNKS = 3
+
+
+class FakeModel:
+    """Model producing features from the mean frame color."""
+    desired_size = 4
+
+    def extract(self, frames, batch_sz):
+        return np.asarray(frames, dtype=np.float32).mean(axis=(1, 2))
+
+
+class FailingModel:
+    """Model failing on any input."""
+    desired_size = 4
+
+    def extract(self, frames, batch_sz):
+        raise ValueError("Broken model")
+
+
+def fake_frames(start, count, size):
+    """Make frames filled with consecutive values."""
+    values = np.arange(start, start + count, dtype=np.float32)
+    return np.tile(values.reshape(count, 1, 1, 1), (1, size, size, 3))
+
+
+def load_fake_chunks(path, desired_size, frame_sampling, chunk_size):
+    """Load frames described by the fake video file (must be picklable)."""
+    with open(path) as file:
+        description = file.read().split()
+    if description[0] == "broken":
+        for chunk in range(BROKEN_CHUNKS):
+            yield fake_frames(chunk * chunk_size, chunk_size, desired_size)
+        raise ValueError("Broken video stream")
+    start, count = map(int, description)
+    for offset in range(0, count, chunk_size):
+        size = min(chunk_size, count - offset)
+        yield fake_frames(start + offset, size, desired_size)
+
+
+def load_empty_chunks(path, desired_size, frame_sampling, chunk_size):
+    """Load a single empty chunk of frames (must be picklable)."""
+    yield fake_frames(0, 0, desired_size)
+
+
+@pytest.fixture
+def directory():
+    """Create a temporary directory."""
+    with tempfile.TemporaryDirectory(prefix="pipeline-") as directory:
+        yield directory
+
+
+def make_video(directory, name, content):
+    """Create a fake video file."""
+    path = os.path.join(directory, name)
+    with open(path, "w") as file:
+        file.write(content)
+    return path
+
+
+def test_pipeline(directory):
+    videos = {
+        make_video(directory, "first", "0 5"): np.arange(0, 5),
+        make_video(directory, "second", "100 1"): np.arange(100, 101),
+        make_video(directory, "third", "200 7"): np.arange(200, 207),
+    }
+    broken = make_video(directory, "broken", "broken")
+    missing = os.path.join(directory, "missing")
+    paths = [missing, *list(videos)[:2], broken, *list(videos)[2:]]
+
+    reprs = ReprStorage(os.path.join(directory, "repr"))
+    keys = {
+        path: ReprKey(path=os.path.basename(path), hash="hash", tag="tag")
+        for path in paths
+    }
+    pipeline = ExtractionPipeline(
+        FakeModel(), reprs, keys.get, decode_workers=1, batch_size=4,
+        chunk_size=2, save_frames=True, load_chunks=load_fake_chunks)
+    counters = pipeline.run(paths)
+
+    expected = {keys[path] for path in videos}
+    assert set(reprs.frame_level.list()) == expected
+    assert set(reprs.video_level.list()) == expected
+    assert set(reprs.frames.list()) == expected
+    for path, values in videos.items():
+        features = reprs.frame_level.read(keys[path])
+        assert np.allclose(features, np.repeat(values[:, None], 3, axis=1))
+
+    # Partially written chunk files of the broken video are discarded
+    partial = [name for _, _, names in os.walk(reprs.directory)
+               for name in names if ".partial" in name]
+    assert partial == []
+
+    assert counters["decode"].errors == 2
+    assert counters["decode"].videos == len(videos)
+    assert counters["write"].videos == len(videos)
+
+
+def test_failing_model(directory):
+    paths = [make_video(directory, name, "") for name in ("first", "second")]
+    reprs = ReprStorage(os.path.join(directory, "repr"))
+    pipeline = ExtractionPipeline(
+        FailingModel(), reprs, lambda path: ReprKey(path, "hash", "tag"),
+        decode_workers=1, batch_size=4, load_chunks=load_empty_chunks)
+    counters = pipeline.run(paths)
+
+    assert counters["inference"].errors == len(paths)
+    assert list(reprs.frame_level.list()) == []
+
+
+def test_video_without_frames(directory):
+    path = make_video(directory, "empty", "0 0")
+    reprs = ReprStorage(os.path.join(directory, "repr"),
+                        vector_storage_factory=MatrixReprStorage)
+    key = ReprKey(path="empty", hash="hash", tag="tag")
+    pipeline = ExtractionPipeline(
+        FakeModel(), reprs, lambda _: key, decode_workers=1, batch_size=4,
+        load_chunks=load_fake_chunks)
+    counters = pipeline.run([path])
+
+    assert counters["write"].errors == 0
+    assert list(reprs.frame_level.list()) == [key]
+    assert list(reprs.video_level.list()) == []
@@ -0,0 +1,193 @@
+import os
+import tempfile
+from uuid import uuid4 as uuid
+
+import numpy as np
+import pytest
+
+from winnow.matching.frame_index import FrameIndex, template_query, \
+    update_frame_index
+from winnow.storage.lmdb_repr_storage import LMDBReprStorage
+from winnow.storage.repr_key import ReprKey
+
+
+@pytest.fixture
+def directory():
+    """Temporary index directory."""
+    with tempfile.TemporaryDirectory(prefix="frame-index-") as directory:
+        yield directory
+
+
+def make_key():
+    """Make some repr storage key."""
+    return ReprKey(path=f"some/path-{uuid()}", hash=f"hash-{uuid()}",
+                   tag="tag")
+
+
+def make_videos(count, dim=16, objects=10, seed=0):
+    """Make frame features of some videos showing random objects.
+
+    Videos have different number of frames.
+    """
+    random = np.random.RandomState(seed)
+    centers = random.normal(size=(objects, dim))
+    videos = {}
+    for _ in range(count):
+        frames = centers[random.randint(objects, size=random.randint(0, 20))]
+        noise = random.normal(scale=0.2, size=frames.shape)
+        videos[make_key()] = (frames + noise).astype(np.float32)
+    return videos
+
+
+def cosine_distances(first, second):
+    first = first / np.linalg.norm(first, axis=1, keepdims=True)
+    second = second / np.linalg.norm(second, axis=1, keepdims=True)
+    return 1 - first.dot(second.T)
+
+
+def exact_search(videos, templates, max_distance):
+    """Get {(template, key) => (offset, distance)} by exhaustive search.
+
+    Each frame is compared with each template image.
+    """
+    results = {}
+    for template_id, template in enumerate(templates):
+        for key, frames in videos.items():
+            if len(frames) == 0:
+                continue
+            distances = np.mean(cosine_distances(template, frames), axis=0)
+            if distances.min() < max_distance:
+                results[(template_id, key)] = (np.argmin(distances),
+                                               distances.min())
+    return results
+
+
+def found(index, templates, max_distance, **kwargs):
+    """Search templates and get results in the format of exact_search()."""
+    queries = np.array([template_query(template) for template in templates])
+    query_ids, video_ids, offsets, distances = index.search(
+        queries, max_distance, **kwargs)
+    return {(query_id, index.keys[video_id]): (offset, distance)
+            for query_id, video_id, offset, distance
+            in zip(query_ids, video_ids, offsets, distances)}
+
+
+def make_templates(videos, count=3, seed=1):
+    """Make templates of a few images similar to some frames."""
+    random = np.random.RandomState(seed)
+    frames = np.concatenate([frames for frames in videos.values()
+                             if len(frames) > 0])
+    samples = frames[random.randint(len(frames), size=count)]
+    return [sample + random.normal(scale=0.1, size=(3, len(sample)))
+            for sample in samples]
+
+
+def assert_same(actual, expected):
+    assert actual.keys() == expected.keys()
+    for key, (offset, distance) in expected.items():
+        assert actual[key][0] == offset
+        assert actual[key][1] == pytest.approx(distance, abs=1e-5)
+
+
+def test_search(directory):
+    videos = make_videos(50)
+    templates = make_templates(videos)
+    index = FrameIndex.create(directory, videos.items(), method="brute_force")
+
+    expected = exact_search(videos, templates, max_distance=0.1)
+    assert len(expected) > 0
+    assert_same(found(index, templates, max_distance=0.1), expected)
+    assert len(index) == sum(map(len, videos.values()))
+
+
+def test_search_ivf(directory):
+    videos = make_videos(50)
+    templates = make_templates(videos)
+    index = FrameIndex.create(directory, videos.items(), method="ivf",
+                              n_lists=4, n_probe=4)
+
+    assert_same(found(index, templates, max_distance=0.1),
+                exact_search(videos, templates, max_distance=0.1))
+
+
+def test_load_and_add(directory):
+    videos = make_videos(50)
+    keys = list(videos.keys())
+    templates = make_templates(videos)
+    FrameIndex.create(directory, [(key, videos[key]) for key in keys[:20]],
+                      method="brute_force")
+
+    index = FrameIndex.load(directory)
+    index.add((key, videos[key]) for key in keys[20:])
+
+    loaded = FrameIndex.load(directory)
+    assert loaded.keys == keys
+    assert_same(found(loaded, templates, max_distance=0.1),
+                exact_search(videos, templates, max_distance=0.1))
+
+
+def test_empty(directory):
+    index = FrameIndex.create(directory)
+    assert len(index) == 0
+    assert len(index.search(np.ones((1, 16)), max_distance=1.0)[0]) == 0
+
+    videos = make_videos(10)
+    FrameIndex.load(directory).add(videos.items())
+    assert len(FrameIndex.load(directory)) == sum(map(len, videos.values()))
+
+
+def test_videos_mask(directory):
+    videos = make_videos(50)
+    templates = make_templates(videos)
+    index = FrameIndex.create(directory, videos.items(), method="brute_force")
+    mask = np.arange(len(videos)) % 2 == 0
+
+    selected = {key: frames for i, (key, frames)
+                in enumerate(videos.items()) if mask[i]}
+    assert_same(found(index, templates, max_distance=0.1, videos=mask),
+                exact_search(selected, templates, max_distance=0.1))
+
+
+def test_update_frame_index(directory):
+    storage = LMDBReprStorage(os.path.join(directory, "frame_level"))
+    index_directory = os.path.join(directory, "frame_index")
+    videos = make_videos(20)
+    keys = list(videos.keys())
+    for key in keys[:10]:
+        storage.write(key, videos[key])
+
+    index, live = update_frame_index(index_directory, storage,
+                                     method="brute_force")
+    assert set(index.keys) == set(keys[:10])
+    assert live.all()
+
+    # Add new videos and modify existing one
+    for key in keys[10:]:
+        storage.write(key, videos[key])
+    modified = ReprKey(path=keys[0].path, hash="modified", tag=keys[0].tag)
+    storage.write(modified, videos[keys[0]])
+
+    index, live = update_frame_index(index_directory, storage,
+                                     method="brute_force")
+    assert set(index.keys) == set(keys) | {modified}
+    outdated = {key for key, alive in zip(index.keys, live) if not alive}
+    assert outdated == {keys[0]}
+    assert len(index) == sum(map(len, videos.values())) + len(videos[keys[0]])
+
+    index, live = update_frame_index(index_directory, storage, rebuild=True,
+                                     method="brute_force")
+    assert set(index.keys) == set(keys[1:]) | {modified}
+    assert live.all()
+
+
+def test_ivf_limits(directory):
+    videos = make_videos(50)
+    templates = make_templates(videos)
+    index = FrameIndex.create(directory, videos.items(), max_lists=3,
+                              n_probe=3)
+    assert index.index.n_lists == 3
+
+    loaded = FrameIndex.load(directory)
+    assert loaded.index.max_lists == 3
+    assert_same(found(loaded, templates, max_distance=0.1),
+                exact_search(videos, templates, max_distance=0.1))
@@ -0,0 +1,138 @@
+import tempfile
+from uuid import uuid4 as uuid
+
+import numpy as np
+import pytest
+
+from winnow.matching.index import SignatureIndex, IVFIndex
+from winnow.matching.range_search import collect
+from winnow.storage.repr_key import ReprKey
+
+
+@pytest.fixture
+def directory():
+    """Temporary index directory."""
+    with tempfile.TemporaryDirectory(prefix="signature-index-") as directory:
+        yield directory
+
+
+def make_keys(count):
+    """Make some repr storage keys."""
+    return [ReprKey(path=f"some/path-{uuid()}", hash=f"hash-{uuid()}",
+                    tag="tag") for _ in range(count)]
+
+
+def make_vectors(count, dim=16, seed=0):
+    """Make some clustered unit vectors."""
+    random = np.random.RandomState(seed)
+    centers = random.normal(size=(max(1, count // 10), dim))
+    vectors = centers[random.randint(len(centers), size=count)]
+    vectors = vectors + random.normal(scale=0.05, size=(count, dim))
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def exact_distances(vectors):
+    differences = vectors[:, None, :] - vectors[None, :, :]
+    return np.sqrt((differences ** 2).sum(axis=2))
+
+
+def found_pairs(index, queries, radius):
+    """Get boolean matrix of the indexed vectors found for each query."""
+    found_queries, rows, _ = collect(index.range_search(queries, radius))
+    found = np.zeros((len(queries), len(index)), dtype=bool)
+    found[found_queries, rows] = True
+    return found
+
+
+def test_brute_force(directory):
+    vectors = make_vectors(100)
+    index = SignatureIndex.create(directory, make_keys(100), vectors,
+                                  method="brute_force")
+    assert np.array_equal(found_pairs(index, vectors, radius=0.5),
+                          exact_distances(vectors) < 0.5)
+
+
+def test_ivf_recall(directory):
+    vectors = make_vectors(500)
+    index = SignatureIndex.create(directory, make_keys(500), vectors,
+                                  method="ivf", n_lists=20, n_probe=4)
+    assert index.estimate_recall(radius=0.5, sample_size=500) > 0.95
+
+    # Exhaustive probing is exact
+    index = SignatureIndex.create(directory, make_keys(500), vectors,
+                                  method="ivf", n_lists=20, n_probe=20)
+    assert np.array_equal(found_pairs(index, vectors, radius=0.5),
+                          exact_distances(vectors) < 0.5)
+
+
+def test_kmeans_blocks():
+    sample = make_vectors(200)
+    centroids = [IVFIndex._kmeans(sample, 10, 5, np.random.RandomState(0),
+                                  block_size=block_size)
+                 for block_size in (7, 1000)]
+    assert np.allclose(centroids[0], centroids[1])
+
+
+def test_unknown_method(directory):
+    with pytest.raises(ValueError):
+        SignatureIndex.create(directory, make_keys(1), make_vectors(1),
+                              method="unknown")
+
+
+def test_save_load(directory):
+    keys, vectors = make_keys(50), make_vectors(50)
+    created = SignatureIndex.create(directory, keys, vectors, method="ivf",
+                                    n_lists=5)
+
+    assert SignatureIndex.exists(directory)
+    loaded = SignatureIndex.load(directory)
+    assert loaded.keys == keys
+    assert np.array_equal(loaded.vectors, vectors)
+    assert np.array_equal(found_pairs(loaded, vectors, radius=0.5),
+                          found_pairs(created, vectors, radius=0.5))
+
+
+def test_add(directory):
+    keys, vectors = make_keys(60), make_vectors(60)
+    index = SignatureIndex.create(directory, keys[:40], vectors[:40],
+                                  method="ivf", n_lists=4, n_probe=4)
+    index.add(keys[40:], vectors[40:])
+
+    loaded = SignatureIndex.load(directory)
+    assert loaded.keys == keys
+    assert np.array_equal(loaded.vectors, vectors)
+    found = found_pairs(loaded, vectors, radius=1e-3)
+    assert np.all(found[np.arange(60), np.arange(60)])
+
+
+def test_interrupted_add(directory):
+    keys, vectors = make_keys(60), make_vectors(60)
+    index = SignatureIndex.create(directory, keys[:40], vectors[:40],
+                                  method="ivf", n_lists=4, n_probe=4)
+
+    # Simulate add interrupted before the index description is committed
+    index._vectors.append(vectors[40:])
+    index.index.add(index._vectors.matrix(), 40)
+    index.index.save(directory)
+
+    loaded = SignatureIndex.load(directory)
+    assert len(loaded) == 40
+    assert len(loaded.index.assignments) == 40
+    _, rows, _ = collect(loaded.range_search(vectors, radius=0.5))
+    assert np.all(rows < 40)
+
+
+def test_range_search(directory):
+    vectors = make_vectors(300)
+    expected = exact_distances(vectors) < 0.3
+    methods = [("brute_force", {}), ("ivf", dict(n_lists=10, n_probe=10))]
+    for method, params in methods:
+        index = SignatureIndex.create(directory, make_keys(300), vectors,
+                                      method=method, **params)
+        queries, rows, distances = collect(
+            index.range_search(vectors[:100], radius=0.3, block_size=32))
+        found = np.zeros((100, 300), dtype=bool)
+        found[queries, rows] = True
+        assert np.array_equal(found, expected[:100])
+        assert np.all(distances < 0.3)
@@ -0,0 +1,40 @@
+import numpy as np
+
+from winnow.matching.pairs import (
+    encode_pairs, decode_pairs, unique_pairs, discarded_mask)
+
+
+def test_encode_symmetric():
+    first = np.array([1, 5, 0, 2 ** 31 - 1])
+    second = np.array([5, 1, 7, 3])
+    codes = encode_pairs(first, second)
+    assert codes.dtype == np.int64
+    assert codes[0] == codes[1]
+    assert np.array_equal(encode_pairs(second, first), codes)
+    assert len(set(encode_pairs([1, 12], [23, 3]))) == 2
+
+
+def test_decode():
+    smaller, larger = decode_pairs(
+        encode_pairs([3, 9, 2 ** 31 - 1], [8, 1, 0]))
+    assert list(smaller) == [3, 1, 0]
+    assert list(larger) == [8, 9, 2 ** 31 - 1]
+
+
+def test_unique_pairs():
+    first = np.array([0, 1, 2, 1, 3, 0])
+    second = np.array([1, 0, 3, 2, 2, 1])
+    assert list(unique_pairs(first, second)) == [0, 2, 3]
+
+
+def test_unique_pairs_empty():
+    empty = np.array([], dtype=int)
+    assert len(unique_pairs(empty, empty)) == 0
+
+
+def test_discarded_mask():
+    first = np.array([0, 1, 2, 3])
+    second = np.array([4, 4, 1, 0])
+    assert list(discarded_mask(first, second, [1], size=5)) == [
+        False, True, True, False]
+    assert not discarded_mask(first, second, [], size=5).any()
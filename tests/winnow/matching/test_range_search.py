@@ -0,0 +1,54 @@
+import numpy as np
+
+from winnow.matching.range_search import (
+    range_search, collect, euclidean_distances, block_size_for_memory)
+
+
+def exact_distances(queries, vectors):
+    differences = queries[:, None, :] - vectors[None, :, :]
+    return np.sqrt((differences ** 2).sum(axis=2))
+
+
+def test_euclidean_distances():
+    random = np.random.RandomState(0)
+    queries, vectors = random.rand(5, 8), random.rand(7, 8)
+    assert np.allclose(euclidean_distances(queries, vectors),
+                       exact_distances(queries, vectors))
+
+
+def test_range_search():
+    random = np.random.RandomState(0)
+    queries = random.rand(50, 4).astype(np.float32)
+    vectors = random.rand(70, 4).astype(np.float32)
+    distances = exact_distances(queries, vectors)
+    expected = set(zip(*np.nonzero(distances < 0.4)))
+
+    for block_size in [1, 7, 100]:
+        query_indices, vector_indices, found_distances = collect(
+            range_search(queries, vectors, 0.4, block_size))
+        assert set(zip(query_indices, vector_indices)) == expected
+        assert len(query_indices) == len(expected)
+        assert np.allclose(found_distances,
+                           distances[query_indices, vector_indices],
+                           atol=1e-5)
+
+
+def test_vector_ids():
+    vectors = np.eye(3, dtype=np.float32)
+    vector_ids = np.array([10, 20, 30])
+    query_indices, vector_indices, _ = collect(
+        range_search(vectors, vectors, 0.1, vector_ids=vector_ids))
+    assert list(zip(query_indices, vector_indices)) == [
+        (0, 10), (1, 20), (2, 30)]
+
+
+def test_empty():
+    query_indices, vector_indices, distances = collect(
+        range_search(np.empty((0, 3)), np.eye(3), 1.0))
+    assert len(query_indices) == len(vector_indices) == len(distances) == 0
+
+
+def test_block_size_for_memory():
+    block_size = block_size_for_memory(80 * 2 ** 20)
+    assert block_size ** 2 * 5 <= 80 * 2 ** 20
+    assert (block_size + 1) ** 2 * 5 > 80 * 2 ** 20
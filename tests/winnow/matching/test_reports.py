@@ -0,0 +1,59 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from winnow.matching.pairs import encode_pairs
+from winnow.matching.reports import merge_match_reports, read_match_report
+
+
+def make_report(pairs, rows, distance=0.1):
+    """Make match report of the given pairs of (path, hash) video keys."""
+    query = np.array([rows[first] for first, _ in pairs], dtype=np.int64)
+    match = np.array([rows[second] for _, second in pairs], dtype=np.int64)
+    return pd.DataFrame({
+        "query": query,
+        "match": match,
+        "distance": distance,
+        "query_video": [first[0] for first, _ in pairs],
+        "query_sha256": [first[1] for first, _ in pairs],
+        "match_video": [second[0] for _, second in pairs],
+        "match_sha256": [second[1] for _, second in pairs],
+        "self_match": False,
+        "unique_index": encode_pairs(query, match)})
+
+
+def pairs_of(report):
+    """Get set of matched video pairs of the report."""
+    return set(zip(zip(report.query_video, report.query_sha256),
+                   zip(report.match_video, report.match_sha256)))
+
+
+def test_merge_match_reports():
+    a, b, c = ("a", "1"), ("b", "2"), ("c", "3")
+    modified, new = ("c", "4"), ("d", "5")
+    previous = make_report([(a, b), (a, c), (b, c)], {a: 0, b: 1, c: 2})
+
+    # Index is rebuilt: "c" is modified, "d" is new
+    rows = {b: 0, a: 1, modified: 2, new: 3}
+    matches = make_report([(new, a), (modified, b), (b, a)], rows,
+                          distance=0.2)
+
+    with tempfile.TemporaryDirectory(prefix="reports-") as directory:
+        path = os.path.join(directory, "report.csv")
+        previous.to_csv(path)
+        merged = merge_match_reports(read_match_report(path), matches, rows)
+
+    assert len(merged) == 3
+    assert pairs_of(merged) == pairs_of(matches)
+    assert list(merged.distance) == [0.2] * 3
+
+    previous = make_report([(a, b), (b, c)], {a: 0, b: 1, c: 2})
+    merged = merge_match_reports(previous, make_report([(new, b)], rows),
+                                 rows)
+    assert pairs_of(merged) == {(a, b), (new, b)}
+    assert list(merged["query"]) == [1, 3]
+    assert list(merged["match"]) == [0, 0]
+    assert list(merged.unique_index) == list(encode_pairs([1, 3], [0, 0]))
+    assert list(merged.index) == [0, 1]
@@ -0,0 +1,152 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from uuid import uuid4 as uuid
+
+import numpy as np
+import pytest
+
+from winnow.matching.index import SignatureIndex
+from winnow.matching.range_search import collect
+from winnow.matching.sharding import ShardedMatching
+from winnow.storage.repr_key import ReprKey
+
+
+@pytest.fixture
+def directory():
+    """Temporary directory for index and job files."""
+    with tempfile.TemporaryDirectory(prefix="sharded-matching-") as directory:
+        yield directory
+
+
+@pytest.fixture
+def index(directory):
+    """Create signature index with some random vectors."""
+    random = np.random.RandomState(0)
+    vectors = random.rand(200, 8).astype(np.float32)
+    keys = [ReprKey(path=f"some/path-{uuid()}", hash=f"hash-{uuid()}",
+                    tag="tag") for _ in range(len(vectors))]
+    return SignatureIndex.create(os.path.join(directory, "index"), keys,
+                                 vectors, method="brute_force")
+
+
+def make_job(directory, index, query_rows, shards):
+    return ShardedMatching.create(os.path.join(directory, "job"),
+                                  index.directory, query_rows, shards,
+                                  radius=0.5)
+
+
+def pairs(query_rows, match_rows):
+    return set(zip(query_rows, match_rows))
+
+
+def test_query_rows(directory, index):
+    job = make_job(directory, index, np.arange(10, 20), shards=3)
+    shards = [job.query_rows(shard_id) for shard_id in range(3)]
+    assert np.array_equal(np.concatenate(shards), np.arange(10, 20))
+
+
+def test_work(directory, index):
+    query_rows = np.arange(0, 200, 2)
+    job = make_job(directory, index, query_rows, shards=4)
+
+    assert job.work() == 4
+    assert job.completed() == [0, 1, 2, 3]
+
+    # All shards are already claimed
+    assert ShardedMatching.load(job.directory).work() == 0
+
+    found_queries, found_matches, distances = job.merge()
+    expected_queries, expected_matches, _ = collect(
+        index.range_search(index.vectors[query_rows], radius=0.5))
+    assert pairs(found_queries, found_matches) == pairs(
+        query_rows[expected_queries], expected_matches)
+    assert np.all(distances < 0.5)
+
+
+def test_run(directory, index):
+    job = make_job(directory, index, np.arange(200), shards=3)
+    assert job.run(processes=2) == 3
+    job.wait()
+
+    found_queries, found_matches, _ = job.merge()
+    expected_queries, expected_matches, _ = collect(
+        index.range_search(index.vectors, radius=0.5))
+    assert pairs(found_queries, found_matches) == pairs(
+        expected_queries, expected_matches)
+
+
+def test_recreate(directory, index):
+    job = make_job(directory, index, np.arange(10), shards=2)
+    job.work()
+    job = make_job(directory, index, np.arange(10), shards=2)
+    assert job.completed() == []
+
+
+def write_lock(job, shard_id, host, pid, age=0):
+    """Write lock of the shard claimed by the given worker some seconds ago."""
+    path = os.path.join(job.directory, f"shard-{shard_id:05}.lock")
+    with open(path, "w") as lock_file:
+        json.dump(dict(host=host, pid=pid, claimed=time.time() - age),
+                  lock_file)
+    os.utime(path, (time.time() - age, time.time() - age))
+
+
+def dead_pid():
+    """Get id of a finished process."""
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_reclaim_abandoned(directory, index):
+    job = make_job(directory, index, np.arange(200), shards=4)
+    write_lock(job, 0, socket.gethostname(), dead_pid())
+    write_lock(job, 1, "remote-host", 1, age=job.lock_timeout + 1)
+    write_lock(job, 2, "remote-host", 1)
+    write_lock(job, 3, socket.gethostname(), os.getpid())
+
+    abandoned = [job.abandoned(shard_id) for shard_id in range(4)]
+    assert abandoned == [True, True, False, False]
+    assert job.work() == 2
+    assert job.completed() == [0, 1]
+    assert not job.abandoned(0)
+
+
+def test_wait_abandoned(directory, index):
+    job = make_job(directory, index, np.arange(200), shards=3)
+    job.work()
+    os.remove(os.path.join(job.directory, "shard-00001.npz"))
+    write_lock(job, 1, socket.gethostname(), dead_pid())
+
+    job.wait(poll_interval=0)
+    found_queries, found_matches, _ = job.merge()
+    expected_queries, expected_matches, _ = collect(
+        index.range_search(index.vectors, radius=0.5))
+    assert pairs(found_queries, found_matches) == pairs(
+        expected_queries, expected_matches)
+
+
+def test_reclaim_once(directory, index):
+    job = make_job(directory, index, np.arange(200), shards=2)
+    write_lock(job, 0, socket.gethostname(), dead_pid())
+    other = ShardedMatching.load(job.directory)
+
+    assert job.reclaim(0)
+    assert not other.reclaim(0)
+    assert sorted(os.listdir(job.directory)) == [
+        "job.json", "query_rows.npy", "shard-00000.lock"]
+
+
+def test_absolute_index_directory(directory, index, monkeypatch):
+    monkeypatch.chdir(directory)
+    job = ShardedMatching.create(os.path.join(directory, "job"), "index",
+                                 np.arange(10), shards=2, radius=0.5)
+
+    loaded = ShardedMatching.load(job.directory)
+    assert loaded.index_directory == index.directory
+    assert os.path.isabs(loaded.index_directory)
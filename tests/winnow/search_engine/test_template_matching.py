@@ -0,0 +1,57 @@
+import tempfile
+
+import numpy as np
+import pytest
+
+# winnow.search_engine package requires OpenCV and matplotlib
+pytest.importorskip("cv2")
+pytest.importorskip("matplotlib")
+
+from winnow.matching.frame_index import FrameIndex  # noqa: E402
+from winnow.search_engine.template_matching import (  # noqa: E402
+    REPORT_COLUMNS, SearchEngine)
+from winnow.storage.repr_key import ReprKey  # noqa: E402
+
+
+@pytest.fixture
+def directory():
+    """Temporary index directory."""
+    with tempfile.TemporaryDirectory(prefix="template-matching-") as directory:
+        yield directory
+
+
+def make_engine(directory, templates):
+    """Make search engine over a few videos without loading a model."""
+    random = np.random.RandomState(0)
+    videos = {ReprKey(path=f"path-{i}", hash=f"hash-{i}", tag="tag"):
+              random.normal(size=(5, 8)).astype(np.float32)
+              for i in range(3)}
+    engine = SearchEngine.__new__(SearchEngine)
+    engine.templates_root = directory
+    engine.available_queries = {name: directory for name in templates}
+    engine.template_cache = templates
+    engine.results_cache = {}
+    engine.frame_index = FrameIndex.create(directory, videos.items(),
+                                           method="brute_force")
+    engine.live_videos = np.ones(len(videos), dtype=bool)
+    return engine, videos
+
+
+def test_annotation_report(directory):
+    engine, videos = make_engine(directory, {})
+    engine.template_cache["found"] = next(iter(videos.values()))[1:2]
+    engine.available_queries["found"] = directory
+
+    report = engine.create_annotation_report(threshold=0.01)
+    assert list(report.columns) == REPORT_COLUMNS
+    assert list(report.fn) == ["path-0"]
+    assert list(report.closest_match) == [1]
+
+
+def test_annotation_report_no_matches(directory):
+    templates = {"missing": -np.ones((2, 8), dtype=np.float32)}
+    engine, _ = make_engine(directory, templates)
+
+    report = engine.create_annotation_report(threshold=0.01)
+    assert len(report) == 0
+    assert list(report.columns) == REPORT_COLUMNS
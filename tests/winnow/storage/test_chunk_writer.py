@@ -0,0 +1,134 @@
+import gc
+import os
+import tempfile
+import time
+
+import numpy as np
+import pytest
+
+from winnow.storage.chunk_writer import (
+    BufferedChunkWriter, MatrixChunkWriter, STALE_TEMP_SECONDS)
+from winnow.storage.lmdb_repr_storage import LMDBReprStorage
+from winnow.storage.repr_key import ReprKey
+from winnow.storage.repr_utils import write_chunks, chunk_writer
+from winnow.storage.sqlite_repr_storage import SQLiteReprStorage
+
+
+@pytest.fixture
+def store(request):
+    """Create a new empty repr storage of the requested type."""
+    with tempfile.TemporaryDirectory(prefix="repr-store-") as directory:
+        yield request.param(directory=directory)
+
+
+use_store = pytest.mark.parametrize(
+    'store', [LMDBReprStorage, SQLiteReprStorage], indirect=True)
+
+
+def make_chunks(count=5, size=3):
+    """Make some frame chunks."""
+    return [np.random.randint(0, 255, size=(size, 4, 4, 3), dtype=np.uint8)
+            for _ in range(count)]
+
+
+@use_store
+def test_write_chunks(store):
+    key = ReprKey(path="some/path", hash="some-hash", tag="some-tag")
+    chunks = make_chunks()
+
+    write_chunks(store, key, chunks)
+
+    assert store.exists(key)
+    assert np.array_equal(store.read(key), np.concatenate(chunks))
+
+
+@use_store
+def test_write_no_chunks(store):
+    key = ReprKey(path="some/path", hash="some-hash", tag="some-tag")
+
+    write_chunks(store, key, [])
+
+    assert store.exists(key)
+    assert len(store.read(key)) == 0
+
+
+@use_store
+def test_discard(store):
+    key = ReprKey(path="some/path", hash="some-hash", tag="some-tag")
+
+    def failing_chunks():
+        yield from make_chunks()
+        raise RuntimeError()
+
+    with pytest.raises(RuntimeError):
+        write_chunks(store, key, failing_chunks())
+
+    assert not store.exists(key)
+    assert list(store.list()) == []
+
+
+def test_lmdb_writes_incrementally():
+    with tempfile.TemporaryDirectory(prefix="repr-store-") as directory:
+        store = LMDBReprStorage(directory)
+        key = ReprKey(path="some/path", hash="some-hash", tag="some-tag")
+        chunks = make_chunks()
+
+        writer = chunk_writer(store, key)
+        assert isinstance(writer, MatrixChunkWriter)
+        for chunk in chunks:
+            writer.append(chunk)
+
+        # Not visible until closed
+        assert not store.exists(key)
+        writer.close()
+        saved = np.load(os.path.join(directory, "some/path.npy"))
+        assert np.array_equal(saved, np.concatenate(chunks))
+
+        # Custom formats are buffered
+        custom = LMDBReprStorage(os.path.join(directory, "custom"),
+                                 save=np.save, load=np.load, suffix=".data")
+        assert isinstance(chunk_writer(custom, key), BufferedChunkWriter)
+
+
+def test_matrix_writer_leaves_no_temp_files():
+    with tempfile.TemporaryDirectory(prefix="chunk-writer-") as directory:
+        path = os.path.join(directory, "value.npy")
+
+        writer = MatrixChunkWriter(path)
+        for chunk in make_chunks():
+            writer.append(chunk)
+        writer.discard()
+        assert os.listdir(directory) == []
+
+        writer = MatrixChunkWriter(path)
+        for chunk in make_chunks():
+            writer.append(chunk)
+        writer.close()
+        assert os.listdir(directory) == ["value.npy"]
+
+
+def test_lmdb_removes_stale_temp_files():
+    with tempfile.TemporaryDirectory(prefix="repr-store-") as directory:
+        store = LMDBReprStorage(directory)
+        key = ReprKey(path="some/path", hash="some-hash", tag="some-tag")
+
+        # Interrupted writers
+        stale, running = chunk_writer(store, key), chunk_writer(store, key)
+        stale.append(make_chunks(count=1)[0])
+        running.append(make_chunks(count=1)[0])
+        temp_directory = os.path.join(directory, ".partial")
+        stale_path, running_path = (
+            os.path.join(temp_directory, name)
+            for name in sorted(os.listdir(temp_directory)))
+        past = time.time() - STALE_TEMP_SECONDS - 1
+        os.utime(stale_path, (past, past))
+
+        # Temporary files are not in the storage tree
+        assert os.listdir(os.path.join(directory, "some")) == []
+
+        # LMDB environment must be closed before the storage is opened again
+        del store, stale, running
+        gc.collect()
+        LMDBReprStorage(directory)
+        assert not os.path.exists(stale_path)
+        assert os.path.exists(running_path)
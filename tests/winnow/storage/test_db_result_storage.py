@@ -123,6 +123,21 @@ def test_add_metadata(store):
     assert count(store, VideoMetadata) == len(updated)
 
 
+def test_existing_gray_max(store):
+    saved = [File(f"some/path{i}", f"some-hash{i}", {"gray_max": float(i)})
+             for i in range(10)]
+    store.add_metadata(saved)
+    store.add_file_metadata("other/path", "other-hash", {"flagged": True})
+
+    requested = [(file.path, file.sha256) for file in saved[:5]]
+    missing = [("some/path0", "other-hash"), ("other/path", "other-hash"),
+               ("unknown/path", "some-hash")]
+    expected = {(file.path, file.sha256): file.value["gray_max"]
+                for file in saved[:5]}
+    assert store.existing_gray_max(requested + missing) == expected
+    assert store.existing_gray_max([]) == {}
+
+
 def test_add_file_exif(store):
     # Check metadata write
     orig = File("some/path", "some-hash", {"Video_Width": 42.5})
@@ -153,6 +168,19 @@ def test_add_exif(store):
     assert count(store, Exif) == len(updated)
 
 
+def test_existing_exifs(store):
+    saved = [File(f"some/path{i}", f"some-hash{i}", {"Video_Width": float(i)})
+             for i in range(10)]
+    store.add_exifs(saved)
+    store.add_file_signature("other/path", "other-hash", b"some-signature")
+
+    requested = [(file.path, file.sha256) for file in saved[:5]]
+    missing = [("some/path0", "other-hash"), ("other/path", "other-hash"),
+               ("unknown/path", "some-hash")]
+    assert store.existing_exifs(requested + missing) == set(requested)
+    assert store.existing_exifs([]) == set()
+
+
 def test_add_file_scenes(store):
     # Check save
     orig = File("some/path", "some-hash", list(range(10)))
@@ -0,0 +1,141 @@
+import hashlib
+import multiprocessing
+import os
+import tempfile
+from uuid import uuid4 as uuid
+
+import pytest
+
+from winnow.storage.hash_cache import HashCache, FileStat, compute_hash
+
+
+@pytest.fixture
+def directory():
+    """Create a temporary directory."""
+    with tempfile.TemporaryDirectory(prefix="hash-cache-") as directory:
+        yield directory
+
+
+@pytest.fixture
+def cache(directory):
+    """Create an empty hash cache in a temporary directory."""
+    return HashCache(os.path.join(directory, "cache"), buffer_size=16)
+
+
+def make_file(directory, content=None):
+    """Create some file in the directory."""
+    path = os.path.join(directory, f"file-{uuid()}")
+    with open(path, "w") as file:
+        file.write(content or str(uuid()) * 10)
+    return path
+
+
+def sha256(path):
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def test_compute_hash(directory):
+    path = make_file(directory)
+    assert compute_hash(path, buffer_size=7) == sha256(path)
+
+
+def test_hash(cache, directory):
+    path = make_file(directory)
+
+    assert cache.get(path) is None
+    assert cache.hash(path) == sha256(path)
+    assert cache.get(path) == sha256(path)
+    assert len(cache) == 1
+
+
+def test_hash_many(cache, directory):
+    paths = [make_file(directory) for _ in range(10)]
+    cache.hash(paths[0])
+
+    expected = [sha256(path) for path in paths]
+    assert cache.hash_many(paths, threads=3) == expected
+    assert len(cache) == len(paths)
+    assert cache.hash_many([]) == []
+
+
+def test_modified_file(cache, directory):
+    path = make_file(directory, content="original")
+    cache.hash(path)
+
+    with open(path, "w") as file:
+        file.write("modified content")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    assert cache.get(path) is None
+    assert cache.hash(path) == sha256(path)
+    assert cache.get(path) == sha256(path)
+
+
+def test_replaced_file(cache, directory):
+    path = make_file(directory, content="original")
+    cache.hash(path)
+
+    # Replace file with a different file having the same size and mtime
+    replacement = make_file(directory, content="replaced")
+    stat = os.stat(path)
+    os.utime(replacement, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(replacement, path)
+
+    assert cache.get(path) is None
+    assert cache.hash(path) == sha256(path)
+
+
+def test_invalidate(cache, directory):
+    paths = [make_file(directory) for _ in range(3)]
+    cache.hash_many(paths)
+
+    cache.invalidate(paths[:1])
+    assert cache.get(paths[0]) is None
+    assert cache.get(paths[1]) == sha256(paths[1])
+
+    cache.invalidate()
+    assert len(cache) == 0
+
+
+def test_persistence(directory):
+    path = make_file(directory)
+    cache_directory = os.path.join(directory, "cache")
+    HashCache(cache_directory).hash(path)
+
+    assert HashCache(cache_directory).get(path) == sha256(path)
+
+
+def test_known_stats(cache, directory):
+    paths = [make_file(directory) for _ in range(3)]
+    stats = [FileStat.of(path) for path in paths]
+
+    expected = [sha256(path) for path in paths]
+    assert cache.hash_many(paths, stats=stats) == expected
+    assert cache.get(paths[0]) == sha256(paths[0])
+
+
+def test_shared_directory(directory):
+    path = make_file(directory)
+    first = HashCache(os.path.join(directory, "cache"))
+    second = HashCache(os.path.join(directory, "cache"))
+
+    first.hash(path)
+    assert second.get(path) == sha256(path)
+
+
+def hash_file(directory, path):
+    """Hash file using the cache (runs in a child process)."""
+    return HashCache(directory).hash(path)
+
+
+def test_forked_process(cache, directory):
+    paths = [make_file(directory) for _ in range(2)]
+    cache.hash(paths[0])
+
+    with multiprocessing.get_context("fork").Pool(1) as pool:
+        hashes = pool.starmap(
+            hash_file, [(cache.directory, path) for path in paths])
+        assert hashes == list(map(sha256, paths))
+    assert cache.get(paths[1]) == sha256(paths[1])
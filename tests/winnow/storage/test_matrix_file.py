@@ -0,0 +1,104 @@
+import multiprocessing
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from winnow.storage.matrix_file import MatrixFile
+
+
+@pytest.fixture
+def path():
+    """Path to a matrix file in a temporary directory."""
+    with tempfile.TemporaryDirectory(prefix="matrix-file-") as directory:
+        yield os.path.join(directory, "matrix.npy")
+
+
+def test_empty(path):
+    matrix = MatrixFile(path, row_shape=(3,))
+    assert len(matrix) == 0
+    assert matrix.matrix().shape == (0, 3)
+    assert np.load(path).shape == (0, 3)
+
+
+def test_missing(path):
+    with pytest.raises(FileNotFoundError):
+        MatrixFile(path)
+
+
+def test_append(path):
+    data = np.random.rand(10, 4).astype(np.float32)
+    matrix = MatrixFile(path, row_shape=(4,))
+
+    assert matrix.append(data[:6]) == 0
+    assert matrix.append(data[6:]) == 6
+    assert np.array_equal(matrix.matrix(), data)
+    assert np.array_equal(matrix.read(7), data[7])
+
+    # File must remain a regular .npy file
+    assert np.array_equal(np.load(path), data)
+    assert np.array_equal(np.load(path, mmap_mode="r"), data)
+
+    # Reopen
+    reopened = MatrixFile(path)
+    assert reopened.row_shape == (4,)
+    assert reopened.dtype == np.float32
+    assert np.array_equal(reopened.matrix(), data)
+
+
+def test_multidimensional_rows(path):
+    data = np.random.randint(0, 255, size=(5, 2, 3, 3), dtype=np.uint8)
+    matrix = MatrixFile(path, row_shape=(2, 3, 3), dtype=np.uint8)
+    matrix.append(data)
+    assert np.array_equal(np.load(path), data)
+
+
+def test_write(path):
+    data = np.zeros((3, 2), dtype=np.float32)
+    matrix = MatrixFile(path, row_shape=(2,))
+    matrix.append(data)
+    matrix.write(1, [1.0, 2.0])
+    data[1] = [1.0, 2.0]
+    assert np.array_equal(MatrixFile(path).matrix(), data)
+
+    with pytest.raises(IndexError):
+        matrix.write(3, [1.0, 2.0])
+
+
+def test_truncate(path):
+    data = np.random.rand(5, 2).astype(np.float32)
+    matrix = MatrixFile(path, row_shape=(2,))
+    matrix.append(data)
+    matrix.truncate(2)
+    assert np.array_equal(matrix.matrix(), data[:2])
+    matrix.append(data[4:])
+    assert np.array_equal(MatrixFile(path).matrix(), data[[0, 1, 4]])
+
+
+def append_rows(path, value, times):
+    """Append rows filled with the value one by one (in a child process)."""
+    matrix = MatrixFile(path, row_shape=(4,))
+    return [matrix.append(np.full((1, 4), value)) for _ in range(times)]
+
+
+def test_multiple_processes(path):
+    # Both processes open the matrix before any row is appended
+    with multiprocessing.get_context("spawn").Pool(2) as pool:
+        starts = pool.starmap(append_rows, [(path, 1.0, 50), (path, 2.0, 50)])
+
+    matrix = MatrixFile(path).matrix()
+    assert len(matrix) == 100
+    assert sorted(starts[0] + starts[1]) == list(range(100))
+    for value, rows in zip((1.0, 2.0), starts):
+        assert np.all(matrix[rows] == value)
+
+
+def test_refresh(path):
+    matrix = MatrixFile(path, row_shape=(2,))
+    other = MatrixFile(path)
+    other.append(np.ones((3, 2)))
+
+    assert matrix.matrix().shape == (3, 2)
+    assert np.array_equal(matrix.read(2), [1.0, 1.0])
+    assert matrix.append(np.zeros((1, 2))) == 3
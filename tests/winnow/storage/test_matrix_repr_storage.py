@@ -0,0 +1,195 @@
+import multiprocessing
+import tempfile
+from uuid import uuid4 as uuid
+
+import numpy as np
+import pytest
+
+from winnow.storage.lmdb_repr_storage import LMDBReprStorage
+from winnow.storage.matrix_repr_storage import MatrixReprStorage
+from winnow.storage.repr_key import ReprKey
+from winnow.storage.repr_storage import ReprStorage
+from winnow.storage.repr_utils import bulk_read, bulk_write, bulk_read_matrix
+
+
+@pytest.fixture
+def directory():
+    """Create a temporary directory."""
+    with tempfile.TemporaryDirectory(prefix="matrix-repr-store-") as directory:
+        yield directory
+
+
+def make_key():
+    """Make some repr storage key."""
+    unique = uuid()
+    return ReprKey(path=f"some/path-{unique}", hash=f"some-hash-{unique}",
+                   tag=f"some-tag-{unique}")
+
+
+def make_value(shape=(1, 8)):
+    """Make some fixed-width representation value."""
+    return np.random.rand(*shape).astype(np.float32)
+
+
+def test_read_write(directory):
+    store = MatrixReprStorage(directory)
+    key, value, another_value = make_key(), make_value(), make_value()
+
+    assert not store.exists(key)
+    store.write(key, value)
+    assert store.exists(key)
+    assert np.array_equal(store.read(key), value)
+
+    # Rewrite in-place
+    store.write(key, another_value)
+    assert np.array_equal(store.read(key), another_value)
+    assert list(store.list()) == [key]
+
+    # Other hash or tag
+    assert not store.exists(ReprKey(path=key.path, hash="other", tag=key.tag))
+    with pytest.raises(KeyError):
+        store.read(ReprKey(path=key.path, hash=key.hash, tag="other"))
+
+
+def test_delete(directory):
+    store = MatrixReprStorage(directory)
+    key_1, key_2 = make_key(), make_key()
+    store.write(key_1, make_value())
+    store.write(key_2, make_value())
+
+    store.delete(key_1.path)
+    assert not store.exists(key_1)
+    assert set(store.list()) == {key_2}
+
+    with pytest.raises(KeyError):
+        store.delete(key_1.path)
+
+
+def test_wrong_shape(directory):
+    store = MatrixReprStorage(directory)
+    store.write(make_key(), make_value((1, 8)))
+
+    with pytest.raises(ValueError):
+        store.write(make_key(), make_value((1, 9)))
+
+
+def test_reopen(directory):
+    entries = {make_key(): make_value() for _ in range(10)}
+    bulk_write(MatrixReprStorage(directory), entries)
+
+    loaded = bulk_read(MatrixReprStorage(directory))
+    assert set(loaded.keys()) == set(entries.keys())
+    for key, value in entries.items():
+        assert np.array_equal(loaded[key], value)
+
+
+def test_read_matrix(directory):
+    store = MatrixReprStorage(directory)
+    entries = {make_key(): make_value() for _ in range(10)}
+    bulk_write(store, entries)
+
+    # All entries are loaded as a memory-mapped view
+    keys, matrix = store.read_matrix()
+    assert isinstance(matrix, np.memmap)
+    assert keys == list(entries.keys())
+    assert np.array_equal(matrix, np.array(list(entries.values())))
+
+    # Selected entries in the requested order, unknown keys are skipped
+    select = list(entries.keys())[::-2] + [make_key()]
+    keys, matrix = store.read_matrix(select)
+    assert keys == select[:-1]
+    assert np.array_equal(matrix, np.array([entries[key] for key in keys]))
+
+    # Deleted entries are excluded
+    deleted = list(entries.keys())[0]
+    store.delete(deleted.path)
+    keys, matrix = store.read_matrix()
+    assert keys == list(entries.keys())[1:]
+    assert np.array_equal(matrix, np.array([entries[key] for key in keys]))
+
+
+def test_bulk_read_matrix(directory):
+    entries = {make_key(): make_value() for _ in range(10)}
+
+    stores = (MatrixReprStorage(f"{directory}/matrix"),
+              LMDBReprStorage(f"{directory}/lmdb"))
+    for store in stores:
+        bulk_write(store, entries)
+        keys, matrix = bulk_read_matrix(store)
+        assert set(keys) == set(entries.keys())
+        assert np.array_equal(matrix, np.array([entries[key] for key in keys]))
+
+
+def test_repr_storage_factory(directory):
+    reps = ReprStorage(directory, vector_storage_factory=MatrixReprStorage)
+
+    assert isinstance(reps.frame_level, LMDBReprStorage)
+    assert isinstance(reps.video_level, MatrixReprStorage)
+    assert isinstance(reps.signature, MatrixReprStorage)
+
+
+def test_list_prefix_partition(directory):
+    store = MatrixReprStorage(directory)
+    keys = [ReprKey(path=f"{folder}/file-{i}", hash="hash", tag="tag")
+            for folder in ("a", "b") for i in range(10)]
+    for key in keys:
+        store.write(key, make_value())
+
+    assert set(store.list(prefix="a/")) == set(keys[:10])
+    partitions = [set(store.list(prefix="b/", partition=(index, 2)))
+                  for index in range(2)]
+    assert set.union(*partitions) == set(keys[10:])
+    assert sum(map(len, partitions)) == 10
+
+
+def test_write_many(directory):
+    store = MatrixReprStorage(directory)
+    entries = {make_key(): make_value() for _ in range(25)}
+
+    store.write_many(entries.items(), commit_interval=10)
+    keys, matrix = store.read_matrix()
+    assert keys == list(entries.keys())
+    assert np.array_equal(matrix, np.array(list(entries.values())))
+    assert store.exists_many([keys[0], make_key()]) == [True, False]
+
+    # Rewrites don't add rows
+    updated = {key: make_value() for key in keys[:5]}
+    store.write_many(updated.items())
+    keys, matrix = store.read_matrix()
+    assert len(matrix) == len(entries)
+    expected = {**entries, **updated}
+    assert np.array_equal(matrix, np.array([expected[key] for key in keys]))
+
+
+def test_read_empty(directory):
+    keys, matrix = MatrixReprStorage(directory).read_matrix()
+    assert keys == []
+    assert matrix.shape == (0, 0)
+
+    store = MatrixReprStorage(f"{directory}/shaped", row_shape=(1, 8))
+    keys, matrix = store.read_matrix()
+    assert keys == []
+    assert matrix.shape == (0, 1, 8)
+    assert matrix.dtype == np.float32
+    with pytest.raises(ValueError):
+        store.write(make_key(), make_value(shape=(2, 8)))
+
+
+def write_entries(directory, entries):
+    """Write entries in small batches (runs in a child process)."""
+    MatrixReprStorage(directory).write_many(entries, commit_interval=3)
+
+
+def test_multiple_processes(directory):
+    # Reader is opened before the matrix file is created
+    reader = MatrixReprStorage(directory)
+    batches = [{make_key(): make_value() for _ in range(30)} for _ in range(2)]
+    with multiprocessing.get_context("spawn").Pool(2) as pool:
+        pool.starmap(write_entries, [(directory, list(batch.items()))
+                                     for batch in batches])
+
+    for batch in batches:
+        for key, value in batch.items():
+            assert np.array_equal(reader.read(key), value)
+    keys, matrix = reader.read_matrix()
+    assert len(keys) == len(matrix) == 60
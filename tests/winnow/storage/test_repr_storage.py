@@ -1,4 +1,6 @@
+import os
 import tempfile
+from glob import glob
 from itertools import islice
 from uuid import uuid4 as uuid
 
@@ -8,7 +10,8 @@ from dataclasses import asdict
 
 from winnow.storage.lmdb_repr_storage import LMDBReprStorage
 from winnow.storage.repr_key import ReprKey
-from winnow.storage.repr_utils import bulk_read, bulk_write
+from winnow.storage.repr_utils import (
+    bulk_read, bulk_write, bulk_read_iter, bulk_read_derived, BulkReadReport)
 from winnow.storage.sqlite_repr_storage import SQLiteReprStorage
 
 
@@ -138,3 +141,147 @@ def test_bulk_read_write(store):
     # Get half of the data
     subset = dict(islice(data_as_dict.items(), 0, int(len(data_as_dict) / 2)))
     assert bulk_read(store, select=subset.keys()) == subset
+
+
+@use_store
+def test_bulk_read_iter(store):
+    data_as_dict = dict(make_entry() for _ in range(100))
+    bulk_write(store, data_as_dict)
+
+    # Values are produced in the order of the requested keys
+    select = list(data_as_dict.keys())[::-1]
+    loaded = list(bulk_read_iter(store, select, threads=4, prefetch=3))
+    assert loaded == [(key, data_as_dict[key]) for key in select]
+
+
+@use_store
+def test_bulk_read_errors(store):
+    data_as_dict = dict(make_entry() for _ in range(10))
+    bulk_write(store, data_as_dict)
+    missing = [make_key() for _ in range(5)]
+
+    report = BulkReadReport()
+    select = list(data_as_dict.keys()) + missing
+    assert bulk_read(store, select, report=report) == data_as_dict
+    assert report.loaded == len(data_as_dict)
+    assert report.failed == len(missing)
+    assert set(report.errors.keys()) == set(missing)
+
+
+@use_store
+def test_list_prefix(store):
+    key_1 = ReprKey(path="some/dir/file-1", hash="hash", tag="tag")
+    key_2 = ReprKey(path="some/dir/file-2", hash="hash", tag="tag")
+    key_3 = ReprKey(path="some/other/file_3", hash="hash", tag="tag")
+    for key in (key_1, key_2, key_3):
+        store.write(key, np.array(["some-value"]))
+
+    assert set(store.list(prefix="some/")) == {key_1, key_2, key_3}
+    assert set(store.list(prefix="some/dir/")) == {key_1, key_2}
+    assert set(store.list(prefix="some/other/file_")) == {key_3}
+    assert set(store.list(prefix="some/%")) == set()
+    assert set(store.list(prefix="unknown")) == set()
+
+
+@use_store
+def test_list_partition(store):
+    keys = {make_key() for _ in range(20)}
+    for key in keys:
+        store.write(key, np.array(["some-value"]))
+
+    partitions = [set(store.list(partition=(index, 3))) for index in range(3)]
+    assert set.union(*partitions) == keys
+    assert sum(map(len, partitions)) == len(keys)
+
+
+@use_store
+def test_list_check(store):
+    key_1, key_2 = make_key(), make_key()
+    store.write(key_1, np.array(["value-1"]))
+    store.write(key_2, np.array(["value-2"]))
+
+    # Remove representation file of the first key
+    pattern = os.path.join(store.directory, "**/*.npy")
+    for path in glob(pattern, recursive=True):
+        if np.load(path) == np.array(["value-1"]):
+            os.remove(path)
+
+    assert set(store.list()) == {key_1, key_2}
+    assert set(store.list(check=True)) == {key_2}
+
+
+@use_store
+def test_write_many(store):
+    data_as_dict = dict(make_entry() for _ in range(25))
+
+    store.write_many(data_as_dict.items(), commit_interval=10)
+    assert bulk_read(store) == data_as_dict
+
+    # Rewrite existing entries
+    updated = {key: np.array([str(uuid())])
+               for key in islice(data_as_dict.keys(), 0, 5)}
+    store.write_many(updated.items(), commit_interval=10)
+    assert bulk_read(store) == {**data_as_dict, **updated}
+
+
+@use_store
+def test_exists_many(store):
+    key_1, key_2, key_3 = make_key(), make_key(), make_key()
+    bulk_write(store, {key_1: np.array(["some-value"]),
+                       key_3: np.array(["some-value"])})
+
+    keys = [key_1, key_2, key_3, copy(key_1, tag="other")]
+    assert store.exists_many(keys) == [True, False, True, False]
+    assert store.exists_many([]) == []
+
+
+def test_lmdb_batch():
+    with tempfile.TemporaryDirectory(prefix="repr-store-") as directory:
+        store = LMDBReprStorage(directory)
+        key_1, key_2 = make_key(), make_key()
+
+        with pytest.raises(RuntimeError):
+            with store.batch(commit_interval=10) as write:
+                write(key_1, np.array(["some-value"]))
+                raise RuntimeError()
+
+        # Completed writes are committed
+        assert store.exists(key_1)
+
+        with store.batch() as write:
+            write(key_2, np.array(["some-value"]))
+        assert set(store.list()) == {key_1, key_2}
+
+
+@use_store
+def test_bulk_read_derived(store):
+    with tempfile.TemporaryDirectory(prefix="repr-store-") as directory:
+        derived = type(store)(directory=directory)
+        source_data = {make_key(): np.array([value]) for value in range(10)}
+        bulk_write(store, source_data)
+        calls = []
+
+        def derive(values):
+            calls.append(len(values))
+            return values * 2
+
+        keys, values = bulk_read_derived(store, derived, derive)
+        expected = {key: value * 2 for key, value in source_data.items()}
+        assert dict(zip(keys, values)) == expected
+        assert calls == [10]
+
+        # Only new source values are processed
+        new_key = make_key()
+        store.write(new_key, np.array([100]))
+        keys, values = bulk_read_derived(store, derived, derive)
+        assert dict(zip(keys, values))[new_key] == np.array([200])
+        assert len(keys) == 11
+        assert calls == [10, 1]
+
+        # Derived values with outdated tag are recomputed
+        outdated_key = next(iter(source_data.keys()))
+        store.write(copy(outdated_key, tag="other"), np.array([0]))
+        keys, values = bulk_read_derived(store, derived, derive, save=False)
+        assert len(keys) == 11
+        assert calls == [10, 1, 1]
+        assert not derived.exists(copy(outdated_key, tag="other"))
@@ -0,0 +1,58 @@
+import tempfile
+from uuid import uuid4 as uuid
+
+import pytest
+from dataclasses import replace
+
+from winnow.storage.repr_key import ReprKey
+from winnow.storage.watermark import Watermark
+
+
+@pytest.fixture
+def watermark():
+    """Create an empty watermark in a temporary directory."""
+    with tempfile.TemporaryDirectory(prefix="watermark-") as directory:
+        yield Watermark(directory)
+
+
+def make_key():
+    """Make some repr storage key."""
+    unique = uuid()
+    return ReprKey(path=f"some/path-{unique}", hash=f"some-hash-{unique}",
+                   tag=f"some-tag-{unique}")
+
+
+def test_empty(watermark):
+    keys = [make_key() for _ in range(3)]
+    assert len(watermark) == 0
+    assert watermark.new_keys(keys) == keys
+
+
+def test_update(watermark):
+    keys = [make_key() for _ in range(5)]
+    watermark.update(keys[:3])
+
+    assert len(watermark) == 3
+    assert watermark.is_processed(keys[0])
+    assert not watermark.is_processed(keys[4])
+    assert watermark.new_keys(keys) == keys[3:]
+
+
+def test_changed_keys(watermark):
+    key = make_key()
+    watermark.update([key])
+
+    assert not watermark.is_processed(replace(key, hash="other-hash"))
+    assert not watermark.is_processed(replace(key, tag="other-tag"))
+
+    watermark.update([replace(key, hash="other-hash")])
+    assert not watermark.is_processed(key)
+    assert len(watermark) == 1
+
+
+def test_reset(watermark):
+    keys = [make_key() for _ in range(3)]
+    watermark.update(keys)
+    watermark.reset()
+    assert len(watermark) == 0
+    assert watermark.new_keys(keys) == keys
@@ -0,0 +1,33 @@
+import os
+import tempfile
+
+import pytest
+
+# winnow.utils package requires OpenCV
+pytest.importorskip("cv2")
+
+from winnow.config import Config  # noqa: E402
+from winnow.utils import reprkey_resolver  # noqa: E402
+
+
+@pytest.fixture
+def config():
+    """Create config with sources and representations in a temp directory."""
+    with tempfile.TemporaryDirectory(prefix="reprkey-") as directory:
+        config = Config()
+        config.sources.root = os.path.join(directory, "sources")
+        config.repr.directory = os.path.join(directory, "repr")
+        os.makedirs(config.sources.root)
+        yield config
+
+
+def test_multiple_resolvers(config):
+    path = os.path.join(config.sources.root, "video.mp4")
+    with open(path, "w") as file:
+        file.write("content")
+
+    first = reprkey_resolver(config)
+    second = reprkey_resolver(config)
+
+    assert first(path) == second(path)
+    assert first(path).path == "video.mp4"
@@ -0,0 +1,50 @@
+import os
+import tempfile
+
+import pytest
+
+# winnow.utils package requires OpenCV
+pytest.importorskip("cv2")
+
+from winnow.utils.scanner import iter_files  # noqa: E402
+
+
+@pytest.fixture
+def directory():
+    """Create a temporary directory with some files."""
+    with tempfile.TemporaryDirectory(prefix="scanner-") as directory:
+        for path in ["a.mp4", "b.txt", "sub/c.mp4", "sub/deep/d.webm",
+                     "sub/deep/e.mp4.txt", ".hidden.mp4", ".hidden/f.mp4"]:
+            full_path = os.path.join(directory, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "w") as file:
+                file.write(path)
+        yield directory
+
+
+def found(directory, **kwargs):
+    return {os.path.relpath(file.path, directory)
+            for file in iter_files(directory, **kwargs)}
+
+
+def test_all_files(directory):
+    assert found(directory) == {"a.mp4", "b.txt", "sub/c.mp4",
+                                "sub/deep/d.webm", "sub/deep/e.mp4.txt"}
+
+
+def test_extensions(directory):
+    found_files = found(directory, extensions=["mp4", "webm"], threads=2)
+    assert found_files == {"a.mp4", "sub/c.mp4", "sub/deep/d.webm"}
+
+
+def test_stat(directory):
+    files = list(iter_files(directory, extensions=["mp4"], stat=True))
+    assert len(files) == 2
+    for file in files:
+        assert file.stat.size == os.path.getsize(file.path)
+        assert file.stat.inode == os.stat(file.path).st_ino
+
+
+def test_symlink_loop(directory):
+    os.symlink(directory, os.path.join(directory, "sub", "loop"))
+    assert found(directory, extensions=["mp4"]) == {"a.mp4", "sub/c.mp4"}
@@ -0,0 +1,79 @@
+import os
+import tempfile
+from dataclasses import asdict
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# winnow.utils package requires OpenCV and scipy
+pytest.importorskip("cv2")
+distance = pytest.importorskip("scipy.spatial.distance")
+
+from winnow.storage.repr_key import ReprKey  # noqa: E402
+from winnow.utils.scene_detection import (  # noqa: E402
+    cosine_series, scene_durations, extract_scenes, drop_saved_scenes)
+
+
+def make_video(scenes, frames_per_scene=5, dimensions=64, seed=0):
+    """Make frame features of a video of similar frames within each scene."""
+    random = np.random.RandomState(seed)
+    scene_features = random.rand(scenes, dimensions)
+    features = np.repeat(scene_features, frames_per_scene, axis=0)
+    return (features + random.rand(*features.shape) * 0.01).astype(np.float32)
+
+
+def test_cosine_series():
+    features = make_video(scenes=10)
+    expected = [1.0] + [distance.cosine(features[i], features[i + 1])
+                        for i in range(len(features) - 1)]
+
+    assert np.allclose(cosine_series(features), expected, atol=1e-6)
+    assert list(cosine_series(features[:1])) == [1.0]
+
+
+def test_cosine_series_blank_frames():
+    features = make_video(scenes=2)
+    features[3] = 0
+
+    series = cosine_series(features)
+    assert np.isnan(series[3]) and np.isnan(series[4])
+    assert not np.isnan(np.delete(series, [3, 4])).any()
+
+
+def test_scene_durations():
+    features = make_video(scenes=10, frames_per_scene=10)
+
+    # The first frame starts a scene, the last scene ends at the last frame
+    assert list(scene_durations(features)) == [10] * 9 + [9]
+
+
+def test_extract_scenes_stream():
+    videos = {ReprKey(f"path-{i}", f"hash-{i}"):
+              make_video(scenes=i + 3, seed=i) for i in range(10)}
+
+    loaded = extract_scenes(videos, minimum_duration=10)
+    streamed = extract_scenes(iter(videos.items()), minimum_duration=10)
+
+    assert streamed.video_filename == loaded.video_filename
+    assert streamed.scene_duration_seconds == loaded.scene_duration_seconds
+    assert streamed.scenes_timestamp == loaded.scenes_timestamp
+    assert loaded.video_duration_seconds == [
+        len(features) for features in videos.values()]
+
+
+def test_drop_saved_scenes():
+    videos = {ReprKey(f"path-{i}", f"hash-{i}"):
+              make_video(scenes=i + 3, seed=i) for i in range(5)}
+    with tempfile.TemporaryDirectory(prefix="scenes-") as directory:
+        report_path = os.path.join(directory, "scene_metadata.csv")
+        scenes = extract_scenes(videos, minimum_duration=10)
+        pd.DataFrame(asdict(scenes)).to_csv(report_path)
+
+        assert drop_saved_scenes(report_path, ["missing"]) == len(videos)
+        dropped = ["path-1", "path-3"]
+        assert drop_saved_scenes(report_path, dropped) == len(videos) - 2
+
+        saved = pd.read_csv(report_path, index_col=0)
+        assert list(saved.video_filename) == ["path-0", "path-2", "path-4"]
+        assert list(saved.index) == [0, 1, 2]
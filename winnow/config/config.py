@@ -15,6 +15,8 @@ class SourcesConfig:
 class RepresentationConfig:
     """Configuration of intermediate representation storage."""
     directory: str = None  # Root folder with intermediate representations
+    # Storage of video-level features and signatures: "lmdb" or "matrix"
+    vector_storage: str = "lmdb"
 
 
 @dataclass
@@ -29,12 +31,27 @@ class ProcessingConfig:
     """Configuration for processing routine."""
     video_list_filename: str = None
     match_distance: float = 0.75
+    # Signature index method: "ivf" (approximate) or "brute_force" (exact)
+    match_index: str = "ivf"
+    # Number of inverted lists visited by each query of the "ivf" index
+    match_index_probes: int = 16
+    # Number of signatures compared at once, bounds memory used by matching
+    match_block_size: int = 4096
     filter_dark_videos: bool = True
     filter_dark_videos_thr: int = 2
     min_video_duration_seconds: int = 3
     detect_scenes: bool = True
     pretrained_model_local_path: str = None
     frame_sampling: int = 1
+    # Number of video decoding processes per inference worker
+    decode_workers: int = 4
+    # Number of feature extraction processes, each with its own model session
+    inference_workers: int = 1
+    # Number of frames fed to the network at once
+    inference_batch_size: int = 16
+    # Padding of incomplete batches: None, "zeros" or "repeat"
+    inference_padding: str = None
+    hash_threads: int = 4  # Number of video files hashed concurrently
     save_frames: bool = True
     keep_fileoutput: bool = True
 
@@ -43,6 +60,8 @@ class ProcessingConfig:
 class TemplatesConfig:
     """Configuration for template matching."""
     source_path: str = None
+    # Frame index method: "ivf" (approximate) or "brute_force" (exact)
+    frame_index: str = "ivf"
 
 
 @dataclass
@@ -0,0 +1,195 @@
+from collections import deque
+
+import numpy as np
+from dataclasses import dataclass, field
+
+
+@dataclass
+class PackedFeatures:
+    """Features extracted from a chunk of frames."""
+    owner: object  # owner of the frames (e.g. video path or ReprKey)
+    features: np.ndarray  # features of each frame of the chunk
+    frames: np.ndarray  # the original chunk of frames
+
+
+@dataclass
+class PackedError:
+    """Feature extraction failure of a batch containing the owner's frames."""
+    owner: object  # owner of the frames (e.g. video path or ReprKey)
+    error: Exception  # the raised exception
+
+
+@dataclass
+class _Chunk:
+    """Chunk of frames waiting for feature extraction."""
+    owner: object
+    frames: np.ndarray
+    offset: int = 0  # number of frames already sent to the network
+    results: list = field(default_factory=list)  # extracted features
+
+    @property
+    def remaining(self):
+        return len(self.frames) - self.offset
+
+
+class BatchPacker:
+    """Packs frames of multiple videos into full inference batches.
+
+    Short videos have fewer frames than a single batch, so feeding each
+    video separately leaves batches mostly empty. The packer collects
+    chunks of frames belonging to different owners (e.g. videos) and runs
+    the network only when a full batch is collected. The resulting
+    features are scattered back to the owning chunks using frame offsets.
+
+    The output preserves the input order: features of a chunk are
+    produced when all of its frames are processed, and markers (e.g.
+    end-of-video notifications) are produced after all the chunks added
+    before them.
+    """
+
+    def __init__(self, extract, batch_size):
+        """Create a new packer.
+
+        Args:
+            extract: Function mapping a batch of frames to the array of frame
+                features.
+            batch_size (int): Number of frames in a full batch.
+        """
+        self.extract = extract
+        self.batch_size = batch_size
+        self._pending = deque()
+        self._pending_frames = 0
+
+    @property
+    def pending_frames(self):
+        """Number of frames waiting for feature extraction."""
+        return self._pending_frames
+
+    def add(self, owner, frames):
+        """Add a chunk of the owner's frames.
+
+        Returns:
+            List of ready outputs (PackedFeatures, PackedError or markers).
+        """
+        self._pending.append(_Chunk(owner, frames))
+        self._pending_frames += len(frames)
+        outputs = []
+        while self._pending_frames >= self.batch_size:
+            outputs.extend(self._run_batch())
+        outputs.extend(self._release())
+        return outputs
+
+    def mark(self, marker):
+        """Add a marker produced after all the previously added chunks.
+
+        Returns:
+            List of ready outputs (PackedFeatures, PackedError or markers).
+        """
+        self._pending.append(marker)
+        return self._release()
+
+    def flush(self):
+        """Process all pending frames running an incomplete batch if needed.
+
+        Returns:
+            List of ready outputs (PackedFeatures, PackedError or markers).
+        """
+        outputs = []
+        while self._pending_frames > 0:
+            outputs.extend(self._run_batch())
+        outputs.extend(self._release())
+        return outputs
+
+    def discard(self, owners):
+        """Discard all pending chunks of the given owners."""
+        owners = set(owners)
+        for item in list(self._pending):
+            if isinstance(item, _Chunk) and item.owner in owners:
+                self._pending.remove(item)
+                self._pending_frames -= item.remaining
+
+    def _run_batch(self):
+        """Extract features of the next batch of pending frames."""
+        parts, size = [], 0
+        for item in self._pending:
+            if not isinstance(item, _Chunk) or item.remaining == 0:
+                continue
+            taken = min(self.batch_size - size, item.remaining)
+            parts.append((item, item.offset, item.offset + taken))
+            size += taken
+            if size == self.batch_size:
+                break
+        results = self._extract_parts(parts)
+        failed = {}
+        for (item, start, stop), result in zip(parts, results):
+            if isinstance(result, Exception):
+                failed.setdefault(item.owner, result)
+                continue
+            item.results.append(result)
+            item.offset = stop
+            self._pending_frames -= stop - start
+        self.discard(failed.keys())
+        return [PackedError(owner, error) for owner, error in failed.items()]
+
+    def _extract_parts(self, parts):
+        """Extract features of the batch consisting of the given parts.
+
+        If extraction of the packed batch fails, each part is retried
+        separately, so that a single broken video doesn't fail the others.
+
+        Returns:
+            List of features or exceptions for each part.
+        """
+        if len(parts) == 1:
+            item, start, stop = parts[0]
+            batch = item.frames[start:stop]
+        else:
+            batch = np.concatenate([
+                item.frames[start:stop] for item, start, stop in parts])
+        try:
+            features = self.extract(batch)
+        except Exception as error:
+            if len(parts) == 1:
+                return [error]
+            return [self._extract_or_error(item.frames[start:stop])
+                    for item, start, stop in parts]
+        results, position = [], 0
+        for _, start, stop in parts:
+            results.append(features[position:position + stop - start])
+            position += stop - start
+        return results
+
+    def _extract_or_error(self, frames):
+        """Extract features returning exception on failure."""
+        try:
+            return self.extract(frames)
+        except Exception as error:
+            return error
+
+    def _release(self):
+        """Pop completed chunks and markers from the head of the queue."""
+        outputs = []
+        while self._pending:
+            item = self._pending[0]
+            if isinstance(item, _Chunk) and item.remaining > 0:
+                break
+            self._pending.popleft()
+            if isinstance(item, _Chunk):
+                outputs.append(self._pack(item))
+            else:
+                outputs.append(item)
+        return outputs
+
+    def _pack(self, item):
+        """Collect features of the completed chunk."""
+        if len(item.results) == 1:
+            features = item.results[0]
+        elif len(item.results) == 0:
+            # Empty chunk, the network defines shape of the empty features
+            features = self._extract_or_error(item.frames)
+            if isinstance(features, Exception):
+                self.discard([item.owner])
+                return PackedError(item.owner, features)
+        else:
+            features = np.concatenate(item.results)
+        return PackedFeatures(item.owner, features, item.frames)
@@ -1,11 +1,15 @@
 import logging
+import multiprocessing
 import os
-from multiprocessing import Pool
+import queue
+from functools import partial
 
-import numpy as np
 from tqdm import tqdm
 
-from .model_tf import CNN_tf
+from winnow.storage.repr_storage import ReprStorage
+from .model_registry import models
+from .model_tf import CNN_tf, FrozenCNN, TFLiteCNN, frozen_model_path
+from .pipeline import ExtractionPipeline, StageCounters
 from .utils import load_video
 
 logger = logging.getLogger()
@@ -28,13 +32,15 @@ def feature_extraction_videos(model,
                               cores=4,
                               batch_sz=8,
                               frame_sampling=1,
-                              save_frames=False):
+                              save_frames=False,
+                              inference_workers=1,
+                              model_factory=None):
     """
     Function that extracts the intermediate CNN features
     of each video in a provided video list.
     Args:
-        model: CNN network
-        cores: CPU cores for the parallel video loading
+        model: CNN network (not used when inference_workers > 1)
+        cores: CPU cores for the parallel video loading (per inference worker)
         batch_sz: batch size fed to the CNN network
         video_list: list of video to extract features
         reprs (winnow.storage.repr_storage.ReprStorage): storage of
@@ -43,73 +49,195 @@ def feature_extraction_videos(model,
         storage key.
         frame_sampling: Minimal distance (in sec.) between frames to be saved.
         save_frames: Save normalized video frames.
+        inference_workers: Number of worker processes running their own
+        CNN network, each pinned to a separate subset of CPU cores.
+        model_factory: Function to create CNN network in worker processes,
+        accepts intra_op_threads and inter_op_threads keyword arguments.
     """
-    video_list = {
-                 i: video.strip()
-                 for i, video in
-                 enumerate(open(video_list, encoding="utf-8").readlines())}
+    with open(video_list, encoding="utf-8") as file:
+        video_list = [video.strip() for video in file.readlines()]
 
     print('\nNumber of videos: ', len(video_list))
     print('Storage directory: ', reprs)
     print('CPU cores: ', cores)
+    print('Inference workers: ', inference_workers)
     print('Batch size: ', batch_sz)
 
     print('\nFeature Extraction Process')
     print('==========================')
 
-    pool = Pool(cores)
-    future_videos = dict()
+    options = dict(
+        decode_workers=cores,
+        batch_size=batch_sz,
+        frame_sampling=frame_sampling,
+        save_frames=save_frames)
+    progress_bar = tqdm(total=len(video_list), mininterval=1.0, unit='video')
+    if inference_workers > 1:
+        counters = _run_inference_workers(
+            model_factory, video_list, reprs, reprkey, inference_workers,
+            options, progress_bar)
+    else:
+        pipeline = ExtractionPipeline(
+            model=model, reprs=reprs, reprkey=reprkey, **options)
+        counters = pipeline.run(video_list, progress=progress_bar)
+    progress_bar.close()
+
+    for stage_counters in counters.values():
+        print(stage_counters)
+
+
+def core_subsets(workers, cores=None):
+    """
+    Split available CPU cores into contiguous disjoint subsets,
+    one subset per worker. If there are more workers than cores,
+    each worker gets a single (shared) core.
+    """
+    if cores is None:
+        if hasattr(os, 'sched_getaffinity'):
+            cores = os.sched_getaffinity(0)
+        else:
+            cores = range(os.cpu_count())
+    cores = sorted(cores)
+    if workers >= len(cores):
+        return [[cores[i % len(cores)]] for i in range(workers)]
+    bounds = [len(cores) * i // workers for i in range(workers + 1)]
+    return [cores[bounds[i]:bounds[i + 1]] for i in range(workers)]
+
+
+class _ProgressProxy:
+    """Progress bar proxy forwarding updates to the parent process."""
+
+    def __init__(self, events):
+        self.events = events
+
+    def update(self, count=1):
+        self.events.put(('progress', count))
+
 
-    progress_bar = tqdm(
-                        range(np.max(list(video_list.keys()))+1),
-                        mininterval=1.0,
-                        unit='video')
-    for video in progress_bar:
+def _inference_worker(model_factory, cores, videos, events, storage, options):
+    """Run extraction pipeline on videos from the shared queue.
 
+    This is the inference worker entry point. The worker runs in a spawned
+    process, so it opens its own representation storage. Videos arrive as
+    (path, storage key) pairs as the key resolver is not picklable.
+    """
+    try:
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cores)
+        model = model_factory(
+            intra_op_threads=len(cores), inter_op_threads=1)
+        reprs = ReprStorage(*storage)
+        keys = dict()
+
+        def video_paths():
+            for path, key in iter(videos.get, None):
+                keys[path] = key
+                yield path
+
+        pipeline = ExtractionPipeline(
+            model=model, reprs=reprs, reprkey=keys.__getitem__, **options)
+        counters = pipeline.run(
+            video_paths(), progress=_ProgressProxy(events))
+        events.put(('done', counters))
+    except Exception as e:
+        logger.error('Inference worker failed')
+        logger.error(e)
+        events.put(('done', None))
+
+
+def _run_inference_workers(model_factory, video_list, reprs, reprkey,
+                           workers, options, progress_bar):
+    """Extract features using multiple inference worker processes.
+
+    Workers share a single queue of videos. Worker processes are spawned
+    rather than forked, because LMDB environments opened by the parent
+    process cannot be used nor reopened in a forked child.
+    """
+    context = multiprocessing.get_context('spawn')
+    videos, events = context.Queue(), context.Queue()
+    counters = dict(decode=StageCounters('decode'))
+    _schedule_videos(video_list, reprkey, videos, counters['decode'])
+    for _ in range(workers):
+        videos.put(None)
+
+    storage = (reprs.directory, reprs.storage_factory,
+               reprs.vector_storage_factory)
+    processes = [context.Process(
+                    target=_inference_worker,
+                    args=(model_factory, cores, videos, events, storage,
+                          options))
+                 for cores in core_subsets(workers)]
+    for process in processes:
+        process.start()
+    _collect_events(events, processes, counters, progress_bar)
+    for process in processes:
+        process.join()
+    return counters
+
+
+def _schedule_videos(video_list, reprkey, videos, counters):
+    """Put (path, storage key) pairs of the videos to the shared queue.
+
+    Videos whose storage key cannot be resolved are logged and skipped.
+    """
+    for video in video_list:
         try:
-            video_file_path = video_list[video]
-            progress_bar.set_postfix(video=os.path.basename(video_file_path))
-            if os.path.exists(video_file_path):
-
-                if video not in future_videos:
-                    video_tensor = pload_video(
-                                        video_file_path,
-                                        model.desired_size,
-                                        frame_sampling)
-
-                else:
-                    video_tensor = future_videos[video].get()
-                    del future_videos[video]
-
-                # load videos in parallel
-                for i in range(cores - len(future_videos)):
-                    next_video = np.max(list(future_videos.keys())) + 1 \
-                        if len(future_videos) else video + 1
-
-                    if next_video in video_list and \
-                        next_video not in future_videos and \
-                            os.path.exists(video_list[next_video]):
-                        future_videos[next_video] = pool.apply_async(
-                            pload_video,
-                            args=[
-                                video_list[next_video],
-                                model.desired_size, frame_sampling])
-
-                # extract features
-                features = model.extract(video_tensor, batch_sz)
-
-                # save features
-                key = reprkey(video_file_path)
-                reprs.frame_level.write(key, features)
-                if save_frames:
-                    reprs.frames.write(key, video_tensor)
+            videos.put((video, reprkey(video)))
         except Exception as e:
-            logger.error(f'Error processing file:{video_list[video]}')
+            logger.error(f'Error processing file:{video}')
             logger.error(e)
+            counters.errors += 1
 
 
-def load_featurizer(PRETRAINED_LOCAL_PATH):
-
-    model = CNN_tf('vgg', PRETRAINED_LOCAL_PATH)
+def _collect_events(events, processes, counters, progress_bar):
+    """Update progress and merge counters reported by inference workers."""
+    finished = 0
+    while finished < len(processes):
+        try:
+            kind, value = events.get(timeout=10)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                logger.error('Inference workers terminated unexpectedly')
+                break
+            continue
+        if kind == 'progress':
+            progress_bar.update(value)
+        else:
+            finished += 1
+            for name, stage_counters in (value or {}).items():
+                stage = counters.setdefault(name, StageCounters(name))
+                stage.merge(stage_counters)
+
+
+def load_featurizer(PRETRAINED_LOCAL_PATH, padding=None,
+                    intra_op_threads=None, inter_op_threads=None):
+    """
+    Load feature extractor. The path may point to the exported
+    inference artifact (frozen '.pb' graph or quantized '.tflite'
+    model) or to the checkpoint. If the frozen graph was exported
+    next to the checkpoint (see export_featurizer.py), the frozen
+    graph is loaded instead of the checkpoint.
+
+    The model is loaded once per process and shared by all the
+    subsequent calls with the same arguments (see ModelRegistry).
+    """
+    key = ('featurizer', PRETRAINED_LOCAL_PATH, padding, intra_op_threads,
+           inter_op_threads)
+    return models.get(key, partial(_create_featurizer, PRETRAINED_LOCAL_PATH,
+                                   padding=padding,
+                                   intra_op_threads=intra_op_threads,
+                                   inter_op_threads=inter_op_threads))
+
+
+def _create_featurizer(PRETRAINED_LOCAL_PATH, **options):
+    """Create a new feature extractor (see load_featurizer)."""
+    if PRETRAINED_LOCAL_PATH.endswith('.tflite'):
+        return TFLiteCNN(PRETRAINED_LOCAL_PATH, **options)
+    if PRETRAINED_LOCAL_PATH.endswith('.pb'):
+        return FrozenCNN(PRETRAINED_LOCAL_PATH, **options)
+    if os.path.exists(frozen_model_path(PRETRAINED_LOCAL_PATH)):
+        return FrozenCNN(frozen_model_path(PRETRAINED_LOCAL_PATH), **options)
+
+    model = CNN_tf('vgg', PRETRAINED_LOCAL_PATH, **options)
 
     return model
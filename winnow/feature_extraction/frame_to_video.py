@@ -11,5 +11,5 @@ class FrameToVideoRepresentation:
         """
         self.reps = reps
 
-    def start(self):
-        frame_to_global(self.reps)
+    def start(self, override=False):
+        frame_to_global(self.reps, override=override)
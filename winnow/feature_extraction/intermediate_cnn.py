@@ -1,3 +1,5 @@
+from functools import partial
+
 from .extraction_routine import feature_extraction_videos, load_featurizer
 from .model import default_model_path
 
@@ -11,7 +13,9 @@ class IntermediateCnnExtractor:
                  reprkey,
                  frame_sampling=1,
                  save_frames=False,
-                 model=None):
+                 model=None,
+                 model_path=None,
+                 padding=None):
 
         self.video_src = video_src
         self.reprs = reprs
@@ -19,10 +23,20 @@ class IntermediateCnnExtractor:
         self.frame_sampling = frame_sampling
         self.save_frames = save_frames
         self.model = model
+        self.model_path = model_path
+        self.padding = padding
 
-    def start(self, batch_size=8, cores=4):
+    def start(self, batch_size=8, cores=4, inference_workers=1):
         print('Starting feature extraction process: {}'.format(self.video_src))
-        self.model = self.model or load_featurizer(default_model_path())
+        model_path = self.model_path or default_model_path()
+        if inference_workers > 1:
+            # Each worker process creates its own model
+            model_factory = partial(
+                load_featurizer, model_path, padding=self.padding)
+        else:
+            model_factory = None
+            self.model = self.model or load_featurizer(
+                model_path, padding=self.padding)
         feature_extraction_videos(
             model=self.model,
             video_list=self.video_src,
@@ -31,4 +45,6 @@ class IntermediateCnnExtractor:
             batch_sz=batch_size,
             cores=cores,
             frame_sampling=self.frame_sampling,
-            save_frames=self.save_frames)
+            save_frames=self.save_frames,
+            inference_workers=inference_workers,
+            model_factory=model_factory)
@@ -7,6 +7,9 @@ from sklearn.metrics import precision_recall_curve
 from scipy.spatial.distance import cdist
 import logging
 
+from winnow.storage.repr_utils import (
+    bulk_write, bulk_read_iter, BulkReadReport)
+
 logger = logging.getLogger("winnow")
 logger.setLevel(logging.ERROR)
 output_file_handler = logging.FileHandler("processing_error.log")
@@ -98,29 +101,81 @@ def global_vector(frame_feature_vector):
         return np.array([])
 
 
-def frame_to_global(representations):
+class GlobalVectorAccumulator:
+    """
+      Incremental calculation of the global feature vector (see
+      global_vector) from chunks of the frame features vectors,
+      so that the whole frame-level representation is never
+      required to be in memory.
+    """
+
+    def __init__(self):
+        self._sum = None
+        self._count = 0
+        self._dtype = None
+
+    def add(self, frame_features):
+        """
+          Add chunk of the frame features vectors.
+
+          Args:
+            frame_features: frame features vectors (one vector per row)
+        """
+        if len(frame_features) == 0:
+            return
+        X = normalize(np.array(frame_features, copy=True))
+        chunk_sum = X.sum(axis=0, dtype=np.float64)
+        self._sum = chunk_sum if self._sum is None else self._sum + chunk_sum
+        self._count += len(X)
+        self._dtype = X.dtype
+
+    def result(self):
+        """
+          Get the normalized global feature vector of all the added
+          frames (empty array if no frames were added).
+        """
+        if self._count == 0:
+            return np.array([])
+        X = (self._sum / self._count).astype(self._dtype).reshape(1, -1)
+        return normalize(X)
+
+
+def frame_to_global(representations, override=False):
     """
     Calculate and save global feature vectors based on frame-level
-    representation.
+    representation. Video-level representations already saved for
+    the same file hash and configuration tag are not recalculated.
 
     Args:
         representations (winnow.storage.repr_storage.ReprStorage):
         Intermediate representations storage.
+        override (bool): recalculate all the video-level representations
     """
-    for key in representations.frame_level.list():
-        try:
-
-            frame_feature_vector = \
-                representations.frame_level.read(key)
-
-            video_representation = global_vector(frame_feature_vector)
-            representations.video_level.write(
-                                              key,
-                                              video_representation)
-        except Exception as e:
-
-            logger.error(f'Error processing file:{key}')
-            logger.error(e)
+    keys = list(representations.frame_level.list())
+    if not override:
+        converted = representations.video_level.exists_many(keys)
+        keys = [key for key, exists in zip(keys, converted) if not exists]
+
+    report = BulkReadReport()
+
+    def video_representations():
+        frame_level = bulk_read_iter(
+            representations.frame_level, keys, report=report)
+        for key, frame_feature_vector in frame_level:
+            # A malformed entry must not abort the batched writes
+            try:
+                video_representation = global_vector(frame_feature_vector)
+                if video_representation.size == 0:
+                    raise ValueError('Cannot calculate global vector')
+            except Exception as e:
+                logger.error(f'Error processing file:{key}')
+                logger.error(e)
+                continue
+            yield key, video_representation
+
+    # Write video-level representations with batched transactions
+    bulk_write(representations.video_level, video_representations())
+    report.log()
 
 
 def plot_pr_curve(pr_curve, title):
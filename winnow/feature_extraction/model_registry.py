@@ -0,0 +1,50 @@
+import os
+import threading
+
+
+class ModelRegistry:
+    """Registry of the loaded models shared by all stages of the process.
+
+    Loading a model (restoring checkpoint, creating session) is expensive,
+    so each model is loaded once per process and reused by all the stages
+    running in the same process (e.g. feature extraction followed by
+    matching). Models are never shared across processes: a forked child
+    process gets an empty registry, because TensorFlow sessions are not
+    fork-safe.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def get(self, key, factory):
+        """Get the model loading it on the first request.
+
+        Args:
+            key: Hashable model identifier (e.g. tuple of model name, path
+                and options).
+            factory: Function to load the model.
+
+        Returns:
+            The loaded model.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._models = {}
+                self._pid = os.getpid()
+            if key not in self._models:
+                self._models[key] = factory()
+            return self._models[key]
+
+    def __contains__(self, key):
+        return self._pid == os.getpid() and key in self._models
+
+    def clear(self):
+        """Forget all the loaded models."""
+        with self._lock:
+            self._models = {}
+
+
+# Registry of the current process
+models = ModelRegistry()
@@ -27,6 +27,9 @@ This method is also used in:
     Near-Duplicate Video Retrieval with Deep Metric Learning.
     IEEE International Conference on Computer Vision Workshop (ICCVW), 2017.
 """
+import json
+import os
+
 import numpy as np
 import warnings
 with warnings.catch_warnings():
@@ -34,21 +37,69 @@ with warnings.catch_warnings():
     import tensorflow as tf
     tf.compat.v1.logging.set_verbosity(tf.compat.v1.logging.ERROR)
 
+# Supported policies of filling incomplete input batches
+PADDING_POLICIES = (None, 'zeros', 'repeat')
+
+# Suffix of the frozen inference graph exported next to the checkpoint
+FROZEN_SUFFIX = '_frozen.pb'
+
+# Suffix of the quantized TFLite model exported next to the checkpoint
+TFLITE_SUFFIX = '_int8.tflite'
+
+
+def frozen_model_path(model_ckpt, quantized=False):
+    """Get path of the inference artifact exported from the checkpoint."""
+    base, _ = os.path.splitext(model_ckpt)
+    return base + (TFLITE_SUFFIX if quantized else FROZEN_SUFFIX)
+
+
+def session_config(intra_op_threads=None, inter_op_threads=None):
+    """Create TensorFlow session configuration."""
+    config = tf.compat.v1.ConfigProto()
+    config.gpu_options.per_process_gpu_memory_fraction = 0.90
+    config.gpu_options.allow_growth = True
+    if intra_op_threads is not None:
+        config.intra_op_parallelism_threads = intra_op_threads
+    if inter_op_threads is not None:
+        config.inter_op_parallelism_threads = inter_op_threads
+    return config
+
+
+def _read_artifact_metadata(path):
+    """Read metadata of the exported inference artifact."""
+    with open(path + '.json') as file:
+        return json.load(file)
+
 
 class CNN_tf():
 
-    def __init__(self, name, model_ckpt):
+    def __init__(self, name, model_ckpt, padding=None, intra_op_threads=None,
+                 inter_op_threads=None):
         """
           Class initializer.
 
           Args:
             name: name of the CNN network
             model_ckpt: path to ckpt file of the pre-trained CNN model
+            padding: policy of filling incomplete batches, so that all
+              batches fed to the network have the same static shape:
+              None - feed incomplete batches as is,
+              'zeros' - pad with blank frames,
+              'repeat' - pad with copies of the last frame
+            intra_op_threads: number of threads used by a single
+              operation (default is chosen by TensorFlow)
+            inter_op_threads: number of operations executed in
+              parallel (default is chosen by TensorFlow)
 
           Raise:
             ValueError: if provided network name is not provided
         """
+        if padding not in PADDING_POLICIES:
+            raise ValueError(
+                'Supported padding policies: {}'.format(PADDING_POLICIES))
         self.net_name = name
+        self.padding = padding
+        self._input_buffer = None
 
         # intermediate convolutional layers to extract features
         if name == 'inception':
@@ -108,14 +159,12 @@ class CNN_tf():
                         tf.nn.relu(net[lay]), 3, epsilon=1e-15),
                       axis=(1, 2)), 1, epsilon=1e-15) for lay in self.layers]
 
-        self.output = tf.concat(net, axis=1)
-        self.final_sz = self.output.get_shape()[1]
+        self.output = tf.concat(net, axis=1, name='features')
+        self.final_sz = int(self.output.get_shape()[1])
 
         init = self.load_model(model_ckpt)
-        config = tf.compat.v1.ConfigProto()
-        config.gpu_options.per_process_gpu_memory_fraction = 0.90
-        config.gpu_options.allow_growth = True
-        self.sess = tf.compat.v1.Session(config=config)
+        self.sess = tf.compat.v1.Session(
+            config=session_config(intra_op_threads, inter_op_threads))
         self.sess.run(init)
 
     def load_model(self, model_ckpt):
@@ -144,6 +193,44 @@ class CNN_tf():
         tf_init = tf.compat.v1.global_variables_initializer()
         return tf_init
 
+    def export(self, path, quantize=False):
+        """
+          Export optimized inference artifact. The variables are
+          folded into constants and all the operations not needed
+          to compute the intermediate features (e.g. fully connected
+          layers) are stripped. Artifact metadata is saved to the
+          '<path>.json' file.
+
+          Args:
+            path: path of the exported artifact
+            quantize: save TFLite model with int8-quantized weights
+              instead of the frozen GraphDef
+        """
+        output_name = self.output.op.name
+        graph_def = tf.compat.v1.graph_util.convert_variables_to_constants(
+                        self.sess,
+                        self.sess.graph.as_graph_def(),
+                        [output_name])
+        graph_def = tf.compat.v1.graph_util.remove_training_nodes(
+                        graph_def, protected_nodes=[output_name])
+        if quantize:
+            converter = tf.compat.v1.lite.TFLiteConverter(
+                            graph_def, [self.input], [self.output])
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            artifact = converter.convert()
+        else:
+            artifact = graph_def.SerializeToString()
+        with open(path, 'wb') as file:
+            file.write(artifact)
+        metadata = dict(
+            net_name=self.net_name,
+            desired_size=self.desired_size,
+            final_sz=self.final_sz,
+            input=self.input.name,
+            output=self.output.name)
+        with open(path + '.json', 'w') as file:
+            json.dump(metadata, file)
+
     def vgg_preprocess(self, images):
         """
           VGG preprocessing function applied on the provided
@@ -185,7 +272,7 @@ class CNN_tf():
         images_pre = tf.multiply(images_pre, 2.0)
         return images_pre
 
-    def extract(self, image_tensor, batch_sz):
+    def extract(self, image_tensor, batch_sz, out=None):
         """
           Function that extracts intermediate CNN features for
           each input image.
@@ -193,14 +280,137 @@ class CNN_tf():
           Args:
             image_tensor: numpy tensor of input images
             batch_sz: batch size
+            out: optional preallocated float32 array of shape
+              (len(image_tensor), final_sz) for the extracted features
 
           Returns:
             features: extracted features from each input image
         """
-        features = np.empty((image_tensor.shape[0], self.final_sz))
-        for i in range(image_tensor.shape[0] // batch_sz + 1):
-            batch = image_tensor[i * batch_sz:(i + 1) * batch_sz]
-            if batch.size > 0:
-                features[i * batch_sz:(i + 1) * batch_sz] = \
-                    self.sess.run(self.output, feed_dict={self.input: batch})
-        return features
+        if out is None:
+            out = np.empty((len(image_tensor), self.final_sz),
+                           dtype=np.float32)
+        image_tensor = np.ascontiguousarray(image_tensor, dtype=np.uint8)
+        for start in range(0, len(image_tensor), batch_sz):
+            batch = image_tensor[start:start + batch_sz]
+            size = len(batch)
+            if size < batch_sz and self.padding is not None:
+                batch = self._padded(batch, batch_sz)
+            features = self.sess.run(self.output,
+                                     feed_dict={self.input: batch})
+            out[start:start + size] = features[:size]
+        return out
+
+    def _padded(self, batch, batch_sz):
+        """
+          Copy incomplete batch to the reused fixed-shape input buffer
+          filled according to the padding policy.
+        """
+        shape = (batch_sz,) + batch.shape[1:]
+        if self._input_buffer is None or self._input_buffer.shape != shape:
+            self._input_buffer = np.empty(shape, dtype=np.uint8)
+        buffer = self._input_buffer
+        buffer[:len(batch)] = batch
+        if self.padding == 'zeros':
+            buffer[len(batch):] = 0
+        else:
+            buffer[len(batch):] = batch[-1]
+        return buffer
+
+
+class FrozenCNN(CNN_tf):
+    """
+      CNN feature extractor loaded from the frozen inference
+      graph exported by CNN_tf.export. No graph construction or
+      checkpoint restoring is required.
+    """
+
+    def __init__(self, path, padding=None, intra_op_threads=None,
+                 inter_op_threads=None):
+        """
+          Class initializer.
+
+          Args:
+            path: path to the frozen graph
+            padding: policy of filling incomplete batches (see CNN_tf)
+            intra_op_threads: number of threads used by a single operation
+            inter_op_threads: number of operations executed in parallel
+        """
+        if padding not in PADDING_POLICIES:
+            raise ValueError(
+                'Supported padding policies: {}'.format(PADDING_POLICIES))
+        metadata = _read_artifact_metadata(path)
+        self.net_name = metadata['net_name']
+        self.desired_size = metadata['desired_size']
+        self.final_sz = metadata['final_sz']
+        self.padding = padding
+        self._input_buffer = None
+
+        graph_def = tf.compat.v1.GraphDef()
+        with open(path, 'rb') as file:
+            graph_def.ParseFromString(file.read())
+        graph = tf.Graph()
+        with graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+        self.input = graph.get_tensor_by_name(metadata['input'])
+        self.output = graph.get_tensor_by_name(metadata['output'])
+        self.sess = tf.compat.v1.Session(
+            graph=graph,
+            config=session_config(intra_op_threads, inter_op_threads))
+
+
+class TFLiteCNN(CNN_tf):
+    """
+      CNN feature extractor loaded from the quantized TFLite
+      model exported by CNN_tf.export(..., quantize=True).
+    """
+
+    def __init__(self, path, padding=None, intra_op_threads=None,
+                 inter_op_threads=None):
+        """
+          Class initializer.
+
+          Args:
+            path: path to the TFLite model
+            padding: policy of filling incomplete batches (see CNN_tf)
+            intra_op_threads: number of threads used by the interpreter
+            inter_op_threads: ignored
+        """
+        if padding not in PADDING_POLICIES:
+            raise ValueError(
+                'Supported padding policies: {}'.format(PADDING_POLICIES))
+        metadata = _read_artifact_metadata(path)
+        self.net_name = metadata['net_name']
+        self.desired_size = metadata['desired_size']
+        self.final_sz = metadata['final_sz']
+        self.padding = padding
+        self._input_buffer = None
+        self.interpreter = tf.lite.Interpreter(
+            model_path=path, num_threads=intra_op_threads)
+        self._input_index = self.interpreter.get_input_details()[0]['index']
+        self._output_index = self.interpreter.get_output_details()[0]['index']
+        self._input_shape = None
+
+    def extract(self, image_tensor, batch_sz, out=None):
+        """
+          Function that extracts intermediate CNN features for
+          each input image (see CNN_tf.extract).
+        """
+        if out is None:
+            out = np.empty((len(image_tensor), self.final_sz),
+                           dtype=np.float32)
+        image_tensor = np.ascontiguousarray(image_tensor, dtype=np.uint8)
+        for start in range(0, len(image_tensor), batch_sz):
+            batch = image_tensor[start:start + batch_sz]
+            size = len(batch)
+            if size < batch_sz and self.padding is not None:
+                batch = self._padded(batch, batch_sz)
+            if batch.shape != self._input_shape:
+                self.interpreter.resize_tensor_input(
+                    self._input_index, batch.shape)
+                self.interpreter.allocate_tensors()
+                self._input_shape = batch.shape
+            self.interpreter.set_tensor(self._input_index, batch)
+            self.interpreter.invoke()
+            features = self.interpreter.get_tensor(self._output_index)
+            out[start:start + size] = features[:size]
+        return out
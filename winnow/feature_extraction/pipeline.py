@@ -0,0 +1,365 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from queue import Queue
+
+from dataclasses import dataclass
+
+from winnow.storage.repr_utils import chunk_writer
+from .batching import BatchPacker, PackedFeatures, PackedError
+from .loading_utils import GlobalVectorAccumulator
+from .utils import iter_video_chunks
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the stage output
+_DONE = object()
+
+# Kinds of messages passed between stages
+_CHUNK = "chunk"  # (kind, path, frames) - next chunk of video frames
+_END = "end"  # (kind, path, seconds) - video is completely processed
+_ERROR = "error"  # (kind, path, message) - video processing failed
+_FINISHED = "finished"  # (kind, None, None) - all videos are scheduled
+
+# Output queue of the current decode worker process
+_worker_output = None
+
+
+def _init_decode_worker(output):
+    """Initialize decode worker process."""
+    global _worker_output
+    _worker_output = output
+
+
+def _decode_video(load_chunks, path, desired_size, frame_sampling, chunk_size):
+    """Decode video sending frame chunks to the output queue.
+
+    This is the decode worker entry point.
+    """
+    started = time.time()
+    try:
+        chunks = load_chunks(path, desired_size, frame_sampling, chunk_size)
+        for chunk in chunks:
+            _worker_output.put((_CHUNK, path, chunk))
+        _worker_output.put((_END, path, time.time() - started))
+    except Exception as e:
+        _worker_output.put((_ERROR, path, str(e)))
+
+
+@dataclass
+class StageCounters:
+    """Throughput counters of a single pipeline stage."""
+    name: str
+    videos: int = 0  # number of processed videos
+    frames: int = 0  # number of processed frames
+    errors: int = 0  # number of failed videos
+    # time spent on processing (excluding waiting for the neighbour stages)
+    busy_seconds: float = 0.0
+
+    def record(self, frames, seconds, videos=0):
+        """Record processed frames."""
+        self.videos += videos
+        self.frames += frames
+        self.busy_seconds += seconds
+
+    def merge(self, other):
+        """Add counters of the same stage collected by another worker."""
+        self.videos += other.videos
+        self.frames += other.frames
+        self.errors += other.errors
+        self.busy_seconds += other.busy_seconds
+
+    @property
+    def frames_per_second(self):
+        """Stage throughput."""
+        if self.busy_seconds == 0:
+            return 0.0
+        return self.frames / self.busy_seconds
+
+    def __str__(self):
+        return (f"{self.name}: {self.videos} videos, {self.frames} frames, "
+                f"{self.errors} errors, "
+                f"{self.frames_per_second:.1f} frames/sec")
+
+
+class ExtractionPipeline:
+    """Staged frame-level feature extraction pipeline.
+
+    The pipeline consists of three stages connected by bounded queues:
+        * decode - a pool of worker processes loading sampled video frames.
+        * inference - CNN feature extraction in the calling thread. Frames
+          of multiple videos are packed into full batches (see BatchPacker).
+        * write - a writer thread saving frame-level and video-level features
+          (and optionally frames) to the representation storage.
+
+    The stages run concurrently, so the model doesn't wait for decoding or
+    storage writes. Videos are passed between stages in chunks of at most
+    chunk_size frames and are written to the storage incrementally, so no
+    stage ever holds a whole video. Bounded queues provide backpressure:
+    decoders stop when inference falls behind and inference stops when the
+    writer falls behind, so the memory usage is bounded by the queue and
+    chunk sizes rather than by the video length.
+    """
+
+    def __init__(self, model, reprs, reprkey, decode_workers=4, batch_size=8,
+                 frame_sampling=1, save_frames=False,
+                 chunk_size=None, queue_size=None,
+                 load_chunks=iter_video_chunks):
+        """Create a new pipeline.
+
+        Args:
+            model: CNN network (e.g. CNN_tf).
+            reprs (winnow.storage.repr_storage.ReprStorage): storage of video
+                features.
+            reprkey: function to convert video file paths to representation
+                storage key.
+            decode_workers (int): Number of video decoding processes.
+            batch_size (int): Batch size fed to the CNN network.
+            frame_sampling: Minimal distance (in sec.) between frames to be
+                saved.
+            save_frames (bool): Save normalized video frames.
+            chunk_size (int): Maximal number of frames passed between stages
+                at once (default is batch_size).
+            queue_size (int): Maximal number of chunks waiting between stages
+                (default is 2 * decode_workers).
+            load_chunks: Function to load video frames in chunks (must be
+                picklable).
+        """
+        self.model = model
+        self.reprs = reprs
+        self.reprkey = reprkey
+        self.decode_workers = decode_workers
+        self.batch_size = batch_size
+        self.frame_sampling = frame_sampling
+        self.save_frames = save_frames
+        self.chunk_size = chunk_size or batch_size
+        self.queue_size = queue_size or 2 * decode_workers
+        self.load_chunks = load_chunks
+        self.counters = dict(
+            decode=StageCounters("decode"),
+            inference=StageCounters("inference"),
+            write=StageCounters("write"))
+
+    def run(self, video_paths, progress=None):
+        """Extract and save frame-level features of the given videos.
+
+        Args:
+            video_paths: Iterable over video file paths.
+            progress: Optional progress bar (e.g. tqdm) updated after each
+                saved video.
+
+        Returns:
+            Dictionary mapping stage name to its StageCounters.
+        """
+        decoded = multiprocessing.Queue(maxsize=self.queue_size)
+        extracted = Queue(maxsize=self.queue_size)
+        submitted = Queue()
+        decoder = threading.Thread(
+            target=self._decode, args=(video_paths, decoded, submitted),
+            daemon=True)
+        writer = threading.Thread(
+            target=self._write, args=(extracted, progress), daemon=True)
+        writer.start()
+        with multiprocessing.Pool(self.decode_workers,
+                                  initializer=_init_decode_worker,
+                                  initargs=(decoded,)) as pool:
+            self._pool = pool
+            decoder.start()
+            try:
+                self._infer(decoded, extracted, submitted)
+            finally:
+                extracted.put(_DONE)
+                writer.join()
+            decoder.join()
+        return self.counters
+
+    def _decode(self, video_paths, output, submitted):
+        """Decode stage: schedule videos loading in worker processes."""
+        counters = self.counters["decode"]
+        pending = deque()
+        count = 0
+        for path in video_paths:
+            if not os.path.exists(path):
+                logger.error(f'Error processing file:{path}')
+                logger.error("File not found")
+                counters.errors += 1
+                continue
+            args = (self.load_chunks, path, self.model.desired_size,
+                    self.frame_sampling, self.chunk_size)
+            pending.append(self._pool.apply_async(_decode_video, args=args))
+            count += 1
+            while len(pending) >= self.decode_workers:
+                pending.popleft().wait()
+        while pending:
+            pending.popleft().wait()
+        # Chunks may be still in flight, so report the number of videos to
+        # wait for
+        submitted.put(count)
+        output.put((_FINISHED, None, None))
+
+    def _infer(self, decoded, output, submitted):
+        """Inference stage: extract frame-level features.
+
+        Frames of multiple videos are packed into full batches.
+        """
+        decode_counters = self.counters["decode"]
+        packer = BatchPacker(
+            lambda batch: self.model.extract(batch, self.batch_size),
+            self.batch_size)
+        finished, expected = 0, None
+        failed = set()
+        while expected is None or finished < expected:
+            kind, path, payload = decoded.get()
+            if kind == _FINISHED:
+                expected = submitted.get()
+                continue
+            if kind == _END:
+                decode_counters.record(0, payload, videos=1)
+                finished += 1
+                self._forward(packer.mark((_END, path)), output, failed)
+                continue
+            if kind == _ERROR:
+                logger.error(f'Error processing file:{path}')
+                logger.error(payload)
+                decode_counters.errors += 1
+                finished += 1
+                packer.discard([path])
+                self._forward(packer.mark((_ERROR, path)), output, failed)
+                continue
+            decode_counters.record(len(payload), 0)
+            if path in failed:
+                continue
+            self._forward(
+                self._timed(packer.add, path, payload), output, failed)
+        self._forward(self._timed(packer.flush), output, failed)
+
+    def _timed(self, packer_method, *args):
+        """Call packer method measuring inference time."""
+        counters = self.counters["inference"]
+        started = time.time()
+        outputs = packer_method(*args)
+        frames = sum(len(item.features) for item in outputs
+                     if isinstance(item, PackedFeatures))
+        counters.record(frames, time.time() - started)
+        return outputs
+
+    def _forward(self, outputs, output, failed):
+        """Pass packer outputs to the writer stage."""
+        counters = self.counters["inference"]
+        for item in outputs:
+            if isinstance(item, PackedFeatures):
+                frames = item.frames if self.save_frames else None
+                output.put((_CHUNK, item.owner, item.features, frames))
+            elif isinstance(item, PackedError):
+                logger.error(f'Error processing file:{item.owner}')
+                logger.error(item.error)
+                counters.errors += 1
+                failed.add(item.owner)
+                output.put((_ERROR, item.owner, None, None))
+            else:
+                kind, path = item
+                if kind == _END and path not in failed:
+                    counters.record(0, 0, videos=1)
+                failed.discard(path)
+                output.put((kind, path, None, None))
+
+    def _write(self, extracted, progress):
+        """Write stage: save features to the storage incrementally.
+
+        Video-level features are calculated while the frame features are
+        still in memory and are saved just after the frame-level features
+        are committed. Video-level features missing because of an
+        interruption in between are calculated by frame_to_global.
+        """
+        videos = {}
+        failed = set()
+        while True:
+            item = extracted.get()
+            if item is _DONE:
+                break
+            kind, path, features, frames = item
+            try:
+                if kind == _ERROR:
+                    failed.add(path)
+                    self._discard(videos.pop(path, None))
+                elif kind == _END:
+                    self._write_end(path, videos, failed, progress)
+                elif path not in failed:
+                    self._write_chunk(path, features, frames, videos)
+            except Exception as e:
+                self._write_failed(path, e, videos, failed)
+        for video in videos.values():
+            self._discard(video)
+
+    def _write_chunk(self, path, features, frames, videos):
+        """Append the next chunk of the video features."""
+        started = time.time()
+        if path not in videos:
+            videos[path] = self._open(path)
+        video = videos[path]
+        video.features.append(features)
+        video.global_vector.add(features)
+        if frames is not None:
+            video.frames.append(frames)
+        self.counters["write"].record(len(features), time.time() - started)
+
+    def _write_end(self, path, videos, failed, progress):
+        """Save representations of the completely processed video."""
+        started = time.time()
+        if path not in failed:
+            self._close(videos.pop(path, None) or self._open(path))
+            self.counters["write"].record(0, time.time() - started, videos=1)
+        failed.discard(path)
+        if progress is not None:
+            progress.update(1)
+
+    def _write_failed(self, path, error, videos, failed):
+        """Discard representations of the video which failed to save."""
+        logger.error(f'Error processing file:{path}')
+        logger.error(error)
+        self.counters["write"].errors += 1
+        failed.add(path)
+        self._discard(videos.pop(path, None))
+
+    def _open(self, path):
+        """Open incremental writers of the video representations."""
+        key = self.reprkey(path)
+        features = chunk_writer(self.reprs.frame_level, key)
+        frames = None
+        if self.save_frames:
+            frames = chunk_writer(self.reprs.frames, key)
+        return _VideoWriters(key, features, frames, GlobalVectorAccumulator())
+
+    def _close(self, video):
+        """Save the video representations.
+
+        Video-level features are not saved for videos without frames (as
+        in frame_to_global).
+        """
+        if video.frames is not None:
+            video.frames.close()
+        video.features.close()
+        global_vector = video.global_vector.result()
+        if global_vector.size > 0:
+            self.reprs.video_level.write(video.key, global_vector)
+
+    @staticmethod
+    def _discard(video):
+        """Discard partially written representations."""
+        if video is None:
+            return
+        video.features.discard()
+        if video.frames is not None:
+            video.frames.discard()
+
+
+@dataclass
+class _VideoWriters:
+    """Incremental writers of a single video representations."""
+    key: object  # representation storage key
+    features: object  # frame-level features chunk writer
+    frames: object  # frames chunk writer or None
+    global_vector: GlobalVectorAccumulator  # video-level features
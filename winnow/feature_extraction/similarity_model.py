@@ -1,7 +1,9 @@
 import os
+from functools import partial
 
 import numpy as np
 
+from .model_registry import models
 from .siamese_net import DNN
 
 package_directory = os.path.dirname(os.path.abspath(__file__))
@@ -29,16 +31,23 @@ class SimilarityModel:
 
     def predict_from_features(self, features):
 
-        # Create model
+        # Get model shared by all similarity models of the process
         if self.model is None:
-            print(f"Creating similarity model for shape {features.shape}")
-            self.model = DNN(
-                            features.shape[1],
-                            None,
-                            similarity_model_pretrained,
-                            load_model=True,
-                            trainable=False)
+            key = ('similarity', similarity_model_pretrained,
+                   features.shape[1])
+            self.model = models.get(
+                key, partial(self._create_model, features.shape))
 
         embeddings = self.model.embeddings(features)
         embeddings = np.nan_to_num(embeddings)
         return embeddings
+
+    @staticmethod
+    def _create_model(shape):
+        print(f"Creating similarity model for shape {shape}")
+        return DNN(
+                   shape[1],
+                   None,
+                   similarity_model_pretrained,
+                   load_model=True,
+                   trainable=False)
@@ -22,13 +22,32 @@ def download_file(local_filename, url):
         return local_filename
 
 
-def load_video(video, desired_size, frame_sampling):
+# Minimal sampling step (in frames) for which seeking to the sampled frames is
+# cheaper than sequential decoding. Seeking decodes frames starting from the
+# preceding key-frame, so it pays off only when sampled frames are far apart.
+SEEK_MIN_STEP = 150
+
+# Default number of frames in chunks produced by iter_video_chunks
+DEFAULT_CHUNK_SIZE = 64
+
+
+def load_video(video, desired_size, frame_sampling=1, seek=None):
     """
       Function that loads a video and converts it to the desired size.
 
+      Only the sampled frames are converted: skipped frames are grabbed
+      without being retrieved, and if the sampled frames are far apart the
+      loader seeks to them directly. Seeking falls back to sequential
+      decoding whenever the reported position doesn't match the requested
+      one.
+
       Args:
         video: path to video
         desired_size: desired shape of each frame
+        frame_sampling: minimal distance (in sec.) between sampled frames
+        seek: seek to the sampled frames instead of sequential decoding
+            (default is to seek only if sampling step is at least
+            SEEK_MIN_STEP frames)
 
       Returns:
         video_tensor: the tensor of the given video
@@ -37,42 +56,131 @@ cfg['pretrained_model_local_path']
         Exception: if provided video can not be load
     """
     try:
-        cap = cv2.VideoCapture(video)
-        frames = []
-        count = 0
-        fps = cap.get(cv2.CAP_PROP_FPS)
-
-        if not fps or fps != fps or fps == np.inf:
-            fps = 25
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if isinstance(frame, np.ndarray):
-                try:
-                    """
-                    When frame_sampling = 1 -> We sample one 1
-                    frame per second
-                    When frame_sampling = 2 -> We sample one
-                    frame every 2 * frame_per_second -> 1 frame
-                    every 2 seconds
-                    """
-                    if int(count % round(fps * frame_sampling)) == 0:
-                        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                        if desired_size != 0:
-                            frame = pad_and_resize(frame, desired_size)
-                        frames.append(frame)
-                except Exception:
-                    pass
-            else:
-                break
-            count += 1
-        cap.release()
-        video_tensor = np.array(frames)
+        chunks = list(iter_video_chunks(
+            video, desired_size, frame_sampling, seek=seek))
+        if len(chunks) == 0:
+            return np.array([])
+        video_tensor = np.concatenate(chunks)
 
         return video_tensor
     except Exception as e:
         raise Exception('Can\'t load video {}\n{}'.format(video, e))
 
 
+def iter_video_chunks(video, desired_size, frame_sampling=1,
+                      chunk_size=DEFAULT_CHUNK_SIZE, seek=None):
+    """
+      Generator of the sampled video frames converted to the desired size.
+
+      Frames are produced in chunks of at most chunk_size frames, so the
+      memory usage doesn't depend on the video length.
+
+      Args:
+        video: path to video
+        desired_size: desired shape of each frame
+        frame_sampling: minimal distance (in sec.) between sampled frames
+        chunk_size: maximal number of frames in a single chunk
+        seek: seek to the sampled frames instead of sequential decoding
+
+      Yields:
+        chunk: the tensor of consecutive sampled frames
+    """
+    chunk = []
+    for frame in sample_frames(video, frame_sampling, seek):
+        try:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            if desired_size != 0:
+                frame = pad_and_resize(frame, desired_size)
+            chunk.append(frame)
+        except Exception:
+            pass
+        if len(chunk) == chunk_size:
+            yield np.array(chunk)
+            chunk = []
+    if len(chunk) > 0:
+        yield np.array(chunk)
+
+
+def sample_frames(video, frame_sampling=1, seek=None):
+    """
+      Generator of the sampled raw (BGR) video frames.
+
+      When frame_sampling = 1 -> We sample one 1 frame per second
+      When frame_sampling = 2 -> We sample one frame every
+      2 * frame_per_second -> 1 frame every 2 seconds
+
+      Args:
+        video: path to video
+        frame_sampling: minimal distance (in sec.) between sampled frames
+        seek: seek to the sampled frames instead of sequential decoding
+            (default is to seek only if sampling step is at least
+            SEEK_MIN_STEP frames)
+    """
+    cap = cv2.VideoCapture(video)
+    try:
+        step = _sampling_step(cap, frame_sampling)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if seek is None:
+            seek = step >= SEEK_MIN_STEP
+        if seek and frame_count > 0:
+            yield from _seek_frames(video, cap, step, frame_count)
+        else:
+            yield from _decode_frames(cap, step)
+    finally:
+        cap.release()
+
+
+def _sampling_step(cap, frame_sampling):
+    """Get distance in frames between the sampled frames."""
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if not fps or fps != fps or fps == np.inf:
+        fps = 25
+    return max(1, int(round(fps * frame_sampling)))
+
+
+def _decode_frames(cap, step, position=0):
+    """Decode frames sequentially retrieving only the sampled ones."""
+    while cap.isOpened() and cap.grab():
+        if position % step == 0:
+            ret, frame = cap.retrieve()
+            if ret:
+                yield frame
+        position += 1
+
+
+def _seek_frames(video, cap, step, frame_count):
+    """Seek to each sampled frame.
+
+    Falls back to sequential decoding if seeking is unreliable.
+    """
+    position = 0
+    for index in range(0, frame_count, step):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+        if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != index:
+            yield from _decode_from(video, step, index)
+            return
+        ret, frame = cap.read()
+        if not ret:
+            yield from _decode_from(video, step, index)
+            return
+        yield frame
+        position = index + 1
+    # Frame count reported by container may be underestimated
+    yield from _decode_frames(cap, step, position)
+
+
+def _decode_from(video, step, position):
+    """Decode frames sequentially starting from the given position."""
+    cap = cv2.VideoCapture(video)
+    try:
+        for _ in range(position):
+            if not cap.grab():
+                return
+        yield from _decode_frames(cap, step, position)
+    finally:
+        cap.release()
+
+
 def load_image(image, desired_size):
     """
       Function that loads an image and converts it to the desired size.
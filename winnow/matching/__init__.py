@@ -0,0 +1,6 @@
+from .range_search import *
+from .index import *
+from .pairs import *
+from .sharding import *
+from .frame_index import *
+from .reports import *
@@ -0,0 +1,331 @@
+import json
+import logging
+import os
+from os.path import join, exists
+
+import numpy as np
+
+from winnow.matching.index import INDEX_METHODS, IVFIndex, \
+    append_uncommitted, commit_description, read_description
+from winnow.matching.range_search import DEFAULT_BLOCK_SIZE
+from winnow.storage.matrix_file import MatrixFile
+from winnow.storage.repr_key import ReprKey
+from winnow.storage.repr_utils import bulk_read_iter, BulkReadReport
+
+logger = logging.getLogger(__name__)
+
+# Number of frame vectors accumulated before appending them to the index
+_APPEND_ROWS = 4096
+
+# Limits of the IVF quantizer size (the frame index holds two orders of
+# magnitude more rows than the signature index, so sqrt(rows) lists and
+# the training sample proportional to it would not fit in memory)
+_IVF_LIMITS = dict(max_lists=1024, train_size=64)
+
+# Extra radius of the range search absorbing float32 rounding errors
+# (the found frames are filtered by the exact distance afterwards)
+_RADIUS_TOLERANCE = 1e-3
+
+
+def normalize(vectors):
+    """Scale vectors to unit length leaving zero vectors unchanged."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors = vectors.reshape(len(vectors), int(np.prod(vectors.shape[1:])))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def template_query(features):
+    """Get query vector of the template consisting of multiple images.
+
+    Mean cosine distance between a frame and the template images equals
+    to 1 - dot(frame, query), where the frame is normalized and the query
+    is the mean of the normalized image features. So the whole template
+    is searched by a single query vector.
+    """
+    return normalize(features).mean(axis=0)
+
+
+class FrameIndex:
+    """Persistent nearest-neighbor index over frame features of all videos.
+
+    Frame features are normalized to the unit length, so that the cosine
+    distance to a query is a function of the euclidean distance. Frames of
+    each video occupy a contiguous range of rows, which maps each row to
+    the video storage key and the frame offset within the video.
+
+    The index is saved in a directory with the following files:
+        * index.json - index method, parameters and the number of committed
+          rows and videos.
+        * videos.jsonl - ReprKey and the number of frames of each indexed
+          video (one per line).
+        * vectors.npy - append-only float32 matrix of normalized frame
+          features.
+        * method-specific files (e.g. IVF quantizer).
+
+    The rows and videos appended after the last committed index.json are
+    ignored when the index is loaded, so the interrupted updates are
+    discarded.
+    """
+
+    def __init__(self, directory, keys, counts, vectors, index, params, size,
+                 keys_size):
+        self.directory = directory
+        self.keys = keys
+        self.index = index
+        self._counts = counts
+        self._starts = None
+        self._vectors = vectors  # None until the first frame is added
+        # Parameters of the index which is not fitted yet
+        self._params = params
+        self._size = size  # Number of committed rows
+        # Size of the committed part of videos.jsonl
+        self._keys_size = keys_size
+
+    @property
+    def vectors(self):
+        """Memory-mapped matrix of normalized frame features."""
+        if self._vectors is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._vectors.matrix()[:self._size]
+
+    @property
+    def starts(self):
+        """Index of the first row of each indexed video."""
+        if self._starts is None:
+            self._starts = np.cumsum([0] + self._counts, dtype=np.int64)[:-1]
+        return self._starts
+
+    def __len__(self):
+        return self._size
+
+    @staticmethod
+    def exists(directory):
+        """Check if the index is saved in the given directory."""
+        return exists(join(directory, "index.json"))
+
+    @staticmethod
+    def create(directory, items=(), method=IVFIndex.method, **params):
+        """Build a new index and save it to the given directory.
+
+        Args:
+            directory (String): Directory in which the index will be saved.
+            items: Iterable over (ReprKey, frame features) pairs.
+            method (String): Index method name (see INDEX_METHODS).
+            params: Method-specific parameters (the IVF quantizer size is
+                limited by default, see IVFIndex).
+        """
+        if method not in INDEX_METHODS:
+            raise ValueError(f"Unknown index method: {method}. Supported "
+                             f"methods: {', '.join(INDEX_METHODS)}")
+        if method == IVFIndex.method:
+            params = {**_IVF_LIMITS, **params}
+        os.makedirs(directory, exist_ok=True)
+        vectors_path = join(directory, "vectors.npy")
+        if exists(vectors_path):
+            os.remove(vectors_path)
+        with open(join(directory, "videos.jsonl"), "w", encoding="utf-8"):
+            pass
+        index = INDEX_METHODS[method](**params)
+        frame_index = FrameIndex(directory, [], [], None, index, params,
+                                 size=0, keys_size=0)
+        frame_index.add(items)
+        return frame_index
+
+    @staticmethod
+    def load(directory):
+        """Load index from the given directory."""
+        description = read_description(directory)
+        size = description["size"]
+        keys_path = join(directory, "videos.jsonl")
+        with open(keys_path, "r", encoding="utf-8") as keys_file:
+            lines = zip(range(description["videos"]), keys_file)
+            entries = [json.loads(line) for _, line in lines]
+        keys = [ReprKey(path, hash, tag) for path, hash, tag, _ in entries]
+        counts = [count for *_, count in entries]
+        index_type = INDEX_METHODS[description["method"]]
+        params = description["params"]
+        if size > 0:
+            index = index_type.load(directory, params, size)
+        else:
+            index = index_type(**params)
+        vectors_path = join(directory, "vectors.npy")
+        vectors = MatrixFile(vectors_path) if exists(vectors_path) else None
+        return FrameIndex(directory, keys, counts, vectors, index, params,
+                          size, description["keys_size"])
+
+    def add(self, items):
+        """Append frame features of new videos to the index and save it.
+
+        Args:
+            items: Iterable over (ReprKey, frame features) pairs.
+        """
+        start = self._size
+        keys_path = join(self.directory, "videos.jsonl")
+        with append_uncommitted(self._vectors, start, keys_path,
+                                self._keys_size) as keys_file:
+            pending, pending_rows = [], 0
+            for key, features in items:
+                features = normalize(features)
+                entry = [key.path, key.hash, key.tag, len(features)]
+                keys_file.write(json.dumps(entry))
+                keys_file.write("\n")
+                self.keys.append(key)
+                self._counts.append(len(features))
+                if len(features) > 0:
+                    pending.append(features)
+                    pending_rows += len(features)
+                if pending_rows >= _APPEND_ROWS:
+                    self._append(np.concatenate(pending))
+                    pending, pending_rows = [], 0
+            if pending_rows > 0:
+                self._append(np.concatenate(pending))
+            self._keys_size = keys_file.tell()
+        self._size = 0 if self._vectors is None else len(self._vectors)
+        self._starts = None
+        if self._size > start:
+            if start == 0:
+                self.index.fit(self.vectors)
+            else:
+                self.index.add(self.vectors, start)
+        self._commit()
+
+    def search(self, queries, max_distance, videos=None,
+               block_size=DEFAULT_BLOCK_SIZE):
+        """Find the closest frame of each indexed video for each query.
+
+        Distance between a frame and a query is 1 - dot(frame, query), where
+        the frame is normalized. For normalized queries this is the cosine
+        distance (see template_query() for the queries of multiple images).
+
+        Args:
+            queries: Matrix of query vectors.
+            max_distance (float): Maximal distance to the frame (exclusive).
+            videos: Optional boolean mask of the indexed videos to be
+                reported.
+            block_size (int): Maximal number of rows processed at once
+                (bounds memory usage).
+
+        Returns:
+            Tuple of equal-length arrays (query_indices, video_indices,
+            frame_offsets, distances) containing a single closest frame of
+            each found video.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        queries = queries.reshape(len(queries),
+                                  int(np.prod(queries.shape[1:])))
+        found = []
+        norms = np.linalg.norm(queries, axis=1)
+        if self._size > 0 and np.any(norms > 0):
+            # Frames within max_distance from the query are within the
+            # radius from the normalized query
+            similarity = ((1 - max_distance) / norms[norms > 0]).min()
+            squared_radius = np.clip(2 - 2 * similarity, 0, 4)
+            radius = np.sqrt(squared_radius) + _RADIUS_TOLERANCE
+            search = self.index.range_search(
+                self.vectors, normalize(queries), radius, block_size)
+            for query_ids, rows, _ in search:
+                frames = np.asarray(self.vectors[rows])
+                distances = 1 - np.einsum(
+                    "ij,ij->i", frames, queries[query_ids])
+                close = distances < max_distance
+                found.append(self._closest(
+                    query_ids[close], rows[close], distances[close], videos))
+        if not found:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty, np.empty(0, dtype=np.float32)
+        return self._reduce(*map(np.concatenate, zip(*found)))
+
+    # Private methods
+
+    def _append(self, vectors):
+        """Append normalized frame features to the vectors file."""
+        if self._vectors is None:
+            self._vectors = MatrixFile(join(self.directory, "vectors.npy"),
+                                       row_shape=vectors.shape[1:])
+        self._vectors.append(vectors)
+
+    def _closest(self, query_ids, rows, distances, videos):
+        """Convert found rows to the closest frames of the found videos."""
+        video_ids = np.searchsorted(self.starts, rows, side="right") - 1
+        offsets = rows - self.starts[video_ids]
+        if videos is not None:
+            selected = videos[video_ids]
+            query_ids, video_ids, offsets, distances = (
+                query_ids[selected], video_ids[selected], offsets[selected],
+                distances[selected])
+        return self._reduce(query_ids, video_ids, offsets, distances)
+
+    @staticmethod
+    def _reduce(query_ids, video_ids, offsets, distances):
+        """Keep only the closest frame of each (query, video) pair.
+
+        The first frame is kept on ties.
+        """
+        order = np.lexsort((offsets, distances, video_ids, query_ids))
+        query_ids, video_ids, offsets, distances = (
+            query_ids[order], video_ids[order], offsets[order],
+            distances[order])
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = ((query_ids[1:] != query_ids[:-1]) |
+                     (video_ids[1:] != video_ids[:-1]))
+        return (query_ids[first], video_ids[first], offsets[first],
+                distances[first])
+
+    def _commit(self):
+        """Save index description making appended rows and videos visible."""
+        params = self._params
+        if self._size > 0:
+            params = self.index.save(self.directory)
+        description = dict(method=self.index.method, params=params,
+                           size=self._size, videos=len(self.keys),
+                           keys_size=self._keys_size)
+        commit_description(self.directory, description)
+
+
+def update_frame_index(directory, frame_level, rebuild=False,
+                       method=IVFIndex.method, **params):
+    """Create or incrementally update frame index of all the stored videos.
+
+    The saved index is extended with the new and modified videos. It is
+    rebuilt from scratch if more than a half of the indexed videos are
+    outdated (modified or removed from the storage).
+
+    Args:
+        directory (String): Directory in which the index is saved.
+        frame_level: Frame-level features storage (e.g. LMDBReprStorage).
+        rebuild (bool): Rebuild the index even if the saved one is up to date.
+        method (String): Index method name used when the index is (re)built.
+        params: Method-specific parameters used when the index is (re)built.
+
+    Returns:
+        Tuple (FrameIndex, live) where live is a boolean mask of the indexed
+        videos which are up to date with the storage.
+    """
+    stored = set(frame_level.list())
+    report = BulkReadReport()
+    index = None
+    if not rebuild and FrameIndex.exists(directory):
+        index = FrameIndex.load(directory)
+        stale = len(set(index.keys) - stored)
+        if stale > len(index.keys) // 2:
+            logger.info("Frame index contains %s outdated videos and will "
+                        "be rebuilt", stale)
+            index = None
+        else:
+            indexed = set(index.keys)
+            missing = sorted((key for key in stored if key not in indexed),
+                             key=lambda key: key.path)
+            logger.info("Adding %s new videos to the frame index",
+                        len(missing))
+            index.add(bulk_read_iter(frame_level, missing, report=report))
+
+    if index is None:
+        logger.info("Building frame index in %s", directory)
+        keys = sorted(stored, key=lambda key: key.path)
+        items = bulk_read_iter(frame_level, keys, report=report)
+        index = FrameIndex.create(directory, items, method, **params)
+
+    report.log()
+    live = np.array([key in stored for key in index.keys], dtype=bool)
+    return index, live
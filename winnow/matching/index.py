@@ -0,0 +1,428 @@
+import json
+import logging
+import os
+from contextlib import contextmanager
+from os.path import join, exists
+
+import numpy as np
+
+from winnow.matching.range_search import DEFAULT_BLOCK_SIZE, \
+    euclidean_distances, range_search, squared_distances, squared_norms, \
+    collect
+from winnow.storage.matrix_file import MatrixFile
+from winnow.storage.repr_key import ReprKey
+
+logger = logging.getLogger(__name__)
+
+# Number of vectors assigned to the inverted lists at once
+_QUERY_CHUNK = 1024
+
+
+def read_description(directory):
+    """Read description of the committed index state (index.json)."""
+    with open(join(directory, "index.json"), "r") as index_file:
+        return json.load(index_file)
+
+
+@contextmanager
+def append_uncommitted(vectors, size, keys_path, keys_size):
+    """Prepare append-only index files for appending new entries.
+
+    The vectors (MatrixFile or None) and the keys file are truncated to
+    the committed size, so the data left by interrupted updates is
+    discarded. The context yields the keys file opened for appending.
+    """
+    if vectors is not None:
+        vectors.truncate(size)
+    with open(keys_path, "r+", encoding="utf-8") as keys_file:
+        keys_file.truncate(keys_size)
+        keys_file.seek(keys_size)
+        yield keys_file
+
+
+def commit_description(directory, description):
+    """Atomically replace index.json making the appended data visible."""
+    temp_path = join(directory, "index.json.tmp")
+    with open(temp_path, "w") as index_file:
+        json.dump(description, index_file)
+    os.replace(temp_path, join(directory, "index.json"))
+
+
+class BruteForceIndex:
+    """Exact nearest-neighbor search over all indexed vectors."""
+
+    method = "brute_force"
+
+    def fit(self, vectors):
+        """Prepare index for the given vectors."""
+
+    def add(self, vectors, start):
+        """Register vectors appended to the index starting from the row."""
+
+    def range_search(self, vectors, queries, radius,
+                     block_size=DEFAULT_BLOCK_SIZE):
+        """Find all vectors within the radius from each query.
+
+        Yields:
+            Tuples (query_indices, vector_indices, distances) of equal-length
+            arrays.
+        """
+        return range_search(queries, vectors, radius, block_size)
+
+    def save(self, directory):
+        """Save index parameters to the directory."""
+        return {}
+
+    @staticmethod
+    def load(directory, params, size):
+        """Load index of the given number of committed rows."""
+        return BruteForceIndex()
+
+
+class IVFIndex:
+    """Inverted-file approximate nearest-neighbor index.
+
+    Vectors are partitioned into lists by the nearest centroid of a k-means
+    coarse quantizer. Each query is compared only with the vectors from the
+    n_probe lists with the closest centroids. Distances to the candidates
+    are exact, so the result differs from the exact search only by the
+    neighbors located in lists that were not probed.
+    """
+
+    method = "ivf"
+
+    def __init__(self, n_lists=None, n_probe=16, train_size=256,
+                 iterations=10, seed=0, max_lists=None):
+        """Create a new IVF index.
+
+        Args:
+            n_lists (int): Number of inverted lists. Defaults to
+                sqrt(number of vectors) limited by max_lists.
+            n_probe (int): Number of lists visited by each query.
+            train_size (int): Number of training vectors per list used to
+                fit the quantizer.
+            iterations (int): Number of k-means iterations.
+            seed (int): Random seed used to fit the quantizer.
+            max_lists (int): Maximal default number of inverted lists.
+        """
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_size = train_size
+        self.iterations = iterations
+        self.seed = seed
+        self.max_lists = max_lists
+        self.centroids = None
+        self.assignments = np.empty(0, dtype=np.int32)
+        self._lists = None
+
+    def fit(self, vectors):
+        """Train the coarse quantizer and assign vectors to lists."""
+        n_lists = self.n_lists or min(max(1, int(np.sqrt(len(vectors)))),
+                                      self.max_lists or len(vectors))
+        self.n_lists = min(n_lists, len(vectors))
+        random = np.random.RandomState(self.seed)
+        sample_size = min(len(vectors), self.n_lists * self.train_size)
+        # Generator samples without permuting all the rows
+        sample_rows = np.random.default_rng(self.seed).choice(
+            len(vectors), sample_size, replace=False)
+        sample = np.asarray(vectors[np.sort(sample_rows)])
+        self.centroids = self._kmeans(
+            sample, self.n_lists, self.iterations, random)
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.add(vectors, 0)
+
+    def add(self, vectors, start):
+        """Assign vectors appended starting from the given row to the lists."""
+        new_assignments = []
+        for begin in range(start, len(vectors), _QUERY_CHUNK):
+            chunk = vectors[begin:begin + _QUERY_CHUNK]
+            new_assignments.append(self._nearest_centroids(chunk, 1)[:, 0])
+        self.assignments = np.concatenate(
+            [self.assignments[:start]] + new_assignments).astype(np.int32)
+        self._lists = None
+
+    def range_search(self, vectors, queries, radius,
+                     block_size=DEFAULT_BLOCK_SIZE):
+        """Find approximately all vectors within the radius from each query.
+
+        Yields:
+            Tuples (query_indices, vector_indices, distances) of equal-length
+            arrays.
+        """
+        for begin in range(0, len(queries), block_size):
+            chunk = queries[begin:begin + block_size]
+            for list_id, query_ids, rows in self._probe(chunk):
+                list_vectors = np.asarray(vectors[rows])
+                found = range_search(chunk[query_ids], list_vectors, radius,
+                                     block_size, vector_ids=rows)
+                for found_queries, found_vectors, distances in found:
+                    yield (query_ids[found_queries] + begin, found_vectors,
+                           distances)
+
+    def save(self, directory):
+        """Save quantizer to the directory and get index parameters.
+
+        Each file is replaced atomically, so an interrupted save leaves
+        either the previous or the new version of the file.
+        """
+        for name, array in (("centroids", self.centroids),
+                            ("assignments", self.assignments)):
+            temp_path = join(directory, f"{name}.tmp.npy")
+            np.save(temp_path, array)
+            os.replace(temp_path, join(directory, f"{name}.npy"))
+        return dict(n_lists=self.n_lists, n_probe=self.n_probe,
+                    train_size=self.train_size, iterations=self.iterations,
+                    seed=self.seed, max_lists=self.max_lists)
+
+    @staticmethod
+    def load(directory, params, size):
+        """Load index of the given number of committed rows.
+
+        Assignments of the rows appended by interrupted updates are
+        discarded.
+        """
+        index = IVFIndex(**params)
+        index.centroids = np.load(join(directory, "centroids.npy"))
+        assignments = np.load(join(directory, "assignments.npy"))
+        index.assignments = assignments[:size]
+        return index
+
+    # Private methods
+
+    def _probe(self, queries):
+        """Iterate over (list_id, query_ids, rows) of each probed list."""
+        lists = self._get_lists()
+        probes = self._nearest_centroids(
+            queries, min(self.n_probe, self.n_lists))
+        for list_id in np.unique(probes):
+            rows = lists[list_id]
+            if len(rows) > 0:
+                query_ids = np.nonzero((probes == list_id).any(axis=1))[0]
+                yield list_id, query_ids, rows
+
+    def _get_lists(self):
+        """Get row indices of each inverted list."""
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind="stable")
+            bounds = np.searchsorted(
+                self.assignments[order], np.arange(self.n_lists + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]]
+                           for i in range(self.n_lists)]
+        return self._lists
+
+    def _nearest_centroids(self, vectors, count):
+        """Get ids of the closest centroids for each vector."""
+        distances = euclidean_distances(
+            np.asarray(vectors, dtype=np.float32), self.centroids)
+        if count < distances.shape[1]:
+            nearest = np.argpartition(distances, count - 1, axis=1)[:, :count]
+        else:
+            nearest = np.broadcast_to(
+                np.arange(distances.shape[1]), distances.shape)
+        return nearest
+
+    @staticmethod
+    def _kmeans(sample, n_clusters, iterations, random,
+                block_size=DEFAULT_BLOCK_SIZE):
+        """Fit k-means centroids using Lloyd's algorithm.
+
+        The assignment step is performed in blocks of sample vectors, so the
+        memory usage is bounded by n_clusters * block_size.
+        """
+        sample = sample.astype(np.float32)
+        initial = random.choice(len(sample), n_clusters, replace=False)
+        centroids = sample[initial].copy()
+        sample_norms = squared_norms(sample)
+        assignments = np.empty(len(sample), dtype=np.int64)
+        for _ in range(iterations):
+            for begin in range(0, len(sample), block_size):
+                end = begin + block_size
+                distances = squared_distances(
+                    centroids, sample[begin:end],
+                    vector_norms=sample_norms[begin:end])
+                assignments[begin:end] = np.argmin(distances, axis=0)
+            order = np.argsort(assignments, kind="stable")
+            clusters, starts, counts = np.unique(
+                assignments[order], return_index=True, return_counts=True)
+            sums = np.add.reduceat(sample[order], starts, axis=0)
+            centroids[clusters] = sums / counts[:, None]
+            # Re-seed empty clusters
+            empty = np.setdiff1d(np.arange(n_clusters), clusters)
+            if len(empty) > 0:
+                reseeded = random.choice(
+                    len(sample), len(empty), replace=False)
+                centroids[empty] = sample[reseeded]
+        return centroids
+
+
+# Available index implementations
+INDEX_METHODS = {
+    BruteForceIndex.method: BruteForceIndex,
+    IVFIndex.method: IVFIndex,
+}
+
+
+class SignatureIndex:
+    """Persistent nearest-neighbor index over video signatures.
+
+    The index is saved in a directory with the following files:
+        * index.json - index method, parameters and the number of
+          committed rows.
+        * keys.jsonl - ReprKey of each indexed vector (one per line).
+        * vectors.npy - append-only float32 matrix of indexed vectors.
+        * method-specific files (e.g. IVF quantizer).
+
+    The rows appended after the last committed index.json are ignored
+    when the index is loaded, so the interrupted updates are discarded.
+    """
+
+    def __init__(self, directory, keys, vectors: MatrixFile, index, size,
+                 keys_size):
+        self.directory = directory
+        self.keys = keys  # None if keys were not loaded
+        self.index = index
+        self._vectors = vectors
+        self._size = size  # Number of committed rows
+        self._keys_size = keys_size  # Size of the committed keys.jsonl part
+
+    @property
+    def vectors(self):
+        """Memory-mapped matrix of indexed vectors."""
+        return self._vectors.matrix()[:self._size]
+
+    def __len__(self):
+        return self._size
+
+    @staticmethod
+    def exists(directory):
+        """Check if the index is saved in the given directory."""
+        return exists(join(directory, "index.json"))
+
+    @staticmethod
+    def create(directory, keys, vectors, method=IVFIndex.method, **params):
+        """Build a new index and save it to the given directory.
+
+        Args:
+            directory (String): Directory in which the index will be saved.
+            keys (List[ReprKey]): Storage key of each vector.
+            vectors: Matrix of vectors to be indexed.
+            method (String): Index method name (see INDEX_METHODS).
+            params: Method-specific parameters.
+        """
+        if method not in INDEX_METHODS:
+            raise ValueError(
+                f"Unknown index method: {method}. "
+                f"Supported methods: {', '.join(INDEX_METHODS)}")
+        os.makedirs(directory, exist_ok=True)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors_path = join(directory, "vectors.npy")
+        if exists(vectors_path):
+            os.remove(vectors_path)
+        matrix = MatrixFile(vectors_path, row_shape=vectors.shape[1:])
+        matrix.append(vectors)
+        index = INDEX_METHODS[method](**params)
+        index.fit(matrix.matrix())
+        keys_path = join(directory, "keys.jsonl")
+        with open(keys_path, "w", encoding="utf-8") as keys_file:
+            SignatureIndex._write_keys(keys_file, keys)
+            keys_size = keys_file.tell()
+        signature_index = SignatureIndex(
+            directory, list(keys), matrix, index, len(keys), keys_size)
+        signature_index._commit()
+        return signature_index
+
+    @staticmethod
+    def load(directory, load_keys=True):
+        """Load index from the given directory.
+
+        Args:
+            directory (String): Directory containing the saved index.
+            load_keys (bool): Load storage keys of the indexed vectors. The
+                index without keys can be searched but cannot be extended.
+        """
+        description = read_description(directory)
+        size = description["size"]
+        index_type = INDEX_METHODS[description["method"]]
+        index = index_type.load(directory, description["params"], size)
+        keys = None
+        if load_keys:
+            keys_path = join(directory, "keys.jsonl")
+            with open(keys_path, "r", encoding="utf-8") as keys_file:
+                keys = [ReprKey(*json.loads(line))
+                        for _, line in zip(range(size), keys_file)]
+        vectors = MatrixFile(join(directory, "vectors.npy"))
+        return SignatureIndex(directory, keys, vectors, index, size,
+                              description["keys_size"])
+
+    def add(self, keys, vectors):
+        """Append new vectors to the index and save it."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return
+        if self.keys is None:
+            raise ValueError("Cannot extend index loaded without keys")
+        start = self._size
+        keys_path = join(self.directory, "keys.jsonl")
+        with append_uncommitted(self._vectors, start, keys_path,
+                                self._keys_size) as keys_file:
+            self._vectors.append(vectors)
+            self._write_keys(keys_file, keys)
+            self._keys_size = keys_file.tell()
+        self.keys.extend(keys)
+        self._size += len(vectors)
+        self.index.add(self.vectors, start)
+        self._commit()
+
+    def range_search(self, queries, radius, block_size=DEFAULT_BLOCK_SIZE):
+        """Find all indexed vectors within the radius from the query vectors.
+
+        Args:
+            queries: Matrix of query vectors.
+            radius (float): Maximal euclidean distance (exclusive).
+            block_size (int): Maximal number of rows processed at once
+                (bounds memory usage).
+
+        Yields:
+            Tuples (query_indices, index_rows, distances) of equal-length
+            arrays.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        return self.index.range_search(
+            self.vectors, queries, radius, block_size)
+
+    def estimate_recall(self, radius, sample_size=100, seed=0):
+        """Estimate recall of the index compared to the exact search.
+
+        Returns:
+            Fraction of the vectors within the radius from randomly sampled
+            indexed vectors that are found by the index.
+        """
+        random = np.random.RandomState(seed)
+        sample = random.choice(
+            len(self), min(sample_size, len(self)), replace=False)
+        queries = np.asarray(self.vectors[np.sort(sample)])
+        exact_queries, exact_rows, _ = collect(
+            range_search(queries, self.vectors, radius))
+        found_queries, found_rows, _ = collect(
+            self.range_search(queries, radius))
+        expected = exact_queries * len(self) + exact_rows
+        found = found_queries * len(self) + found_rows
+        if len(expected) == 0:
+            return 1.0
+        return np.isin(expected, found).sum() / len(expected)
+
+    # Private methods
+
+    def _commit(self):
+        """Save index description making all appended rows visible."""
+        params = self.index.save(self.directory)
+        description = dict(method=self.index.method, params=params,
+                           size=self._size, keys_size=self._keys_size)
+        commit_description(self.directory, description)
+
+    @staticmethod
+    def _write_keys(file, keys):
+        """Write storage keys to the file, one per line."""
+        for key in keys:
+            file.write(json.dumps([key.path, key.hash, key.tag]))
+            file.write("\n")
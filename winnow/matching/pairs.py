@@ -0,0 +1,58 @@
+import numpy as np
+
+# Number of bits used to encode the larger element of a pair
+_SHIFT = 32
+_MASK = (1 << _SHIFT) - 1
+
+
+def encode_pairs(first, second):
+    """Encode unordered pairs of row indices as single int64 codes.
+
+    The pair (a, b) and the pair (b, a) get the same code equal to
+    (min(a, b) << 32) | max(a, b).
+
+    Args:
+        first: Array of non-negative row indices (less than 2^31).
+        second: Array of non-negative row indices (less than 2^31).
+
+    Returns:
+        Array of int64 pair codes.
+    """
+    first = np.asarray(first, dtype=np.int64)
+    second = np.asarray(second, dtype=np.int64)
+    return (np.minimum(first, second) << _SHIFT) | np.maximum(first, second)
+
+
+def decode_pairs(codes):
+    """Decode pair codes into (smaller, larger) row indices."""
+    codes = np.asarray(codes, dtype=np.int64)
+    return codes >> _SHIFT, codes & _MASK
+
+
+def unique_pairs(first, second):
+    """Find the first occurrence of each unordered pair.
+
+    Returns:
+        Sorted positions of the first occurrences of the distinct pairs, so
+        that the original order of the pairs is preserved.
+    """
+    _, first_occurrences = np.unique(
+        encode_pairs(first, second), return_index=True)
+    return np.sort(first_occurrences)
+
+
+def discarded_mask(first, second, discarded_rows, size):
+    """Get mask of pairs in which any of the elements is discarded.
+
+    Args:
+        first: Array of row indices.
+        second: Array of row indices.
+        discarded_rows: Discarded row indices.
+        size (int): Total number of rows.
+
+    Returns:
+        Boolean mask of the pairs having a discarded element.
+    """
+    discarded = np.zeros(size, dtype=bool)
+    discarded[np.asarray(discarded_rows, dtype=np.int64)] = True
+    return discarded[first] | discarded[second]
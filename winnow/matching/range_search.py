@@ -0,0 +1,117 @@
+import numpy as np
+
+# Default number of rows in query and vector blocks
+DEFAULT_BLOCK_SIZE = 4096
+
+# Size of a single distance matrix element
+_ELEMENT_SIZE = np.dtype(np.float32).itemsize
+
+
+def squared_norms(vectors):
+    """Get squared L2-norm of each row."""
+    return np.einsum("ij,ij->i", vectors, vectors)
+
+
+def squared_distances(queries, vectors, query_norms=None, vector_norms=None):
+    """Calculate squared euclidean distances between queries and vectors.
+
+    Uses the ||q||^2 + ||v||^2 - 2 * q.v expansion so that the bulk of the
+    work is done by a single BLAS matrix product.
+
+    Args:
+        queries: Matrix of shape (n, dim).
+        vectors: Matrix of shape (m, dim).
+        query_norms: Optional precomputed squared norms of the queries.
+        vector_norms: Optional precomputed squared norms of the vectors.
+
+    Returns:
+        Squared distance matrix of shape (n, m).
+    """
+    if query_norms is None:
+        query_norms = squared_norms(queries)
+    if vector_norms is None:
+        vector_norms = squared_norms(vectors)
+    distances = queries @ vectors.T
+    distances *= -2
+    distances += query_norms[:, None]
+    distances += vector_norms[None, :]
+    return np.maximum(distances, 0, out=distances)
+
+
+def euclidean_distances(queries, vectors, vector_norms=None):
+    """Calculate euclidean distances between each query and each vector.
+
+    Args:
+        queries: Matrix of shape (n, dim).
+        vectors: Matrix of shape (m, dim).
+        vector_norms: Optional precomputed squared norms of the vectors.
+
+    Returns:
+        Distance matrix of shape (n, m).
+    """
+    distances = squared_distances(queries, vectors, vector_norms=vector_norms)
+    return np.sqrt(distances, out=distances)
+
+
+def block_size_for_memory(memory_limit):
+    """Get the largest block size fitting the given memory limit.
+
+    Each block produces a square (block_size x block_size) float32 distance
+    matrix and a boolean mask of the same shape.
+
+    Args:
+        memory_limit (int): Memory available for a single block in bytes.
+    """
+    return max(1, int(np.sqrt(memory_limit / (_ELEMENT_SIZE + 1))))
+
+
+def range_search(queries, vectors, radius, block_size=DEFAULT_BLOCK_SIZE,
+                 vector_ids=None):
+    """Find all vectors located within the radius from each query.
+
+    The search is performed in (block_size x block_size) blocks of the
+    query and vector matrices, so the memory usage is bounded by the block
+    size rather than by the number of vectors. There is no limit on the
+    number of neighbors found for a single query.
+
+    Args:
+        queries: Matrix of shape (n, dim).
+        vectors: Matrix of shape (m, dim), may be memory-mapped.
+        radius (float): Maximal euclidean distance (exclusive).
+        block_size (int): Maximal number of rows in query and vector blocks.
+        vector_ids: Optional ids reported instead of vector row indices.
+
+    Yields:
+        Tuples (query_indices, vector_indices, distances) of equal-length
+        arrays.
+    """
+    squared_radius = radius ** 2
+    for query_start in range(0, len(queries), block_size):
+        query_block = queries[query_start:query_start + block_size]
+        query_block = np.asarray(query_block, dtype=np.float32)
+        query_norms = squared_norms(query_block)
+        for vector_start in range(0, len(vectors), block_size):
+            vector_block = vectors[vector_start:vector_start + block_size]
+            vector_block = np.asarray(vector_block, dtype=np.float32)
+            distances = squared_distances(
+                query_block, vector_block, query_norms=query_norms)
+            query_indices, vector_indices = np.nonzero(
+                distances < squared_radius)
+            if len(query_indices) == 0:
+                continue
+            found_distances = np.sqrt(distances[query_indices, vector_indices])
+            vector_indices += vector_start
+            if vector_ids is not None:
+                vector_indices = vector_ids[vector_indices]
+            yield query_indices + query_start, vector_indices, found_distances
+
+
+def collect(results):
+    """Concatenate range search results into three arrays."""
+    results = list(results)
+    if len(results) == 0:
+        return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.float32))
+    query_indices, vector_indices, distances = zip(*results)
+    return (np.concatenate(query_indices), np.concatenate(vector_indices),
+            np.concatenate(distances))
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from .pairs import encode_pairs
+
+# Columns of the match report identifying the matched videos
+_VIDEO_COLUMNS = ["query_video", "query_sha256", "match_video", "match_sha256"]
+
+
+def read_match_report(path):
+    """Read match report saved by generate_matches.py."""
+    return pd.read_csv(path, index_col=0, keep_default_na=False,
+                       dtype={column: str for column in _VIDEO_COLUMNS})
+
+
+def merge_match_reports(previous, matches, rows):
+    """Merge match report of the previous runs with the new matches.
+
+    Incremental matching finds only the pairs having a new video, so the
+    full report is the union of the previous report and the new matches.
+    Previous rows having an outdated video (modified or removed) on any
+    side or a pair of videos which is found again are dropped. Index rows
+    and pair codes of the previous rows are updated to the current index.
+
+    Args:
+        previous (pd.DataFrame): Match report of the previous runs.
+        matches (pd.DataFrame): Matches found by the current run.
+        rows (dict): Mapping from (path, hash) of each up-to-date video to
+            its signature index row.
+
+    Returns:
+        Merged report in which the new matches follow the previous ones.
+    """
+    query = np.array([
+        rows.get(key, -1) for key in
+        zip(previous["query_video"], previous["query_sha256"])
+    ], dtype=np.int64)
+    match = np.array([
+        rows.get(key, -1) for key in
+        zip(previous["match_video"], previous["match_sha256"])
+    ], dtype=np.int64)
+    live = (query >= 0) & (match >= 0)
+    previous = previous.loc[live].copy()
+    previous["query"], previous["match"] = query[live], match[live]
+    previous["unique_index"] = encode_pairs(query[live], match[live])
+    found_again = np.isin(previous["unique_index"].to_numpy(),
+                          matches["unique_index"].to_numpy())
+    return pd.concat([previous.loc[~found_again], matches],
+                     ignore_index=True)
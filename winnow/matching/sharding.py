@@ -0,0 +1,297 @@
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import Pool
+from os.path import join, exists
+
+import numpy as np
+
+from winnow.matching.index import SignatureIndex
+from winnow.matching.range_search import DEFAULT_BLOCK_SIZE, collect
+
+logger = logging.getLogger(__name__)
+
+# Default time (in seconds) after which a shard lock which is not
+# refreshed by its owner is considered abandoned
+DEFAULT_LOCK_TIMEOUT = 600
+
+
+def _process_shards(directory):
+    """Process unclaimed shards of the job (worker-process entry point)."""
+    return ShardedMatching.load(directory).work()
+
+
+class ShardedMatching:
+    """Matching job split into row shards processed by independent workers.
+
+    The query rows of the signature index are split into contiguous shards.
+    Each shard is matched against the whole index by a worker which writes
+    the found pairs to a partial result file. Workers load the index from
+    disk with memory-mapped vectors, so the signature matrix is shared via
+    the page cache rather than pickled to each worker. Any process (local
+    or running on another machine with a shared file system) may join the
+    job by calling work(): shards are claimed by exclusively creating lock
+    files, so each shard is processed once.
+
+    Each lock file records the owner host and process id and is touched by
+    the owner while the shard is processed. A lock is abandoned if its
+    owner process is dead (checked for the workers on the same host) or if
+    it is not refreshed for lock_timeout seconds. Abandoned shards are
+    reclaimed by work() (and by wait()), so crashed workers don't block the
+    job. A shard may be processed twice only if a live owner stalls for
+    longer than the timeout, which wastes time but gives the same results.
+
+    The job is kept in a directory with the following files:
+        * job.json - job parameters.
+        * query_rows.npy - index rows that must be matched.
+        * shard-<id>.lock - claimed shards and their owners.
+        * shard-<id>.npz - partial results of completed shards.
+    """
+
+    def __init__(self, directory, index_directory, shards, radius,
+                 block_size=DEFAULT_BLOCK_SIZE,
+                 lock_timeout=DEFAULT_LOCK_TIMEOUT):
+        self.directory = directory
+        self.index_directory = index_directory
+        self.shards = shards
+        self.radius = radius
+        self.block_size = block_size
+        self.lock_timeout = lock_timeout
+
+    @staticmethod
+    def exists(directory):
+        """Check if the job exists in the given directory."""
+        return exists(join(directory, "job.json"))
+
+    @staticmethod
+    def create(directory, index_directory, query_rows, shards, radius,
+               block_size=DEFAULT_BLOCK_SIZE,
+               lock_timeout=DEFAULT_LOCK_TIMEOUT):
+        """Create a new job discarding any previous job in the directory.
+
+        Args:
+            directory (String): Job directory.
+            index_directory (String): Directory of the saved signature index
+                (saved as an absolute path, so that workers started from
+                other working directories can find it).
+            query_rows: Index rows that must be matched against the whole
+                index.
+            shards (int): Number of shards.
+            radius (float): Maximal distance between matched signatures.
+            block_size (int): Block size of the range search.
+            lock_timeout (float): Seconds after which a lock which is not
+                refreshed by its owner is considered abandoned.
+        """
+        index_directory = os.path.abspath(index_directory)
+        if exists(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory)
+        np.save(join(directory, "query_rows.npy"),
+                np.asarray(query_rows, dtype=np.int64))
+        job = ShardedMatching(directory, index_directory, shards, radius,
+                              block_size, lock_timeout)
+        with open(join(directory, "job.json"), "w") as file:
+            json.dump(dict(index_directory=index_directory, shards=shards,
+                           radius=radius, block_size=block_size,
+                           lock_timeout=lock_timeout), file)
+        return job
+
+    @staticmethod
+    def load(directory):
+        """Load existing job."""
+        with open(join(directory, "job.json"), "r") as file:
+            return ShardedMatching(directory, **json.load(file))
+
+    def query_rows(self, shard_id):
+        """Get index rows of the given shard."""
+        rows = np.load(join(self.directory, "query_rows.npy"), mmap_mode="r")
+        bounds = np.linspace(0, len(rows), self.shards + 1).astype(np.int64)
+        return np.asarray(rows[bounds[shard_id]:bounds[shard_id + 1]])
+
+    def claim(self, shard_id):
+        """Try to claim the shard. Returns False if it is already claimed."""
+        flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY
+        try:
+            descriptor = os.open(self._lock_path(shard_id), flags)
+        except FileExistsError:
+            return False
+        owner = dict(host=socket.gethostname(), pid=os.getpid(),
+                     claimed=time.time())
+        with os.fdopen(descriptor, "w") as lock_file:
+            json.dump(owner, lock_file)
+        return True
+
+    def abandoned(self, shard_id):
+        """Check if the shard is claimed by a dead or unresponsive worker."""
+        if exists(self._result_path(shard_id)):
+            return False
+        return self._lock_abandoned(self._lock_path(shard_id))
+
+    def reclaim(self, shard_id):
+        """Try to claim the abandoned shard.
+
+        The abandoned lock is renamed to a name unique to the calling
+        process before the shard is claimed, so only one of the concurrent
+        reclaimers takes the shard.
+
+        Returns:
+            False if the shard is not abandoned or is claimed by others.
+        """
+        if not self.abandoned(shard_id):
+            return False
+        lock_path = self._lock_path(shard_id)
+        owner = f"{socket.gethostname()}-{os.getpid()}"
+        stale_path = join(self.directory, f"shard-{shard_id:05}.{owner}.stale")
+        try:
+            os.rename(lock_path, stale_path)
+        except FileNotFoundError:
+            # Reclaimed by others
+            return False
+        if not self._lock_abandoned(stale_path):
+            # The lock was replaced by another reclaimer in the meantime
+            try:
+                os.link(stale_path, lock_path)
+            except FileExistsError:
+                pass
+            os.remove(stale_path)
+            return False
+        os.remove(stale_path)
+        logger.warning("Reclaiming abandoned shard %s of %s",
+                       shard_id + 1, self.shards)
+        return self.claim(shard_id)
+
+    def process(self, shard_id):
+        """Match the shard rows against the whole index and save results."""
+        index = SignatureIndex.load(self.index_directory, load_keys=False)
+        rows = self.query_rows(shard_id)
+        with self._refreshed(shard_id):
+            query_indices, match_rows, distances = collect(index.range_search(
+                index.vectors[rows], radius=self.radius,
+                block_size=self.block_size))
+        # Temporary file is unique as reclaimed shards may be processed twice
+        owner = f"{socket.gethostname()}-{os.getpid()}"
+        temp_path = join(self.directory,
+                         f"shard-{shard_id:05}.{owner}.tmp.npz")
+        np.savez(temp_path, query_rows=rows[query_indices],
+                 match_rows=match_rows, distances=distances)
+        os.replace(temp_path, self._result_path(shard_id))
+
+    def work(self):
+        """Process shards until no unclaimed or abandoned shards are left.
+
+        Returns:
+            Number of processed shards.
+        """
+        processed = 0
+        for shard_id in range(self.shards):
+            if self.claim(shard_id) or self.reclaim(shard_id):
+                logger.info("Processing shard %s of %s",
+                            shard_id + 1, self.shards)
+                self.process(shard_id)
+                processed += 1
+        return processed
+
+    def run(self, processes=None):
+        """Process unclaimed shards with a pool of local worker processes."""
+        processes = min(processes or os.cpu_count(), self.shards)
+        with Pool(processes) as pool:
+            return sum(pool.map(_process_shards,
+                                [self.directory] * processes))
+
+    def completed(self):
+        """Get ids of the completed shards."""
+        return [shard_id for shard_id in range(self.shards)
+                if exists(self._result_path(shard_id))]
+
+    def wait(self, poll_interval=10):
+        """Wait until all shards are completed (including remote workers).
+
+        Shards abandoned by the crashed workers are processed by the calling
+        process.
+        """
+        while len(self.completed()) < self.shards:
+            if self.work() > 0:
+                continue
+            logger.info("Waiting for %s shards",
+                        self.shards - len(self.completed()))
+            time.sleep(poll_interval)
+
+    def merge(self):
+        """Merge partial results of all shards.
+
+        Returns:
+            Tuple (query_rows, match_rows, distances) of equal-length arrays.
+        """
+        query_rows, match_rows, distances = [], [], []
+        for shard_id in range(self.shards):
+            with np.load(self._result_path(shard_id)) as results:
+                query_rows.append(results["query_rows"])
+                match_rows.append(results["match_rows"])
+                distances.append(results["distances"])
+        return (np.concatenate(query_rows), np.concatenate(match_rows),
+                np.concatenate(distances))
+
+    # Private methods
+
+    @contextmanager
+    def _refreshed(self, shard_id):
+        """Keep touching the shard lock to show that its owner is alive."""
+        stopped = threading.Event()
+
+        def refresh():
+            while not stopped.wait(self.lock_timeout / 4):
+                try:
+                    os.utime(self._lock_path(shard_id))
+                except FileNotFoundError:
+                    # The lock may be briefly renamed by a reclaimer
+                    pass
+
+        thread = threading.Thread(target=refresh, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+
+    def _lock_abandoned(self, lock_path):
+        """Check if the lock file is owned by a dead or unresponsive worker."""
+        try:
+            refreshed = os.path.getmtime(lock_path)
+            with open(lock_path, "r") as lock_file:
+                content = lock_file.read()
+        except FileNotFoundError:
+            return False
+        try:
+            owner = json.loads(content)
+        except ValueError:
+            # The owner didn't describe itself yet
+            owner = {}
+        local = owner.get("host") == socket.gethostname()
+        if local and not _process_alive(owner.get("pid")):
+            return True
+        return time.time() - refreshed > self.lock_timeout
+
+    def _lock_path(self, shard_id):
+        return join(self.directory, f"shard-{shard_id:05}.lock")
+
+    def _result_path(self, shard_id):
+        return join(self.directory, f"shard-{shard_id:05}.npz")
+
+
+def _process_alive(pid):
+    """Check if the local process with the given id is running."""
+    if not isinstance(pid, int):
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
@@ -1,20 +1,25 @@
 import datetime
 import os
 import shutil
-from collections import defaultdict
 from glob import glob
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from scipy.spatial.distance import cdist
 
 from winnow.feature_extraction.utils import load_image, download_file
+from winnow.matching.frame_index import template_query, update_frame_index
+from winnow.matching.index import IVFIndex
 from winnow.storage.repr_storage import ReprStorage
 
+# Columns of the template matching report
+REPORT_COLUMNS = ['fn', 'sha256', 'template_name', 'distance',
+                  'closest_match', 'closest_match_time']
+
 
 class SearchEngine:
-    def __init__(self, templates_root, reprs: ReprStorage, model):
+    def __init__(self, templates_root, reprs: ReprStorage, model,
+                 index_method=IVFIndex.method, rebuild_index=False):
 
         templates_glob = os.path.join(templates_root, '*')
 
@@ -24,6 +29,11 @@ class SearchEngine:
         self.reprs = reprs
         self.template_cache = self.load_available_templates()
         self.results_cache = {}
+        # Frame index is extended with the videos extracted since the last
+        # search
+        self.frame_index, self.live_videos = update_frame_index(
+            os.path.join(reprs.directory, 'frame_index'), reprs.frame_level,
+            rebuild=rebuild_index, method=index_method)
 
     def find_available_templates(self):
 
@@ -61,7 +71,8 @@ class SearchEngine:
 
         Returns:
             [pandas.DataFrame] -- Dataframe in the same format as the output
-            from the "generate_matches.py" script
+            from the "generate_matches.py" script (empty if no video is
+            closer than the threshold to any template)
         """
 
         def create_template_summary(files):
@@ -69,44 +80,29 @@ class SearchEngine:
             return resized
 
         if queries is None:
-            for q in self.available_queries:
-                self.find(q, threshold=threshold, plot=False)
-        else:
-            for q in queries:
-                self.find(q, threshold=threshold, plot=False)
+            queries = list(self.available_queries)
+        self.find_all(queries, threshold=threshold)
 
         print(self.available_queries)
 
-        if self.results_cache:
-
-            records = pd.DataFrame.from_records(
-                            self.results_cache,
-                            index=None).reset_index()
-
-            # Massage template matching results
-            df = pd.melt(records, id_vars=['level_0', 'level_1'])
-            msk = df['variable'] != 'Unnamed: 0'
-            df = df.loc[msk, :]
-            # Convert df into a more suitable format to be saved
-            df.rename(
-                columns={
-                    'level_0': 'fn',
-                    'level_1': 'sha256',
-                    'variable': 'template_name'},
-                inplace=True)
-
-            additional_info = df.loc[:, ['value']].to_dict('records')
-            additional_info = [x['value'] for x in additional_info]
-            add_df = pd.DataFrame.from_records(x for x in additional_info)
-            df['distance'] = add_df['distance']
-            df['closest_match'] = add_df['closest_match']
+        records = [
+            {'fn': repr_key.path,
+             'sha256': repr_key.hash,
+             'template_name': query,
+             'distance': match['distance'],
+             'closest_match': match['closest_match']}
+            for query in queries
+            for repr_key, match in self.results_cache[query].items()]
+
+        if records:
+
+            df = pd.DataFrame.from_records(records)
             # This will adjust the time sampling to the sampling rate (ideally
             # this should be sourced from the DB and not from the config file)
             df['closest_match_time'] = df['closest_match'].apply(
                                                 lambda x: datetime.timedelta(
                                                     seconds=x * frame_sampling)
                                                     )
-            df.drop(columns=['value'], inplace=True)
 
             return df
 
@@ -115,55 +111,44 @@ class SearchEngine:
                                         self.templates_root))
 
         else:
-            raise Exception('No matches were found at \
-                            the current distance configuration ({})'.format(
-                                threshold))
+            return pd.DataFrame(columns=REPORT_COLUMNS)
 
     def find(self, query, threshold=0.07, plot=True):
 
-        feats = self.template_cache[query]
-        print('Loaded query embeddings',
-              feats.shape)
-        self.results_cache[query] = defaultdict()
-        for repr_key in self.reprs.frame_level.list():
-            try:
-                sample = self.reprs.frame_level.read(repr_key)
-                video_frames = self.reprs.frames.read(repr_key)
+        self.find_all([query], threshold=threshold, plot=plot)
+
+    def find_all(self, queries, threshold=0.07, plot=False):
+        """Find videos containing frames similar to the templates.
 
-                distances = np.mean(
-                                    cdist(feats, sample, metric='cosine'),
-                                    axis=0)
-
-                self.results_cache[query][repr_key] = dict()
-
-                if len(distances) > 0:
-                    frame_of_interest_index = np.argmin(distances)
-                    min_d = min(distances)
-                else:
-                    frame_of_interest_index = 0
-                    min_d = 1.0
-
-                self.results_cache[query][repr_key]["distance"] = min_d
-                self.results_cache[query][repr_key]["closest_match"] = \
-                    frame_of_interest_index
-
-                if (min_d < threshold) and plot:
-
-                    frame_of_interest = np.hstack(
-                                            video_frames[
-                                                frame_of_interest_index:][:5])
-                    plt.figure(figsize=(20, 10))
-                    plt.imshow(frame_of_interest)
-                    plt.show()
-
-            except Exception as e:
-                print(
-                    'Error:',
-                    e,
-                    distances,
-                    repr_key,
-                    frame_of_interest_index)
-                pass
+        All templates are searched by a single frame index lookup. Distance
+        between a template and a frame is the mean cosine distance to the
+        template images. Only the videos having a frame closer than the
+        threshold are stored in the results cache along with the closest frame.
+        """
+
+        feats = np.array([template_query(self.template_cache[query])
+                          for query in queries])
+        print('Loaded query embeddings', feats.shape)
+        query_ids, video_ids, offsets, distances = self.frame_index.search(
+            feats, threshold, videos=self.live_videos)
+
+        for query in queries:
+            self.results_cache[query] = dict()
+
+        results = zip(query_ids, video_ids, offsets, distances)
+        for query_id, video_id, offset, distance in results:
+            repr_key = self.frame_index.keys[video_id]
+            self.results_cache[queries[query_id]][repr_key] = {
+                "distance": float(distance),
+                "closest_match": int(offset)}
+
+            if plot:
+                # Frames are read only for the found videos
+                video_frames = self.reprs.frames.read(repr_key)
+                frame_of_interest = np.hstack(video_frames[offset:][:5])
+                plt.figure(figsize=(20, 10))
+                plt.imshow(frame_of_interest)
+                plt.show()
 
 
 def download_sample_templates(
@@ -0,0 +1,109 @@
+import logging
+import os
+import time
+from os.path import join, exists
+from uuid import uuid4 as uuid
+
+import numpy as np
+
+from winnow.storage.matrix_file import MatrixFile
+
+logger = logging.getLogger(__name__)
+
+# Temporary files not modified for this number of seconds are
+# considered to be left by interrupted writers
+STALE_TEMP_SECONDS = 24 * 60 * 60
+
+
+class BufferedChunkWriter:
+    """Incremental writer for storages without native chunked writes.
+
+    Chunks are collected in memory and the concatenated value is written
+    to the storage when the writer is closed.
+    """
+
+    def __init__(self, store, key):
+        self.store = store
+        self.key = key
+        self._chunks = []
+
+    def append(self, values):
+        """Append rows to the representation value."""
+        self._chunks.append(np.asarray(values))
+
+    def close(self):
+        """Write the representation value."""
+        value = np.concatenate(self._chunks) if self._chunks else np.array([])
+        self.store.write(self.key, value)
+        self._chunks = []
+
+    def discard(self):
+        """Forget the written chunks."""
+        self._chunks = []
+
+
+class MatrixChunkWriter:
+    """Incremental writer of a representation value saved as a .npy file.
+
+    Chunks are appended to a temporary .npy file as soon as they arrive, so
+    the whole value is never kept in memory. On close the temporary file
+    replaces the target file and the on_close callback is called (e.g. to
+    commit the storage metadata).
+
+    If temp_directory is specified, the temporary file gets a unique name
+    in that directory (which must be on the same file system as the target
+    file), so that files left by interrupted writers don't pollute the
+    target directory and may be removed by remove_stale_temp_files().
+    """
+
+    def __init__(self, path, on_close=None, temp_directory=None):
+        self.path = path
+        if temp_directory is None:
+            self._temp_path = f"{path}.partial.npy"
+        else:
+            os.makedirs(temp_directory, exist_ok=True)
+            self._temp_path = join(temp_directory, f"{uuid()}.partial.npy")
+        self._on_close = on_close
+        self._matrix = None
+
+    def append(self, values):
+        """Append rows to the representation value."""
+        values = np.asarray(values)
+        if self._matrix is None:
+            self._matrix = MatrixFile(
+                self._temp_path, row_shape=values.shape[1:],
+                dtype=values.dtype, shared=False)
+        self._matrix.append(values)
+
+    def close(self):
+        """Save the representation value."""
+        if self._matrix is None:
+            np.save(self._temp_path, np.array([]))
+        os.replace(self._temp_path, self.path)
+        self._matrix = None
+        if self._on_close is not None:
+            self._on_close()
+
+    def discard(self):
+        """Delete the partially written value."""
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+        self._matrix = None
+
+
+def remove_stale_temp_files(temp_directory, max_age=STALE_TEMP_SECONDS):
+    """Remove temporary files left by interrupted MatrixChunkWriters.
+
+    Files are removed only if they are not modified for max_age seconds,
+    so the files of the writers running in other processes are kept.
+    """
+    if not exists(temp_directory):
+        return
+    now = time.time()
+    for entry in os.scandir(temp_directory):
+        try:
+            if entry.is_file() and now - entry.stat().st_mtime > max_age:
+                logger.info("Removing stale temporary file: %s", entry.path)
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
@@ -368,6 +368,46 @@ class DBResultStorage:
                     new_files.append(new_file)
                 session.add_all(new_files)
 
+    def existing_gray_max(self, file_identifiers):
+        """Get brightness estimations already saved in the files metadata.
+
+        Args:
+            file_identifiers: Iterable of (path, sha256) pairs.
+
+        Returns:
+            Dictionary mapping (path, sha256) pairs to the saved gray_max
+            value.
+        """
+        existing = {}
+        for chunk in chunks(file_identifiers, size=1000):
+            with self.database.session_scope() as session:
+                query = session.query(
+                    Files.file_path, Files.sha256, VideoMetadata.gray_max)
+                query = query.join(Files.meta)
+                query = query.filter(self._by_path_and_hash(chunk),
+                                     VideoMetadata.gray_max.isnot(None))
+                existing.update(((path, sha256), gray_max)
+                                for path, sha256, gray_max in query.all())
+        return existing
+
+    def existing_exifs(self, file_identifiers):
+        """Get files which already have exif metadata.
+
+        Args:
+            file_identifiers: Iterable of (path, sha256) pairs.
+
+        Returns:
+            Set of (path, sha256) pairs of the files having exif.
+        """
+        existing = set()
+        for chunk in chunks(file_identifiers, size=1000):
+            with self.database.session_scope() as session:
+                query = session.query(Files.file_path, Files.sha256)
+                query = query.join(Files.exif)
+                query = query.filter(self._by_path_and_hash(chunk))
+                existing.update(query.all())
+        return existing
+
     @staticmethod
     def _by_path_and_hash(file_identifiers):
         """Get file bulk filter by path and hash pairs."""
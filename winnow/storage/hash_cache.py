@@ -0,0 +1,176 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from os.path import abspath, exists, join
+
+import lmdb
+from dataclasses import dataclass, asdict
+
+# Logger used in representation-storage module
+logger = logging.getLogger(__name__)
+
+# String encoding used in cache keys
+_KEY_ENCODING = "utf-8"
+
+# Size of the file chunks read while hashing. Large chunks reduce the
+# number of system calls which matters for multi-gigabyte video files.
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+# Number of files hashed concurrently
+DEFAULT_HASH_THREADS = 4
+
+# LMDB doesn't allow to open the same environment twice in a single
+# process, so all caches with the same directory share one environment.
+_environments = {}  # path => (pid, environment)
+_environments_lock = threading.Lock()
+
+
+def _open_environment(path):
+    """Get LMDB environment shared by all caches of the current process."""
+    with _environments_lock:
+        pid, environment = _environments.get(path, (None, None))
+        if environment is not None and pid != os.getpid():
+            # Environment inherited through fork must not be used
+            # by the child process and it cannot be reopened either.
+            environment.close()
+            environment = None
+        if environment is None:
+            environment = lmdb.open(path)
+            _environments[path] = (os.getpid(), environment)
+        return environment
+
+
+def compute_hash(path, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Calculate SHA-256 hash of the file content."""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while True:
+            data = file.read(buffer_size)
+            if not data:
+                break
+            sha256.update(data)
+    return sha256.hexdigest()
+
+
+@dataclass
+class FileStat:
+    """File attributes which change whenever the file content is modified."""
+    size: int
+    mtime_ns: int
+    inode: int
+
+    @staticmethod
+    def of(path):
+        """Get attributes of the file."""
+        stat = os.stat(path)
+        return FileStat(size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                        inode=stat.st_ino)
+
+
+class HashCache:
+    """Persistent cache of file content hashes.
+
+    Hash of each file is saved along with the file size, modification time
+    and inode number. The cached hash is reused only if none of them has
+    changed since then, so modified or replaced files are always rehashed.
+    """
+
+    def __init__(self, directory, buffer_size=DEFAULT_BUFFER_SIZE):
+        """Create a new HashCache instance.
+
+        Args:
+            directory (String): A directory in which the cache will be stored.
+            buffer_size (int): Size of the file chunks read while hashing.
+        """
+        self.directory = abspath(directory)
+        self.buffer_size = buffer_size
+        if not exists(self.directory):
+            logger.info("Creating hash cache directory: %s", self.directory)
+            os.makedirs(self.directory)
+
+    def get(self, path):
+        """Get the cached hash of the file.
+
+        Returns None if the file was modified since it was hashed.
+        """
+        path = abspath(path)
+        with self._env().begin(write=False) as txn:
+            return self._get(txn, path, FileStat.of(path))
+
+    def hash(self, path):
+        """Get hash of the file content.
+
+        The hash is calculated only if the file is not in the cache.
+        """
+        return self.hash_many([path], threads=1)[0]
+
+    def hash_many(self, paths, threads=DEFAULT_HASH_THREADS, stats=None):
+        """Get hashes of multiple files.
+
+        The missing hashes are calculated concurrently.
+
+        Args:
+            paths: Iterable over file paths.
+            threads (int): Number of files hashed concurrently.
+            stats: Optional list of already known FileStat of each file (e.g.
+                collected by the scanner).
+
+        Returns:
+            List of hashes in the order of the given paths.
+        """
+        paths = [abspath(path) for path in paths]
+        stats = stats or [None] * len(paths)
+        stats = [stat or FileStat.of(path) for path, stat in zip(paths, stats)]
+        with self._env().begin(write=False) as txn:
+            hashes = [self._get(txn, path, stat)
+                      for path, stat in zip(paths, stats)]
+        missing = [i for i, value in enumerate(hashes) if value is None]
+        if not missing:
+            return hashes
+        with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+            computed = executor.map(
+                lambda i: compute_hash(paths[i], self.buffer_size), missing)
+            for i, value in zip(missing, computed):
+                hashes[i] = value
+        with self._env().begin(write=True) as txn:
+            for i in missing:
+                txn.put(paths[i].encode(_KEY_ENCODING),
+                        self._dump(hashes[i], stats[i]))
+        return hashes
+
+    def invalidate(self, paths=None):
+        """Forget cached hashes of the given files (all files by default)."""
+        with self._env().begin(write=True) as txn:
+            if paths is None:
+                txn.drop(self._env().open_db(txn=txn), delete=False)
+                return
+            for path in paths:
+                txn.delete(abspath(path).encode(_KEY_ENCODING))
+
+    def __len__(self):
+        return self._env().stat()["entries"]
+
+    def _env(self):
+        """Get LMDB environment opening it lazily in each process."""
+        return _open_environment(join(self.directory, "hash_cache.lmdb"))
+
+    @staticmethod
+    def _get(txn, path, stat):
+        """Get the cached hash using the given transaction."""
+        serialized = txn.get(path.encode(_KEY_ENCODING))
+        if serialized is None:
+            return None
+        entry = json.loads(serialized.decode(_KEY_ENCODING))
+        value = entry.pop("hash")
+        if FileStat(**entry) != stat:
+            return None
+        return value
+
+    @staticmethod
+    def _dump(value, stat):
+        """Serialize cache entry."""
+        entry = dict(hash=value, **asdict(stat))
+        return json.dumps(entry).encode(_KEY_ENCODING)
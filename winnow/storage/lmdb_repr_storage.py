@@ -1,6 +1,7 @@
 import json
 import logging
 import os
+from contextlib import contextmanager
 from glob import glob
 from os.path import join, relpath, abspath, exists, dirname
 
@@ -8,7 +9,9 @@ import lmdb
 import numpy as np
 from dataclasses import dataclass, asdict
 
-from winnow.storage.repr_key import ReprKey
+from winnow.storage.chunk_writer import (
+    BufferedChunkWriter, MatrixChunkWriter, remove_stale_temp_files)
+from winnow.storage.repr_key import ReprKey, in_partition
 
 # Logger used in representation-storage module
 logger = logging.getLogger(__name__)
@@ -18,6 +21,13 @@ logger.addHandler(output_file_handler)
 # String encoding used in tag storage
 _METADATA_ENCODING = "utf-8"
 
+# Default number of writes grouped into a single transaction
+DEFAULT_COMMIT_INTERVAL = 1000
+
+# Directory of partially written representation files (hidden from the
+# storage directory scans)
+_TEMP_DIRECTORY = ".partial"
+
 
 @dataclass
 class Metadata:
@@ -75,6 +85,7 @@ class LMDBReprStorage:
             logger.info("Creating intermediate representations directory: %s", self.directory)
             os.makedirs(self.directory)
         self._metadata_storage = lmdb.open(join(self.directory, "store.lmdb"))
+        remove_stale_temp_files(join(self.directory, _TEMP_DIRECTORY))
 
     def exists(self, key: ReprKey):
         """Check if the representation exists."""
@@ -94,14 +105,86 @@ class LMDBReprStorage:
             raise KeyError(repr(key))
         return self._load(self._map(key.path))
 
+    def exists_many(self, keys):
+        """Check if the representations exist using a single transaction.
+
+        Returns:
+            List of booleans in the order of the given keys.
+        """
+        with self._metadata_storage.begin(write=False) as txn:
+            return [
+                self._read_metadata(key.path, txn) == Metadata.from_key(key)
+                and exists(self._map(key.path))
+                for key in keys
+            ]
+
     def write(self, key: ReprKey, value):
         """Write the representation for the given file."""
         with self._metadata_storage.begin(write=True) as txn:
-            feature_file_path = self._map(key.path)
-            if not exists(dirname(feature_file_path)):
-                os.makedirs(dirname(feature_file_path))
-            self._save(feature_file_path, value)
-            self._write_metadata(key, txn)
+            self._write_entry(key, value, txn)
+
+    @contextmanager
+    def batch(self, commit_interval=DEFAULT_COMMIT_INTERVAL):
+        """Group multiple writes into shared transactions.
+
+        Metadata of every commit_interval writes is committed at once. All
+        pending writes are committed when the context is exited (even if it
+        is exited with an exception, as the saved files are already valid).
+
+        Yields:
+            Function write(key, value) to add a representation to the batch.
+        """
+        txn = self._metadata_storage.begin(write=True)
+        pending = 0
+
+        def write(key: ReprKey, value):
+            nonlocal txn, pending
+            self._write_entry(key, value, txn)
+            pending += 1
+            if pending >= commit_interval:
+                txn.commit()
+                txn = self._metadata_storage.begin(write=True)
+                pending = 0
+
+        try:
+            yield write
+        finally:
+            txn.commit()
+
+    def write_many(self, entries, commit_interval=DEFAULT_COMMIT_INTERVAL):
+        """Write multiple representations with batched transactions.
+
+        Args:
+            entries: Iterable over (key, value) pairs.
+            commit_interval (int): Number of writes committed at once.
+        """
+        with self.batch(commit_interval) as write:
+            for key, value in entries:
+                write(key, value)
+
+    def open_chunked(self, key: ReprKey):
+        """Open incremental writer of the representation value.
+
+        The value is written in chunks of rows (e.g. frame-level features of
+        a long video) and is committed to the storage when the writer is
+        closed.
+
+        Returns:
+            Writer object with append(values), close() and discard() methods.
+        """
+        if self._save is not np.save or self.suffix != ".npy":
+            return BufferedChunkWriter(self, key)
+        feature_file_path = self._map(key.path)
+        if not exists(dirname(feature_file_path)):
+            os.makedirs(dirname(feature_file_path))
+
+        def commit_metadata():
+            with self._metadata_storage.begin(write=True) as txn:
+                self._write_metadata(key, txn)
+
+        temp_directory = join(self.directory, _TEMP_DIRECTORY)
+        return MatrixChunkWriter(feature_file_path, on_close=commit_metadata,
+                                 temp_directory=temp_directory)
 
     def delete(self, path):
         """Delete representation for the file."""
@@ -109,14 +192,31 @@ class LMDBReprStorage:
             os.remove(self._map(path))
             self._delete_metadata(path, txn)
 
-    def list(self):
-        """Iterate over all storage keys."""
-        path_pattern = join(self.directory, f"**/*{self.suffix}")
+    def list(self, prefix=None, partition=None, check=False):
+        """Iterate over all storage keys.
+
+        The keys are read from the metadata storage without scanning the
+        storage directory.
+
+        Args:
+            prefix (String): List only paths starting with the prefix.
+            partition (Tuple[int,int]): List only paths of the partition
+                (index, count).
+            check (bool): Skip keys without representation file and report
+                files without metadata (requires a full scan of the storage
+                directory).
+        """
         with self._metadata_storage.begin(write=False) as txn:
-            for repr_file_path in glob(path_pattern, recursive=True):
-                original_path = self._reverse(repr_file_path)
-                metadata = self._read_metadata(original_path, txn)
+            for original_path, metadata in self._entries(txn, prefix):
+                if not in_partition(original_path, partition):
+                    continue
+                if check and not exists(self._map(original_path)):
+                    logger.warning(
+                        f"Representation file is missing: {original_path}")
+                    continue
                 yield ReprKey(path=original_path, hash=metadata.hash, tag=metadata.tag)
+            if check:
+                self._check_orphans(txn, prefix, partition)
 
     # Private methods
 
@@ -131,6 +231,40 @@ class LMDBReprStorage:
             raise ValueError(f"Not a reversible path: {mapped_path}")
         return relative_path[:-len(self.suffix)]
 
+    def _write_entry(self, key: ReprKey, value, txn):
+        """Save representation file and write metadata in the transaction."""
+        feature_file_path = self._map(key.path)
+        if not exists(dirname(feature_file_path)):
+            os.makedirs(dirname(feature_file_path))
+        self._save(feature_file_path, value)
+        self._write_metadata(key, txn)
+
+    @staticmethod
+    def _entries(txn, prefix=None):
+        """Iterate over (path, metadata) pairs with the given path prefix."""
+        prefix = (prefix or "").encode(_METADATA_ENCODING)
+        cursor = txn.cursor()
+        if not cursor.set_range(prefix):
+            return
+        for metadata_key, serialized_metadata in cursor:
+            if not metadata_key.startswith(prefix):
+                break
+            yield (metadata_key.decode(_METADATA_ENCODING),
+                   Metadata.load(serialized_metadata))
+
+    def _check_orphans(self, txn, prefix, partition):
+        """Report representation files without metadata."""
+        path_pattern = join(self.directory, f"**/*{self.suffix}")
+        for repr_file_path in glob(path_pattern, recursive=True):
+            original_path = self._reverse(repr_file_path)
+            if not original_path.startswith(prefix or ""):
+                continue
+            if not in_partition(original_path, partition):
+                continue
+            if self._read_metadata(original_path, txn) is None:
+                logger.warning(
+                    f"Representation file without metadata: {repr_file_path}")
+
     @staticmethod
     def _read_metadata(path, txn):
         """Read metadata for the given video-file."""
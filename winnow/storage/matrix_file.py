@@ -0,0 +1,196 @@
+import fcntl
+import os
+import struct
+from ast import literal_eval
+from contextlib import contextmanager
+from os.path import abspath, exists
+
+import numpy as np
+
+# The matrix is kept in a regular .npy file so that it can be loaded by
+# numpy.load(..., mmap_mode='r') and any other numpy-aware tool. The
+# header size is fixed, which makes it possible to rewrite the header
+# in-place whenever new rows are appended to the end of the file.
+_MAGIC = b"\x93NUMPY\x01\x00"
+_HEADER_SIZE = 128
+
+
+class MatrixFile:
+    """Append-only matrix stored in a single memory-mapped .npy file.
+
+    Each row has the same fixed shape and dtype. New rows are appended
+    to the end of the file and the header is updated afterwards, so an
+    interrupted append never exposes partially written rows. Reads go
+    through a memory map, so loading the whole matrix doesn't copy data.
+
+    The file may be shared by multiple processes. Appends are serialized
+    by an exclusive lock on the adjacent .lock file and the number of rows
+    is reloaded from the header whenever rows appended by the other
+    processes may be requested. Files private to a single writer (e.g.
+    temporary files) may be opened with shared=False to skip locking.
+    """
+
+    def __init__(self, path, row_shape=None, dtype=np.float32, shared=True):
+        """Open existing or create a new matrix file.
+
+        Args:
+            path (String): Path to the .npy file.
+            row_shape (Tuple[int]): Shape of a single row. Required only
+                when the file doesn't exist.
+            dtype: Matrix data type. Ignored when the file already exists.
+            shared (bool): Synchronize access of multiple processes.
+        """
+        self.path = abspath(path)
+        self._lock_path = self.path + ".lock" if shared else None
+        if row_shape is None and not exists(self.path):
+            raise FileNotFoundError(self.path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._locked():
+            if exists(self.path):
+                self.dtype, self.row_shape, self._rows = \
+                    self._read_header(self.path)
+            else:
+                self.dtype = np.dtype(dtype)
+                self.row_shape = tuple(row_shape)
+                self._rows = 0
+                with open(self.path, "wb") as file:
+                    self._write_header(file)
+        self._mmap = None
+
+    @property
+    def rows(self):
+        """Number of rows in the matrix."""
+        return self._rows
+
+    def __len__(self):
+        return self._rows
+
+    def append(self, values):
+        """Append rows to the end of the matrix.
+
+        Args:
+            values: Array of shape (n,) + row_shape.
+
+        Returns:
+            Index of the first appended row.
+        """
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        values = values.reshape((-1,) + self.row_shape)
+        with self._locked():
+            # Rows might be appended by other processes
+            _, _, start = self._read_header(self.path)
+            with open(self.path, "r+b") as file:
+                # Discard any garbage left by interrupted appends
+                file.truncate(self._offset(start))
+                file.seek(0, os.SEEK_END)
+                file.write(values.tobytes())
+                self._rows = start + len(values)
+                self._write_header(file)
+        self._mmap = None
+        return start
+
+    def write(self, index, value):
+        """Overwrite a single existing row in-place."""
+        self._check_index(index)
+        value = np.ascontiguousarray(value, dtype=self.dtype)
+        value = value.reshape(self.row_shape)
+        with open(self.path, "r+b") as file:
+            file.seek(self._offset(index))
+            file.write(value.tobytes())
+
+    def truncate(self, rows):
+        """Discard all rows starting from the given index."""
+        with self._locked():
+            _, _, self._rows = self._read_header(self.path)
+            if not 0 <= rows <= self._rows:
+                raise IndexError(rows)
+            with open(self.path, "r+b") as file:
+                file.truncate(self._offset(rows))
+                self._rows = rows
+                self._write_header(file)
+        self._mmap = None
+
+    def refresh(self):
+        """Reload the number of rows appended by other processes."""
+        with self._locked(exclusive=False):
+            _, _, rows = self._read_header(self.path)
+        if rows != self._rows:
+            self._rows = rows
+            self._mmap = None
+
+    def matrix(self):
+        """Get read-only memory-mapped view of the whole matrix."""
+        self.refresh()
+        if self._rows == 0:
+            return np.empty((0,) + self.row_shape, dtype=self.dtype)
+        if self._mmap is None:
+            self._mmap = np.memmap(
+                self.path, dtype=self.dtype, mode="r", offset=_HEADER_SIZE,
+                shape=(self._rows,) + self.row_shape)
+        return self._mmap
+
+    def read(self, index):
+        """Read a single row."""
+        self._check_index(index)
+        if self._mmap is None:
+            self.matrix()
+        return np.array(self._mmap[index])
+
+    # Private methods
+
+    def _check_index(self, index):
+        """Check that the row exists reloading the number of rows if needed."""
+        if index >= self._rows:
+            self.refresh()
+        if not 0 <= index < self._rows:
+            raise IndexError(index)
+
+    @contextmanager
+    def _locked(self, exclusive=True):
+        """Hold the file lock shared by all processes using the matrix."""
+        if self._lock_path is None:
+            yield
+            return
+        with open(self._lock_path, "a") as lock_file:
+            mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _offset(self, index):
+        """Get file offset of the row with the given index."""
+        row_items = int(np.prod(self.row_shape, dtype=np.int64))
+        row_size = row_items * self.dtype.itemsize
+        return _HEADER_SIZE + index * row_size
+
+    def _write_header(self, file):
+        """Write .npy header reflecting the current matrix shape."""
+        header = repr({
+            "descr": np.lib.format.dtype_to_descr(self.dtype),
+            "fortran_order": False,
+            "shape": (self._rows,) + self.row_shape,
+        })
+        header_length = _HEADER_SIZE - len(_MAGIC) - 2
+        header = header.ljust(header_length - 1) + "\n"
+        if len(header) > header_length:
+            shape = (self._rows,) + self.row_shape
+            raise ValueError(f"Matrix shape is too large: {shape}")
+        file.seek(0)
+        file.write(_MAGIC + struct.pack("<H", header_length)
+                   + header.encode("latin1"))
+
+    @staticmethod
+    def _read_header(path):
+        """Read dtype, row shape and number of rows from the file header."""
+        with open(path, "rb") as file:
+            prefix = file.read(len(_MAGIC) + 2)
+            if prefix[:len(_MAGIC)] != _MAGIC:
+                raise ValueError(f"Not a matrix file: {path}")
+            (header_length,) = struct.unpack("<H", prefix[len(_MAGIC):])
+            if len(_MAGIC) + 2 + header_length != _HEADER_SIZE:
+                raise ValueError(f"Unexpected matrix header size: {path}")
+            header = literal_eval(file.read(header_length).decode("latin1"))
+        shape = tuple(header["shape"])
+        return np.dtype(header["descr"]), shape[1:], shape[0]
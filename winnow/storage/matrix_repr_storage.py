@@ -0,0 +1,275 @@
+import json
+import logging
+import os
+from os.path import join, abspath, exists
+
+import lmdb
+import numpy as np
+from dataclasses import dataclass, asdict
+
+from winnow.storage.matrix_file import MatrixFile
+from winnow.storage.repr_key import ReprKey, in_partition
+
+# Logger used in representation-storage module
+logger = logging.getLogger(__name__)
+
+# String encoding used in index storage
+_METADATA_ENCODING = "utf-8"
+
+# Default number of writes grouped into a single transaction
+DEFAULT_COMMIT_INTERVAL = 1000
+
+
+@dataclass
+class RowMetadata:
+    """Storage entry metadata."""
+    hash: str  # data file hash
+    tag: str  # pipeline configuration tag
+    row: int  # matrix row containing the representation value
+
+    def dump(self):
+        """Convert metadata to bytes."""
+        return json.dumps(asdict(self)).encode(_METADATA_ENCODING)
+
+    @staticmethod
+    def load(data: bytes):
+        """Load metadata from bytes."""
+        return RowMetadata(**json.loads(data.decode(_METADATA_ENCODING)))
+
+    def matches(self, key: ReprKey):
+        """Check if metadata corresponds to the given key."""
+        return self.hash == key.hash and self.tag == key.tag
+
+
+class MatrixReprStorage:
+    """Compact persistent storage for fixed-width intermediate representations.
+
+    All representation values must have the same shape (e.g. video-level
+    features or signatures). The values are kept as rows of a single
+    append-only memory-mapped float32 matrix, and LMDB maps each dataset
+    file path to the file hash, configuration tag and the matrix row. This
+    avoids one file per representation and allows to load all values at
+    once as a single memory-mapped matrix (see read_matrix).
+
+    Rewriting an existing path overwrites its row in-place. Deleted rows
+    are not reused.
+
+    The same storage directory may be written by multiple processes: the
+    new rows are appended under the matrix file lock and the matrix file
+    is opened on first use, so it may be created by another process.
+
+    It is responsibility of client code to make sure that incompatible
+    pipeline configurations have different key tags.
+    """
+
+    def __init__(self, directory, dtype=np.float32, row_shape=None):
+        """Create a new MatrixReprStorage instance.
+
+        Args:
+            directory (String): A root directory in which representations
+                will be stored.
+            dtype: Data type of stored values.
+            row_shape (Tuple[int]): Expected shape of a single value. Used
+                to shape the empty matrix before any value is written.
+        """
+        self.directory = abspath(directory)
+        self.dtype = np.dtype(dtype)
+        self.row_shape = None if row_shape is None else tuple(row_shape)
+        if not exists(self.directory):
+            logger.info("Creating intermediate representations directory: %s",
+                        self.directory)
+            os.makedirs(self.directory)
+        self._matrix_path = join(self.directory, "matrix.npy")
+        self._matrix = None  # Opened on first use
+        self._index = lmdb.open(join(self.directory, "matrix_index.lmdb"))
+
+    def exists(self, key: ReprKey):
+        """Check if the representation exists."""
+        with self._index.begin(write=False) as txn:
+            return self._exists(key, txn)
+
+    def read(self, key: ReprKey):
+        """Read file's representation."""
+        with self._index.begin(write=False) as txn:
+            metadata = self._read_metadata(key.path, txn)
+        matrix = self._open_matrix()
+        if metadata is None or not metadata.matches(key) or matrix is None:
+            raise KeyError(repr(key))
+        return matrix.read(metadata.row)
+
+    def write(self, key: ReprKey, value):
+        """Write the representation for the given file."""
+        value = np.asarray(value, dtype=self.dtype)
+        matrix = self._get_matrix(value.shape)
+        with self._index.begin(write=True) as txn:
+            metadata = self._read_metadata(key.path, txn)
+            if metadata is not None:
+                matrix.write(metadata.row, value)
+                row = metadata.row
+            else:
+                row = matrix.append(value[np.newaxis])
+            self._write_metadata(key, row, txn)
+
+    def exists_many(self, keys):
+        """Check if the representations exist using a single transaction.
+
+        Returns:
+            List of booleans in the order of the given keys.
+        """
+        with self._index.begin(write=False) as txn:
+            return [self._exists(key, txn) for key in keys]
+
+    def write_many(self, entries, commit_interval=DEFAULT_COMMIT_INTERVAL):
+        """Write multiple representations with batched transactions.
+
+        New rows of every commit_interval entries are appended to the matrix
+        at once and their index entries are committed in a single transaction.
+
+        Args:
+            entries: Iterable over (key, value) pairs.
+            commit_interval (int): Number of entries committed at once.
+        """
+        chunk = []
+        for entry in entries:
+            chunk.append(entry)
+            if len(chunk) >= commit_interval:
+                self._write_chunk(chunk)
+                chunk = []
+        if chunk:
+            self._write_chunk(chunk)
+
+    def delete(self, path):
+        """Delete representation for the file."""
+        with self._index.begin(write=True) as txn:
+            if not txn.delete(path.encode(_METADATA_ENCODING)):
+                raise KeyError(path)
+
+    def list(self, prefix=None, partition=None, check=False):
+        """Iterate over all storage keys.
+
+        Args:
+            prefix (String): List only paths starting with the prefix.
+            partition (Tuple[int,int]): List only paths of the partition
+                (index, count).
+            check (bool): Skip keys referring to rows missing from the matrix
+                file.
+        """
+        matrix = self._open_matrix()
+        if matrix is not None:
+            matrix.refresh()
+        rows = 0 if matrix is None else len(matrix)
+        for key, row in self._entries(prefix):
+            if not in_partition(key.path, partition):
+                continue
+            if check and row >= rows:
+                logger.warning(f"Representation row is missing: {key.path}")
+                continue
+            yield key
+
+    def read_matrix(self, select=None):
+        """Read multiple representations as a single matrix.
+
+        When select is None and no entries were deleted the returned
+        matrix is a zero-copy memory-mapped view.
+
+        Args:
+            select: Iterable over storage keys. Missing keys are skipped.
+
+        Returns:
+            Tuple (keys, matrix) where i-th matrix row holds representation
+            for the i-th key.
+        """
+        if select is None:
+            entries = sorted(self._entries(), key=lambda entry: entry[1])
+        else:
+            with self._index.begin(write=False) as txn:
+                entries = [(key, self._read_metadata(key.path, txn))
+                           for key in select]
+            entries = [(key, metadata.row) for key, metadata in entries
+                       if metadata is not None and metadata.matches(key)]
+        keys = [key for key, _ in entries]
+        matrix_file = self._open_matrix()
+        if matrix_file is None:
+            return keys, np.empty((0,) + (self.row_shape or (0,)),
+                                  dtype=self.dtype)
+        rows = np.array([row for _, row in entries], dtype=np.int64)
+        matrix = matrix_file.matrix()
+        if np.array_equal(rows, np.arange(len(matrix))):
+            return keys, matrix
+        return keys, matrix[rows]
+
+    # Private methods
+
+    def _open_matrix(self):
+        """Get matrix file or None if it is not created yet."""
+        if self._matrix is None and exists(self._matrix_path):
+            self._matrix = MatrixFile(self._matrix_path)
+        return self._matrix
+
+    def _get_matrix(self, row_shape):
+        """Get matrix file, create one if doesn't exist."""
+        if self.row_shape is not None and tuple(row_shape) != self.row_shape:
+            raise ValueError(
+                f"Unexpected representation shape: {row_shape}, "
+                f"expected: {self.row_shape}")
+        if self._open_matrix() is None:
+            self._matrix = MatrixFile(
+                self._matrix_path, row_shape=row_shape, dtype=self.dtype)
+        if tuple(row_shape) != self._matrix.row_shape:
+            raise ValueError(
+                f"Unexpected representation shape: {row_shape}, "
+                f"expected: {self._matrix.row_shape}")
+        return self._matrix
+
+    def _write_chunk(self, entries):
+        """Write entries using a single transaction and a single append."""
+        with self._index.begin(write=True) as txn:
+            new_rows = {}
+            for key, value in entries:
+                value = np.asarray(value, dtype=self.dtype)
+                matrix = self._get_matrix(value.shape)
+                metadata = self._read_metadata(key.path, txn)
+                if metadata is not None:
+                    matrix.write(metadata.row, value)
+                    self._write_metadata(key, metadata.row, txn)
+                else:
+                    new_rows[key.path] = (key, value)
+            if new_rows:
+                values = [value for _, value in new_rows.values()]
+                start = self._matrix.append(np.array(values))
+                for row, (key, _) in enumerate(new_rows.values(), start=start):
+                    self._write_metadata(key, row, txn)
+
+    def _exists(self, key: ReprKey, txn):
+        """Check if the representation exists using the given transaction."""
+        metadata = self._read_metadata(key.path, txn)
+        return metadata is not None and metadata.matches(key)
+
+    def _entries(self, prefix=None):
+        """Iterate over (key, row) pairs with the given path prefix."""
+        prefix = (prefix or "").encode(_METADATA_ENCODING)
+        with self._index.begin(write=False) as txn:
+            cursor = txn.cursor()
+            if not cursor.set_range(prefix):
+                return
+            for path, serialized in cursor:
+                if not path.startswith(prefix):
+                    break
+                metadata = RowMetadata.load(serialized)
+                key = ReprKey(path=path.decode(_METADATA_ENCODING),
+                              hash=metadata.hash, tag=metadata.tag)
+                yield key, metadata.row
+
+    @staticmethod
+    def _read_metadata(path, txn):
+        """Read metadata for the given video-file."""
+        serialized = txn.get(path.encode(_METADATA_ENCODING))
+        if serialized is None:
+            return None
+        return RowMetadata.load(serialized)
+
+    @staticmethod
+    def _write_metadata(key: ReprKey, row, txn):
+        """Write metadata for the given video-file."""
+        metadata = RowMetadata(hash=key.hash, tag=key.tag, row=int(row))
+        txn.put(key.path.encode(_METADATA_ENCODING), metadata.dump())
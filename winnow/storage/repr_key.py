@@ -1,3 +1,5 @@
+import zlib
+
 from dataclasses import dataclass
 
 
@@ -16,3 +18,20 @@ class ReprKey:
     path: str  # video file path relative to dataset root folder
     hash: str  # video file hash
     tag: str = None  # pipeline configuration tag
+
+
+def in_partition(path, partition=None):
+    """Check if the source file path belongs to the given partition.
+
+    Paths are assigned to partitions by a stable hash, so that independent
+    workers listing the same storage get disjoint subsets of keys.
+
+    Args:
+        path (String): Source file path relative to dataset root folder.
+        partition (Tuple[int,int]): Pair (index, count) or None which means
+            all paths.
+    """
+    if partition is None:
+        return True
+    index, count = partition
+    return zlib.crc32(path.encode("utf-8")) % count == index
@@ -1,22 +1,37 @@
 from os.path import join, abspath
 
 from .lmdb_repr_storage import LMDBReprStorage
+from .matrix_repr_storage import MatrixReprStorage
+
+# Storage types available for fixed-width representations (video-level
+# features and signatures)
+VECTOR_STORAGE_TYPES = {"lmdb": LMDBReprStorage, "matrix": MatrixReprStorage}
 
 
 class ReprStorage:
     """Persistent storage of various intermediate representations."""
 
-    def __init__(self, directory, storage_factory=LMDBReprStorage):
+    def __init__(self, directory, storage_factory=LMDBReprStorage,
+                 vector_storage_factory=None):
         """Create new storage instance.
 
         Args:
             directory (String): Directory in which all representations will be stored.
+            storage_factory: Storage type of the representations.
+            vector_storage_factory: Storage type of the video-level features
+                and signatures (e.g. MatrixReprStorage). Defaults to
+                storage_factory.
         """
+        vector_storage_factory = vector_storage_factory or storage_factory
         self.directory = abspath(directory)
+        self.storage_factory = storage_factory
+        self.vector_storage_factory = vector_storage_factory
         self.frames = storage_factory(join(self.directory, "frames"))
         self.frame_level = storage_factory(join(self.directory, "frame_level"))
-        self.video_level = storage_factory(join(self.directory, "video_level"))
-        self.signature = storage_factory(join(self.directory, "video_signatures"))
+        self.video_level = vector_storage_factory(
+            join(self.directory, "video_level"))
+        self.signature = vector_storage_factory(
+            join(self.directory, "video_signatures"))
 
     def __repr__(self):
         return f"ReprStorage('{self.directory}')"
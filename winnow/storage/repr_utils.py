@@ -1,6 +1,14 @@
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import logging
+from typing import Dict
+
+import numpy as np
+from dataclasses import dataclass, field
+
+from winnow.storage.chunk_writer import BufferedChunkWriter
 
 logger = logging.getLogger()
 logger.setLevel(logging.ERROR)
@@ -32,7 +40,88 @@ def path_resolver(source_root):
     return storepath
 
 
-def bulk_read(store, select=None):
+# Default number of concurrent reads performed by bulk read
+DEFAULT_READ_THREADS = 8
+
+
+@dataclass
+class BulkReadReport:
+    """Summary of a bulk read operation."""
+    loaded: int = 0  # number of successfully loaded representations
+    # mapping storage key => error message
+    errors: Dict = field(default_factory=dict)
+
+    @property
+    def failed(self):
+        """Number of representations that could not be loaded."""
+        return len(self.errors)
+
+    def log(self):
+        """Write the summary to the log."""
+        if self.errors:
+            total = self.loaded + self.failed
+            logger.error(f"Failed to read {self.failed} of {total} "
+                         f"representations")
+            for key, error in self.errors.items():
+                logger.error(f"Error processing file:{key}: {error}")
+
+
+def bulk_read_iter(store, select=None, threads=DEFAULT_READ_THREADS,
+                   prefetch=None, report=None, progress=None):
+    """Concurrently read representations for the given storage keys.
+
+    Reads are performed by a thread pool. At most prefetch reads are
+    in-flight at any moment, so only a bounded number of loaded values
+    is kept in memory when the consumer is slower than the storage.
+    Keys that could not be loaded are skipped and recorded in the report.
+
+    Args:
+        store: Representation store for a single representation type (e.g.
+            LMBDBReprStorage)
+        select: Iterable over storage keys. If None, all the entries from the
+            store are loaded.
+        threads (int): Number of reader threads.
+        prefetch (int): Maximal number of in-flight reads (default is twice
+            the number of threads).
+        report (BulkReadReport): Optional report to collect read errors.
+        progress: Optional progress bar (e.g. tqdm) updated after each key.
+
+    Yields:
+        (key, value) pairs in the order of the requested keys.
+    """
+    keys = store.list() if select is None else select
+    report = report or BulkReadReport()
+    prefetch = prefetch or 2 * threads
+
+    def read(key):
+        try:
+            return store.read(key), None
+        except Exception as error:
+            return None, error
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = deque()
+        keys = iter(keys)
+        while True:
+            for key in keys:
+                pending.append((key, executor.submit(read, key)))
+                if len(pending) >= prefetch:
+                    break
+            if not pending:
+                break
+            key, future = pending.popleft()
+            value, error = future.result()
+            if progress is not None:
+                progress.update(1)
+            if error is not None:
+                report.errors[key] = str(error)
+                continue
+            report.loaded += 1
+            yield key, value
+
+
+def bulk_read(store, select=None, threads=DEFAULT_READ_THREADS, report=None,
+              progress=None):
     """Read representations for the given storage keys.
 
     If select is None, all the entries from the provided representation store are loaded.
@@ -40,31 +129,138 @@ def bulk_read(store, select=None):
     Args:
         store: Representation store for a single representation type (e.g. LMBDBReprStorage)
         select: Iterable over storage keys.
+        threads (int): Number of reader threads.
+        report (BulkReadReport): Optional report to collect read errors.
+        progress: Optional progress bar (e.g. tqdm) updated after each key.
 
     Returns:
         Dictionary mapping storage keys to the loaded representation value.
     """
-    keys = select or store.list()
+    own_report = report is None
+    report = report or BulkReadReport()
+    loaded_mapping = dict(bulk_read_iter(
+        store, select, threads=threads, report=report, progress=progress))
+    if own_report:
+        report.log()
+    return loaded_mapping
 
-    loaded_mapping = dict()
 
-    for key in keys:
+def bulk_read_matrix(store, select=None):
+    """Read fixed-width representations as a single matrix.
 
-        try:
-            loaded_mapping[key] = store.read(key)
-        except Exception as e:
-            logger.error(f'Error processing file:{key}')
-            logger.error(e)
+    Storage types which keep all values in a single matrix (e.g.
+    MatrixReprStorage) return it without loading each value separately.
 
-    return loaded_mapping
+    Args:
+        store: Representation store for a single representation type (e.g.
+            MatrixReprStorage)
+        select: Iterable over storage keys.
+
+    Returns:
+        Tuple (keys, matrix) where i-th matrix row holds representation for
+        the i-th key.
+    """
+    if hasattr(store, "read_matrix"):
+        return store.read_matrix(select)
+    loaded_mapping = bulk_read(store, select)
+    return list(loaded_mapping.keys()), np.array(list(loaded_mapping.values()))
+
+
+def bulk_read_derived(source, derived, derive, save=True):
+    """Read representations derived from the source ones.
+
+    Only the missing derived values are computed.
+
+    Derived values (e.g. signatures calculated from video-level features) are
+    reused if they were saved with exactly the same key as the source value.
+    The key includes the file hash and the pipeline configuration tag, so the
+    derived values of modified files or of the previous pipeline configurations
+    are never reused.
+
+    Args:
+        source: Representation store of the source values (e.g. video-level
+            features).
+        derived: Representation store of the derived values (e.g.
+            signatures).
+        derive: Function mapping matrix of the source values to matrix of the
+            derived values.
+        save (bool): Save the computed values to the derived store.
+
+    Returns:
+        Tuple (keys, matrix) where i-th matrix row holds derived value for
+        the i-th source key.
+    """
+    keys = list(source.list())
+    exist = derived.exists_many(keys)
+    cached = [key for key, exists in zip(keys, exist) if exists]
+    cached_keys, cached_values = [], None
+    if cached:
+        cached_keys, cached_values = bulk_read_matrix(derived, cached)
+    loaded = set(cached_keys)
+    missing = [key for key in keys if key not in loaded]
+    logger.info(f"Reusing {len(cached_keys)} derived representations, "
+                f"computing {len(missing)}")
+    if not missing:
+        return cached_keys, cached_values
+    missing_keys, source_values = bulk_read_matrix(source, missing)
+    computed = np.asarray(derive(source_values))
+    if save:
+        bulk_write(derived, zip(missing_keys, computed))
+    if not cached_keys:
+        return missing_keys, computed
+    return (list(cached_keys) + list(missing_keys),
+            np.concatenate((cached_values, computed)))
 
 
 def bulk_write(store, entries):
     """Write multiple entries to the representation store.
 
+    Storage types supporting batched writes (write_many) group the entries
+    into shared transactions.
+
     Args:
         store: Representation store for a single representation type (e.g. PathReprStorage managing frame features).
-        entries: A dictionary mapping multiple ReprKey => value.
+        entries: A dictionary mapping multiple ReprKey => value or an
+            iterable over (key, value) pairs.
     """
-    for key, value in entries.items():
+    if hasattr(entries, "items"):
+        entries = entries.items()
+    if hasattr(store, "write_many"):
+        store.write_many(entries)
+        return
+    for key, value in entries:
         store.write(key, value)
+
+
+def chunk_writer(store, key):
+    """Open incremental writer of a representation value.
+
+    Storage types supporting chunked writes (open_chunked) save chunks as
+    soon as they arrive, others collect chunks in memory.
+
+    Returns:
+        Writer object with append(values), close() and discard() methods.
+    """
+    if hasattr(store, "open_chunked"):
+        return store.open_chunked(key)
+    return BufferedChunkWriter(store, key)
+
+
+def write_chunks(store, key, chunks):
+    """Write representation value consisting of multiple chunks of rows.
+
+    Args:
+        store: Representation store for a single representation type (e.g.
+            LMDBReprStorage).
+        key: Representation storage key.
+        chunks: Iterable over arrays of rows (e.g. frame-level features of
+            video fragments).
+    """
+    writer = chunk_writer(store, key)
+    try:
+        for chunk in chunks:
+            writer.append(chunk)
+    except Exception:
+        writer.discard()
+        raise
+    writer.close()
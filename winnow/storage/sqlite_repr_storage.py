@@ -1,5 +1,6 @@
 import logging
 import os
+from itertools import islice
 from uuid import uuid4 as uuid
 
 import numpy as np
@@ -7,7 +8,8 @@ from sqlalchemy import Column, String, Integer
 from sqlalchemy.ext.declarative import declarative_base
 
 from db import Database
-from winnow.storage.repr_key import ReprKey
+from winnow.storage.lmdb_repr_storage import DEFAULT_COMMIT_INTERVAL
+from winnow.storage.repr_key import ReprKey, in_partition
 
 # Logger used in representation-storage module
 logger = logging.getLogger(__name__)
@@ -101,6 +103,35 @@ class SQLiteReprStorage:
             feature_file_path = os.path.join(self.directory, record.feature_file_path)
             self._save(feature_file_path, value)
 
+    def exists_many(self, keys):
+        """Check if the representations exist using a single session.
+
+        Returns:
+            List of booleans in the order of the given keys.
+        """
+        with self.database.session_scope() as session:
+            return [self._exists(session, key) for key in keys]
+
+    def write_many(self, entries, commit_interval=DEFAULT_COMMIT_INTERVAL):
+        """Write multiple representations with batched transactions.
+
+        Args:
+            entries: Iterable over (key, value) pairs.
+            commit_interval (int): Number of writes committed at once.
+        """
+        entries = iter(entries)
+        while True:
+            chunk = list(islice(entries, commit_interval))
+            if not chunk:
+                break
+            with self.database.session_scope() as session:
+                for key, value in chunk:
+                    record = self._get_or_create(session, key.path)
+                    record.hash = key.hash
+                    record.tag = key.tag
+                    self._save(os.path.join(
+                        self.directory, record.feature_file_path), value)
+
     def delete(self, path):
         """Delete representation for the file."""
         with self.database.session_scope() as session:
@@ -111,10 +142,29 @@ class SQLiteReprStorage:
             os.remove(feature_file_path)
             session.delete(record)
 
-    def list(self):
-        """Iterate over all storage keys."""
+    def list(self, prefix=None, partition=None, check=False):
+        """Iterate over all storage keys.
+
+        Args:
+            prefix (String): List only paths starting with the prefix.
+            partition (Tuple[int,int]): List only paths of the partition
+                (index, count).
+            check (bool): Skip keys without representation file.
+        """
         with self.database.session_scope() as session:
-            for record in session.query(FeatureFile):
+            query = session.query(FeatureFile)
+            if prefix:
+                query = query.filter(FeatureFile.source_path.startswith(
+                    prefix, autoescape=True))
+            for record in query:
+                if not in_partition(record.source_path, partition):
+                    continue
+                feature_file_path = os.path.join(
+                    self.directory, record.feature_file_path)
+                if check and not os.path.exists(feature_file_path):
+                    logger.warning(f"Representation file is missing: "
+                                   f"{record.source_path}")
+                    continue
                 yield record.to_key()
 
     # Private methods
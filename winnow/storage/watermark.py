@@ -0,0 +1,69 @@
+import logging
+import os
+from os.path import abspath, exists, join
+
+import lmdb
+
+from winnow.storage.lmdb_repr_storage import Metadata
+from winnow.storage.repr_key import ReprKey
+
+# Logger used in representation-storage module
+logger = logging.getLogger(__name__)
+
+# String encoding used in watermark keys
+_KEY_ENCODING = "utf-8"
+
+
+class Watermark:
+    """Persistent record of storage keys already processed by a pipeline stage.
+
+    For each dataset file path the watermark remembers the file hash and
+    configuration tag at the time the file was processed. A key is
+    considered new if its path was never processed or if its hash or tag
+    has changed since then.
+    """
+
+    def __init__(self, directory):
+        """Create a new Watermark instance.
+
+        Args:
+            directory (String): A directory in which the watermark will be
+                stored.
+        """
+        self.directory = abspath(directory)
+        if not exists(self.directory):
+            logger.info("Creating watermark directory: %s", self.directory)
+            os.makedirs(self.directory)
+        self._storage = lmdb.open(join(self.directory, "watermark.lmdb"))
+
+    def is_processed(self, key: ReprKey):
+        """Check if the key is already processed."""
+        with self._storage.begin(write=False) as txn:
+            return self._is_processed(key, txn)
+
+    def new_keys(self, keys):
+        """Get keys that are not processed yet preserving their order."""
+        with self._storage.begin(write=False) as txn:
+            return [key for key in keys if not self._is_processed(key, txn)]
+
+    def update(self, keys):
+        """Mark keys as processed."""
+        with self._storage.begin(write=True) as txn:
+            for key in keys:
+                txn.put(key.path.encode(_KEY_ENCODING),
+                        Metadata.from_key(key).dump())
+
+    def reset(self):
+        """Forget all processed keys."""
+        with self._storage.begin(write=True) as txn:
+            txn.drop(self._storage.open_db(txn=txn), delete=False)
+
+    def __len__(self):
+        return self._storage.stat()["entries"]
+
+    @staticmethod
+    def _is_processed(key: ReprKey, txn):
+        """Check if the key is processed using the given transaction."""
+        serialized = txn.get(key.path.encode(_KEY_ENCODING))
+        return (serialized is not None and
+                Metadata.load(serialized) == Metadata.from_key(key))
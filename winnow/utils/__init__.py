@@ -1,3 +1,4 @@
 from .utils import *
+from .scanner import *
 from .scene_detection import *
 from .metadata_extraction import *
\ No newline at end of file
@@ -1,24 +1,34 @@
+import itertools
 import logging
 import math
 import os
 import shlex
 import subprocess
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timezone
 
 import cv2
-import numpy as np
 import pandas as pd
 from pandas import json_normalize
 
 logger = logging.getLogger(__name__)
 
 
-def findVideoMetada_mediainfo(pathToInputVideo):
+# Default number of concurrently running mediainfo processes
+DEFAULT_MEDIAINFO_WORKERS = 8
+
+# Default maximal time (in seconds) of a single mediainfo run
+DEFAULT_MEDIAINFO_TIMEOUT = 60
+
+
+def findVideoMetada_mediainfo(pathToInputVideo, timeout=None):
     """Assumes the mediainfo cli is installed and runs it on the input video
 
     Args:
         pathToInputVideo ([String]): Path to input video
+        timeout ([float]): Maximal time in seconds (the process is killed
+            when the time is exceeded)
 
     Returns:
         [String]: Text output from runnning the mediainfo command
@@ -26,7 +36,8 @@ def findVideoMetada_mediainfo(pathToInputVideo):
     mi = "mediainfo -f --Language=raw"
     cmd = "{} {}".format(mi, shlex.quote(pathToInputVideo))
     args = shlex.split(cmd)
-    mediaInfo_output = subprocess.check_output(args).decode('utf-8')
+    output = subprocess.check_output(args, timeout=timeout)
+    mediaInfo_output = output.decode('utf-8')
     return mediaInfo_output
 
 
@@ -56,18 +67,10 @@ def get_duration(fp):
     duration = frame_count/fps
 
     if duration < 0:
+        # Count frames without decoding them
         count = 0
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if isinstance(frame, np.ndarray):
-                try:
-                    if int(count % round(fps)) == 0:
-                        count += 1
-                except Exception as exc:
-                    logging.error("Problems processing file '%s': %s", fp, exc)
-
-            else:
-                break
+        while cap.grab():
+            count += 1
 
         duration = count / fps
 
@@ -89,33 +92,72 @@ def normalize_duration(metadata, file_path):
     return metadata
 
 
-def extract_from_list_of_videos(video_files):
+def extract_metadata(file_path, timeout=None):
+    """Extract mediainfo metadata of a single video file.
+
+    Args:
+        file_path (String): Path to video file
+        timeout ([float]): Maximal time in seconds of the mediainfo run
+
+    Returns:
+        Dictionary with mediainfo output sections. Only the file name is
+        returned if the metadata cannot be extracted.
+    """
+    try:
+        raw_metadata = findVideoMetada_mediainfo(file_path, timeout=timeout)
+        metadata = process_media_info(raw_metadata)
+        return normalize_duration(metadata, file_path)
+    except Exception as exc:
+        logging.info("Problems processing file '%s': %s", file_path, exc)
+        return {
+            "General": {
+                "FileName": os.path.basename(file_path)
+            }
+        }
+
+
+def iter_metadata(video_files, workers=DEFAULT_MEDIAINFO_WORKERS,
+                  timeout=DEFAULT_MEDIAINFO_TIMEOUT):
+    """Extract metadata of multiple video files concurrently.
+
+    At most `workers` mediainfo processes are running at the same time and
+    each of them is killed if it takes longer than `timeout` seconds. The
+    results are produced as soon as they are ready, so the caller may save
+    them while the remaining files are being processed.
+
+    Args:
+        video_files ([List[Strings]]): Iterable over file paths to video files
+        workers (int): Number of concurrently running mediainfo processes
+        timeout ([float]): Maximal time in seconds of a single mediainfo run
+
+    Yields:
+        (file_path, metadata) pairs in the order of completion
+    """
+    files = iter(video_files)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Bound the number of scheduled files
+        pending = {executor.submit(extract_metadata, path, timeout): path
+                   for path in itertools.islice(files, 2 * workers)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+            for path in itertools.islice(files, len(done)):
+                future = executor.submit(extract_metadata, path, timeout)
+                pending[future] = path
+
+
+def extract_from_list_of_videos(video_files, workers=1, timeout=None):
     """ Processes a list of video files and returns a list of dicts containing the mediainfo output for each file
 
     Args:
         video_files ([List[Strings]]): List of file paths to video files
+        workers (int): Number of concurrently running mediainfo processes
+        timeout ([float]): Maximal time in seconds of a single mediainfo run
     """
-
-    video_metadata = []
-    for file_path in video_files:
-
-        try:
-            raw_metadata = findVideoMetada_mediainfo(file_path)
-            metadata = process_media_info(raw_metadata)
-            metadata = normalize_duration(metadata, file_path)
-            video_metadata.append(metadata)
-        except Exception as exc:
-
-            logging.info("Problems processing file '%s': %s", file_path, exc)
-            video_metadata.append(
-                                {
-                                    "General": {
-                                        "FileName": os.path.basename(file_path)
-                                                }
-                                }
-                                )
-
-    return video_metadata
+    video_metadata = dict(iter_metadata(
+        video_files, workers=workers, timeout=timeout))
+    return [video_metadata[file_path] for file_path in video_files]
 
 
 def convert_to_df(video_metadata):
@@ -0,0 +1,88 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from dataclasses import dataclass
+
+from winnow.storage.hash_cache import FileStat
+
+# Number of directories scanned concurrently
+DEFAULT_SCAN_THREADS = 8
+
+
+@dataclass
+class ScannedFile:
+    """File found by the scanner."""
+    path: str
+    stat: FileStat = None  # file attributes (collected only on request)
+
+
+def iter_files(root, extensions=(), threads=DEFAULT_SCAN_THREADS, stat=False):
+    """Recursively scan the directory producing files as soon as found.
+
+    Directories are listed concurrently with os.scandir and files are filtered
+    by the directory entry name, so no additional system calls are made per
+    file unless file attributes are requested. As with the recursive glob,
+    hidden files and directories (starting with '.') are skipped.
+
+    Args:
+        root (String): Root path of the directory to be scanned.
+        extensions: Filter files by giving a list of supported file extensions
+            (eg a list of video extensions). Empty list means all files.
+        threads (int): Number of directories scanned concurrently.
+        stat (bool): Collect file attributes used by the hash cache.
+
+    Yields:
+        ScannedFile for each found file in no particular order.
+    """
+    suffixes = tuple(f".{ext}" for ext in extensions)
+    visited = {os.path.realpath(root)}
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        pending = {executor.submit(_scan_directory, root, suffixes, stat)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, directories = future.result()
+                yield from files
+                for directory in directories:
+                    # Don't traverse the same directory twice (e.g. symlink
+                    # loops)
+                    real_path = os.path.realpath(directory)
+                    if real_path not in visited:
+                        visited.add(real_path)
+                        pending.add(executor.submit(
+                            _scan_directory, directory, suffixes, stat))
+
+
+def _scan_directory(directory, suffixes, stat):
+    """List files and subdirectories of a single directory."""
+    files, directories = [], []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_dir():
+                        directories.append(entry.path)
+                    elif entry.is_file() and _selected(entry.name, suffixes):
+                        file_stat = _entry_stat(entry) if stat else None
+                        files.append(ScannedFile(entry.path, file_stat))
+                except OSError:
+                    # Entry was removed or is a broken symlink
+                    continue
+    except OSError:
+        # Directory was removed or is not readable
+        pass
+    return files, directories
+
+
+def _selected(name, suffixes):
+    """Check if the file name has one of the suffixes (any if empty)."""
+    return not suffixes or os.path.splitext(name)[1] in suffixes
+
+
+def _entry_stat(entry):
+    """Get file attributes of the directory entry."""
+    stat = entry.stat()
+    return FileStat(size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                    inode=stat.st_ino)
@@ -1,21 +1,55 @@
 import datetime
+import os
 from typing import List, Tuple
 
 import matplotlib.pyplot as plt
 import numpy as np
+import pandas as pd
 from dataclasses import dataclass
-from scipy.spatial.distance import cosine
 
 
 def cosine_series(arr):
-    output = [1.0]
-    for i in range(len(arr)):
-        if i < len(arr)-1:
-            a = arr[i]
-            b = arr[i+1]
-            dist = cosine(a, b)
-            output.append(dist)
-    return np.array(output)
+    """Get cosine distances between adjacent frames.
+
+    The distances are calculated for all frames at once with row-wise dot
+    products and match scipy.spatial.distance.cosine up to floating point
+    rounding (including NaNs for blank frames).
+
+    Args:
+        arr: Frame features (one frame per row).
+
+    Returns:
+        Array of distances where i-th value is the distance between frames i-1
+        and i. The first value is always 1.0.
+    """
+    arr = np.asarray(arr)
+    if len(arr) < 2:
+        return np.ones(1)
+    squares = np.einsum('ij,ij->i', arr, arr)
+    products = np.einsum('ij,ij->i', arr[:-1], arr[1:])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = products / np.sqrt(squares[:-1] * squares[1:])
+    distances = np.clip(1.0 - ratio.astype(np.float64), 0.0, 2.0)
+    return np.concatenate(([1.0], distances))
+
+
+def scene_durations(frame_features):
+    """Get scene durations of a single video.
+
+    A new scene starts at each frame which distance from the previous frame is
+    both in the top 10% of the video and greater than 0.05. The last scene
+    ends at the last frame.
+
+    Args:
+        frame_features: Frame-level features of the video.
+
+    Returns:
+        Array of scene durations (in frames).
+    """
+    diffs = cosine_series(frame_features)
+    starts = np.flatnonzero((diffs > np.quantile(diffs, .90)) & (diffs > 0.05))
+    ends = np.append(starts[1:], len(diffs) - 1)
+    return ends - starts
 
 
 def visualize_frames(fp, diffs=None):
@@ -64,21 +98,11 @@ def get_duration(scenes):
 
 def seconds_to_time(list_of_durations):
 
-    results = []
-    for i, n in enumerate(list_of_durations):
-
-        n = int(n)
-
-        if i == 0:
-            start_time = datetime.timedelta(seconds=0)
-            end_time = datetime.timedelta(seconds=n)
-        else:
-            start_time = end_time
-            end_time = start_time + datetime.timedelta(seconds=n)
-
-        results.append((str(start_time), str(end_time)))
-
-    return results
+    ends = np.cumsum(np.asarray(list_of_durations, dtype=np.int64))
+    starts = ends - np.asarray(list_of_durations, dtype=np.int64)
+    return [(str(datetime.timedelta(seconds=int(start))),
+             str(datetime.timedelta(seconds=int(end))))
+            for start, end in zip(starts, ends)]
 
 
 @dataclass
@@ -111,63 +135,109 @@ class SceneExtractionResults:
     total_video_duration_timestamp: List[datetime.timedelta] = None
 
 
-def extract_scenes(frame_features_dict, minimum_duration=10):
-    """
-
-    Extracts scenes from a list of files
+def iter_scenes(frame_features, minimum_duration=10):
+    """Detect scenes of multiple videos one by one.
 
     Args:
-        frame_features_dict (dict): A dictionary mapping original file
-        (path,hash) to its frame-level features.
+        frame_features: A dictionary or an iterable of (key, features) pairs
+        mapping original file (path,hash) to its frame-level features. The
+        features are processed one by one and are not retained, so the pairs
+        may be streamed (e.g. by winnow.storage.repr_utils.bulk_read_iter).
 
     Keyword Args:
         minimum_duration (int): Minimum duration of video in seconds.
         (default: {10})
 
+    Yields:
+        (key, scene durations, video duration) tuples in the order of the
+        input videos. Videos shorter than the minimum duration are skipped.
+    """
+    if hasattr(frame_features, "items"):
+        frame_features = frame_features.items()
+
+    # Scene detection is vectorized, so the videos are processed in-process
+    # without copying their features to worker processes
+    for key, features in frame_features:
+        if features.shape[0] > minimum_duration:
+            yield key, scene_durations(features), features.shape[0]
+
+
+def collect_scenes(detected):
+    """Collect scene extraction results.
+
+    Args:
+        detected: Iterable of (key, scene durations, video duration) tuples
+        (e.g. produced by iter_scenes).
+
     Returns:
         SceneExtractionResults: Data structure containing complete scene
         extraction results.
     """
-    # Filter videos by duration
-    filtered_dict = {key: feature
-                     for key, feature in frame_features_dict.items()
-                     if feature.shape[0] > minimum_duration}
-
-    # Unpack names, hashes and features as separate lists
-    assert len(filtered_dict) > 0, 'Frame level features not found.'
-    keys, features = zip(*filtered_dict.items())
-    paths = [key.path for key in keys]
-    hashes = [key.hash for key in keys]
-
-    raw_scenes = [cosine_series(frame_features) for frame_features in features]
-    scene_ident = [((diffs > np.quantile(diffs, .90)) &
-                    (diffs > 0.05)) for diffs in raw_scenes]
-
-    video_scenes = []
-    for sid in scene_ident:
-        idxs = np.array(list(range(len(sid))))[sid]
-        scenes = []
-        for z, i in enumerate(idxs):
-            start = i
-            if z == (len(idxs) - 1):
-                end = len(sid) - 1
-            else:
-                end = idxs[z + 1]
-            scenes.append([start, end])
-        video_scenes.append(scenes)
+    keys, durations, video_durations = (), (), ()
+    if detected:
+        keys, durations, video_durations = zip(*detected)
 
     results = SceneExtractionResults()
-    results.video_filename = paths
-    results.video_sha256 = hashes
-    results.scene_duration_seconds = [get_duration(x) for x in video_scenes]
+    results.video_filename = [key.path for key in keys]
+    results.video_sha256 = [key.hash for key in keys]
+    results.scene_duration_seconds = [list(map(int, x)) for x in durations]
     results.scenes_timestamp = [seconds_to_time(d)
                                 for d in results.scene_duration_seconds]
-    results.num_scenes = [len(x) for x in video_scenes]
-    results.avg_duration_seconds = [np.mean(x)
-                                    for x in results.scene_duration_seconds]
-    results.video_duration_seconds = [sid.shape[0] for sid in scene_ident]
+    results.num_scenes = [len(x) for x in durations]
+    results.avg_duration_seconds = [np.mean(x) for x in durations]
+    results.video_duration_seconds = list(video_durations)
     results.total_video_duration_timestamp = [
                                     datetime.timedelta(seconds=x)
                                     for x in results.video_duration_seconds]
 
     return results
+
+
+def extract_scenes(frame_features, minimum_duration=10):
+    """
+
+    Extracts scenes from a list of files
+
+    Args:
+        frame_features: A dictionary or an iterable of (key, features) pairs
+        mapping original file (path,hash) to its frame-level features (see
+        iter_scenes).
+
+    Keyword Args:
+        minimum_duration (int): Minimum duration of video in seconds.
+        (default: {10})
+
+    Returns:
+        SceneExtractionResults: Data structure containing complete scene
+        extraction results.
+    """
+    detected = list(iter_scenes(frame_features,
+                                minimum_duration=minimum_duration))
+
+    # Unpack names and hashes as separate lists
+    assert len(detected) > 0, 'Frame level features not found.'
+    return collect_scenes(detected)
+
+
+def drop_saved_scenes(report_path, video_paths):
+    """Remove scenes of the given videos from the saved scene report.
+
+    Scenes of the modified videos (same path, different hash) must be
+    removed before the new ones are appended, so that the report has a
+    single set of scenes for each video path.
+
+    Args:
+        report_path (String): Path to the scene metadata csv-file.
+        video_paths: Paths of the videos which scenes must be removed.
+
+    Returns:
+        Number of the remaining rows.
+    """
+    scenes = pd.read_csv(report_path, index_col=0, keep_default_na=False,
+                         dtype={"video_filename": str, "video_sha256": str})
+    kept = scenes.loc[~scenes["video_filename"].isin(set(video_paths))]
+    if len(kept) < len(scenes):
+        temp_path = f"{report_path}.tmp"
+        kept.reset_index(drop=True).to_csv(temp_path)
+        os.replace(temp_path, report_path)
+    return len(kept)
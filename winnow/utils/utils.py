@@ -1,6 +1,7 @@
 import hashlib
 import json
 import os
+from functools import lru_cache
 from glob import glob
 from pathlib import Path
 
@@ -10,8 +11,11 @@ from joblib import load
 
 from winnow.config import Config
 from winnow.config.path import resolve_config_path
+from winnow.storage.hash_cache import (
+    HashCache, compute_hash, DEFAULT_BUFFER_SIZE)
 from winnow.storage.repr_key import ReprKey
-from winnow.storage.repr_utils import path_resolver
+from winnow.storage.repr_utils import path_resolver, bulk_read_matrix
+from winnow.utils.scanner import iter_files
 
 DEFAULT_DIRECTORY = os.path.join(os.path.dirname(__file__), "models")
 GRAY_ESTIMATION_MODEL = os.path.join(DEFAULT_DIRECTORY, "gb_gray_model.joblib")
@@ -46,6 +50,9 @@ def scan_videos(path, wildcard, extensions=[]):
         List[String]: A list of file paths
     """
 
+    if wildcard == '**':
+        return sorted(scanned.path for scanned in iter_files(path, extensions))
+
     files = glob(os.path.join(path, wildcard), recursive=True)
     files = [x for x in files if os.path.isfile(x)]
     if len(extensions) > 0:
@@ -87,6 +94,7 @@ def uniq(row):
     return ''.join([str(x) for x in sorted([row['query'], row['match']])])
 
 
+@lru_cache(maxsize=None)
 def load_gray_estimation_model():
     """
      Loads pretrained gray_max estimation model. This model has been trained
@@ -118,6 +126,28 @@ def get_brightness_estimation(reps, repr_key):
     return estimates
 
 
+def get_brightness_estimations(reps, repr_keys=None):
+    """
+    Estimate brightness of multiple videos with a single model prediction.
+
+    Args:
+        reps (winnow.storage.repr_storage.ReprStorage): Intermediate
+            representation storage.
+        repr_keys: Iterable over representation storage keys (default
+            is all videos having video-level features).
+
+    Returns:
+        Tuple (keys, estimates) where i-th estimate is the gray_max of the
+        video with the i-th key. Videos which features cannot be read are
+        omitted.
+    """
+    keys, vl_features = bulk_read_matrix(reps.video_level, repr_keys)
+    if len(keys) == 0:
+        return [], np.array([])
+    vl_features = np.nan_to_num(vl_features.reshape(len(keys), -1))
+    return keys, get_gray_max(vl_features)
+
+
 def extract_additional_info(reps, repr_key):
     """
     Extract file metadata.
@@ -158,17 +188,21 @@ def extract_additional_info(reps, repr_key):
             grays_std,
             grays_max)
 
-def get_hash(fp, buffer_size=65536):
 
-    sha256 = hashlib.sha256()
-    with open(fp, 'rb') as f:
-        while True:
-            data = f.read(buffer_size)
-            if not data:
-                break
-            sha256.update(data)
+def get_hash(fp, buffer_size=DEFAULT_BUFFER_SIZE):
+
+    return compute_hash(fp, buffer_size)
+
+
+def default_hash_cache(config):
+    """Get persistent file hash cache.
 
-    return sha256.hexdigest()
+    The cache is saved in the intermediate representations directory.
+
+    Args:
+        config (winnow.config.Config): Pipeline configuration.
+    """
+    return HashCache(os.path.join(config.repr.directory, "hash_cache"))
 
 
 def resolve_config(config_path=None, frame_sampling=None, save_frames=None):
@@ -198,21 +232,30 @@ def get_config_tag(config):
     return sha256.hexdigest()[:40]
 
 
-def reprkey_resolver(config):
+def reprkey_resolver(config, hash_cache=None):
     """Create a function to get intermediate storage key and tags by the file path.
 
+    File hashes are taken from the persistent hash cache, so that only new or
+    modified files are read. Use HashCache.hash_many to hash multiple files
+    concurrently before resolving their keys.
+
     Args:
         config (winnow.config.Config): Pipeline configuration.
+        hash_cache (winnow.storage.hash_cache.HashCache): File hash cache
+            (default is the cache in the intermediate representations
+            directory).
     """
 
     storepath = path_resolver(config.sources.root)
     config_tag = get_config_tag(config)
+    if hash_cache is None:
+        hash_cache = default_hash_cache(config)
 
     def reprkey(path):
         """Get intermediate representation storage key."""
         return ReprKey(
             path=storepath(path),
-            hash=get_hash(path),
+            hash=hash_cache.hash(path),
             tag=config_tag)
 
     return reprkey
\ No newline at end of file